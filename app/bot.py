@@ -1,30 +1,62 @@
 import asyncio
 import logging
+import multiprocessing
+import os
 
 from pathlib import Path
 import shutil
+import signal
 import sys
+import time
+from typing import Optional
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from aiogram.webhook.aiohttp_server import (
-    SimpleRequestHandler,
-    setup_application,
-)
+from aiogram.webhook.aiohttp_server import setup_application
 from aiogram.types import FSInputFile
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import BaseStorage
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiohttp import web
 from pydantic import ValidationError
 
 from app.env_settings import Settings
+from app.webhook import BackgroundRequestHandler
+from app.fsm_storage import create_storage
 
-from app.handlers import nst_router, common_router, cyclegan_router
+from app.handlers import admin_router, nst_router, common_router, cyclegan_router
 
-from app.nst_engine import NSTEngine
 from app.nst_config import nst_params
-
-from app.cyclegan_engine import CycleGANEngine
 from app.cyclegan_config import cyclegan_params
+from app.engine_loader import ENGINE_KEYS, EngineLoader, EngineWarmupMiddleware
+from app.engines import (
+    attach_timing_model,
+    attach_worker_pool,
+    load_cyclegan_engine,
+    load_nst_engine,
+    shutdown_worker_pools,
+)
+from app.loop_monitor import LoopLagMonitor
+from app.metrics import (
+    register_cache_metrics,
+    register_executor_metrics,
+    register_loop_monitor_metrics,
+    register_queue_depth,
+    start_metrics_server,
+)
+from app.result_cache import ResultCache
+from app.timing import DurationModel, TimingStore
+from app.tracing import TracingMiddleware, configure_tracing
+from app.profiling import configure_profiler
+from app.sampling_profiler import StackSampler
+from app.photo_cache import BoundedCache
+from app.job_store import JOB_KIND_CYCLEGAN, JOB_KIND_NST, JobStore
+from app.jobs import maintain_jobs
+from app.inference_client import (
+    InferenceClient,
+    RemoteNSTEngine,
+    RemoteCycleGANEngine,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -34,10 +66,14 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def cleanup_temp_directory(path: Path) -> None:
+def cleanup_temp_directory(path: Path, keep: Optional[set[Path]] = None) -> None:
     logger.info(f"Cleaning temporary directory: {path}")
     path.mkdir(parents=True, exist_ok=True)
+    keep = keep or set()
     for item in path.iterdir():
+        if item.resolve() in keep:
+            logger.info(f"Keeping {item}: it is referenced by an unfinished job.")
+            continue
         try:
             if item.is_file() or item.is_symlink():
                 item.unlink()
@@ -48,18 +84,88 @@ def cleanup_temp_directory(path: Path) -> None:
             logger.error(f"Failed to delete {item}: {e}")
 
 
-async def on_startup(bot: Bot, dispatcher: Dispatcher):
+def cleanup_temp_images(job_store: Optional[JobStore]) -> None:
     logger.info("Performing startup cleanup...")
     try:
-        cleanup_temp_directory(nst_params.TEMP_IMAGE_DIR)
+        cleanup_temp_directory(
+            nst_params.TEMP_IMAGE_DIR,
+            keep=job_store.referenced_paths() if job_store else None,
+        )
     except Exception as e:
         logger.error(f"Error during cleanup: {e}", exc_info=True)
 
+
+def _is_primary_worker(dispatcher: Dispatcher) -> bool:
+    return dispatcher.workflow_data.get("worker_index") in (None, 0)
+
+
+# Startup work that waits for the engines, referenced so it is not collected
+_startup_tasks: set[asyncio.Task] = set()
+
+
+async def _maintain_jobs_when_ready(
+    bot: Bot, dispatcher: Dispatcher, job_store: JobStore, max_attempts: int
+) -> None:
+    engine_loader = dispatcher.workflow_data.get("engine_loader")
+    if engine_loader is not None:
+        await engine_loader.wait()
+    await maintain_jobs(
+        bot,
+        job_store,
+        engines={
+            JOB_KIND_NST: dispatcher.workflow_data.get("nst_engine"),
+            JOB_KIND_CYCLEGAN: dispatcher.workflow_data.get("cyclegan_engine"),
+        },
+        max_attempts=max_attempts,
+        # A lone process owns every job; a worker leaves live siblings' jobs alone
+        take_over=dispatcher.workflow_data.get("worker_index") is None,
+    )
+
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher):
+    job_store: Optional[JobStore] = dispatcher.workflow_data.get("job_store")
+    worker_index = dispatcher.workflow_data.get("worker_index")
+
+    # With several workers the supervisor cleans up once, before they start;
+    # a worker doing it here would delete files of requests in other workers.
+    if worker_index is None:
+        cleanup_temp_images(job_store)
+
+    loop_monitor = dispatcher.workflow_data.get("loop_monitor")
+    if loop_monitor is not None:
+        loop_monitor.start()
+
+    sampling_profiler = dispatcher.workflow_data.get("sampling_profiler")
+    if sampling_profiler is not None:
+        sampling_profiler.start()
+
+    engine_loader = dispatcher.workflow_data.get("engine_loader")
+    if engine_loader is not None:
+        engine_loader.start()
+
+    inference_client = dispatcher.workflow_data.get("inference_client")
+    if inference_client is not None:
+        await inference_client.start()
+        logger.info("Inference client started.")
+
     bot_info = await bot.get_me()
     logger.info(f"Bot @{bot_info.username} (ID: {bot_info.id}) started.")
 
     settings: Settings = dispatcher["settings"]
 
+    # Every worker resumes jobs whose owner died; leases keep them from
+    # taking jobs that are still running in a sibling.
+    if job_store is not None:
+        task = asyncio.create_task(
+            _maintain_jobs_when_ready(bot, dispatcher, job_store, settings.JOB_MAX_ATTEMPTS)
+        )
+        _startup_tasks.add(task)
+        task.add_done_callback(_startup_tasks.discard)
+
+    if not _is_primary_worker(dispatcher):
+        logger.info(f"Webhook worker {worker_index} started.")
+        return
+
     if settings.BOT_RUN_MODE == "webhook":
         if not settings.WEBHOOK_URL:
             logger.error("WEBHOOK_URL must be set in .env for webhook mode.")
@@ -74,7 +180,8 @@ async def on_startup(bot: Bot, dispatcher: Dispatcher):
 
         params_to_set_webhook = {
             "url": webhook_url,
-            "drop_pending_updates": True,
+            # A restarted worker must not drop updates meant for its siblings.
+            "drop_pending_updates": worker_index is None,
             "secret_token": secret,
         }
 
@@ -112,13 +219,51 @@ async def on_shutdown(bot: Bot, dispatcher: Dispatcher):
 
     settings: Settings = dispatcher["settings"]
 
-    if settings.BOT_RUN_MODE == "webhook":
+    # In multi-worker mode the webhook stays registered while workers restart.
+    if (
+        settings.BOT_RUN_MODE == "webhook"
+        and dispatcher.workflow_data.get("worker_index") is None
+    ):
         logger.info("Deleting webhook...")
         try:
             await bot.delete_webhook()
         except Exception as e:
             logger.error(f"Failed to delete webhook on shutdown: {e}", exc_info=True)
 
+    inference_client = dispatcher.workflow_data.get("inference_client")
+    if inference_client is not None:
+        logger.info("Closing inference client...")
+        await inference_client.close()
+
+    engine_loader = dispatcher.workflow_data.get("engine_loader")
+    if engine_loader is not None:
+        engine_loader.stop()
+
+    for task in list(_startup_tasks):
+        task.cancel()
+
+    shutdown_worker_pools(
+        dispatcher.workflow_data.get("nst_engine"),
+        dispatcher.workflow_data.get("cyclegan_engine"),
+    )
+
+    loop_monitor = dispatcher.workflow_data.get("loop_monitor")
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+
+    sampling_profiler = dispatcher.workflow_data.get("sampling_profiler")
+    if sampling_profiler is not None:
+        sampling_profiler.stop()
+
+    job_store = dispatcher.workflow_data.get("job_store")
+    if job_store is not None:
+        logger.info("Closing job store...")
+        job_store.close()
+
+    timing_store = dispatcher.workflow_data.get("timing_store")
+    if timing_store is not None:
+        timing_store.close()
+
     if dispatcher and dispatcher.storage:
         logger.info("Closing FSM storage...")
         await dispatcher.storage.close()
@@ -132,61 +277,223 @@ async def on_shutdown(bot: Bot, dispatcher: Dispatcher):
     logger.info("Bot stopped.")
 
 
+def _calibrate(settings: Settings, nst_engine, cyclegan_engine) -> tuple[int, int]:
+    """Applies the host calibration; returns the NST and CycleGAN worker counts."""
+    nst_workers, cyclegan_workers = settings.NST_WORKERS, settings.CYCLEGAN_WORKERS
+    if not settings.CALIBRATION_ENABLED or (nst_engine is None and cyclegan_engine is None):
+        return nst_workers, cyclegan_workers
+    from app.calibration import apply_calibration, calibrate_engines
+
+    try:
+        calibration = calibrate_engines(
+            nst_engine,
+            cyclegan_engine,
+            settings.CALIBRATION_CACHE_PATH,
+            target_seconds=settings.CALIBRATION_NST_TARGET_SECONDS,
+            image_sizes=settings.calibration_image_sizes,
+            max_workers=settings.CALIBRATION_MAX_WORKERS,
+        )
+    except Exception as e:
+        logger.error(f"Calibration failed, using the configured sizes: {e}", exc_info=True)
+        return nst_workers, cyclegan_workers
+    apply_calibration(calibration, nst_engine)
+    return (
+        calibration.nst_workers or nst_workers,
+        calibration.cyclegan_workers or cyclegan_workers,
+    )
+
+
+def _setup_local_engines(
+    dp: Dispatcher, settings: Settings, engines: Optional[dict] = None
+) -> None:
+    """Registers the engines' routers; the engines themselves are built in
+    the background once the dispatcher starts (see app.engine_loader)."""
+    engines = engines or {}
+    dp["timing_store"] = None
+    timing_model = None
+    if settings.TIMING_STORE_PATH:
+        dp["timing_store"] = TimingStore(settings.TIMING_STORE_PATH)
+        timing_model = DurationModel(
+            dp["timing_store"], min_samples=settings.TIMING_MIN_SAMPLES
+        )
+        logger.info(f"Job timing history enabled: {settings.TIMING_STORE_PATH}")
+
+    def with_history(kind: str, load):
+        # Fits the stored job timings in the loader thread, not on the event loop
+        def load_engine():
+            engine = load()
+            if engine is not None and timing_model is not None:
+                timing_model.load(kind)
+            return engine
+
+        return load_engine
+
+    loaders = {}
+    for kind, load, params, router in (
+        (JOB_KIND_NST, load_nst_engine, nst_params, nst_router),
+        (JOB_KIND_CYCLEGAN, load_cyclegan_engine, cyclegan_params, cyclegan_router),
+    ):
+        dp[ENGINE_KEYS[kind]] = None
+        if engines.get(kind) is not None:
+            loaders[kind] = with_history(kind, lambda engine=engines[kind]: engine)
+        elif params:
+            loaders[kind] = with_history(kind, load)
+        else:
+            continue
+        dp.include_router(router)
+
+    workers = {
+        JOB_KIND_NST: settings.NST_WORKERS,
+        JOB_KIND_CYCLEGAN: settings.CYCLEGAN_WORKERS,
+    }
+    scheduling = {
+        "policy": settings.SCHEDULER_POLICY,
+        "max_wait": settings.SCHEDULER_MAX_WAIT,
+        "deadline_factor": settings.SCHEDULER_DEADLINE_FACTOR,
+    }
+
+    def calibrate(loaded: dict) -> None:
+        # Runs in a loader thread once every engine is built
+        workers[JOB_KIND_NST], workers[JOB_KIND_CYCLEGAN] = _calibrate(
+            settings, loaded.get(JOB_KIND_NST), loaded.get(JOB_KIND_CYCLEGAN)
+        )
+
+    def publish(kind: str, engine) -> None:
+        if engine is None:
+            logger.warning(f"{kind} engine is not available, its requests are refused.")
+            return
+        attach_timing_model(timing_model, engine)
+        attach_worker_pool(engine, kind, workers[kind], **scheduling)
+        dp[ENGINE_KEYS[kind]] = engine
+        if settings.METRICS_ENABLED:
+            _register_metrics(dp)
+        logger.info(f"{kind} engine is ready.")
+
+    loader = EngineLoader(
+        loaders,
+        prepare=calibrate if settings.CALIBRATION_ENABLED else None,
+        expected_seconds=settings.ENGINE_WARMUP_ESTIMATE,
+    )
+    loader.on_ready(publish)
+    dp["engine_loader"] = loader
+    warmup = EngineWarmupMiddleware(loader)
+    dp.message.middleware(warmup)
+    dp.callback_query.middleware(warmup)
+
+
+def _setup_remote_engines(dp: Dispatcher, settings: Settings) -> None:
+    client = InferenceClient(
+        settings.inference_server_urls,
+        pool_size=settings.INFERENCE_POOL_SIZE,
+        timeout=settings.INFERENCE_TIMEOUT,
+        health_interval=settings.INFERENCE_HEALTH_INTERVAL,
+        use_shared_memory=settings.INFERENCE_USE_SHM,
+    )
+    dp["inference_client"] = client
+    dp["nst_engine"] = RemoteNSTEngine(client)
+    dp["cyclegan_engine"] = RemoteCycleGANEngine(client)
+    dp.include_router(nst_router)
+    dp.include_router(cyclegan_router)
+    logger.info(
+        f"Using remote inference servers: {', '.join(settings.inference_server_urls)}"
+    )
+
+
+def _register_metrics(dp: Dispatcher) -> None:
+    nst_engine = dp.workflow_data.get("nst_engine")
+    cyclegan_engine = dp.workflow_data.get("cyclegan_engine")
+    register_cache_metrics(
+        {
+            "result": dp["result_cache"],
+            "photo": dp["photo_cache"],
+            "nst_tensors": getattr(nst_engine, "tensor_cache", None),
+            "cyclegan_tensors": getattr(cyclegan_engine, "tensor_cache", None),
+        }
+    )
+    register_executor_metrics(
+        {JOB_KIND_NST: nst_engine, JOB_KIND_CYCLEGAN: cyclegan_engine}
+    )
+    register_loop_monitor_metrics(dp["loop_monitor"])
+
+
 def create_bot_and_dispatcher(
-    settings: Settings, storage: MemoryStorage
+    settings: Settings,
+    storage: BaseStorage,
+    worker_index: Optional[int] = None,
+    engines: Optional[dict] = None,
 ) -> tuple[Bot, Dispatcher]:
+    """``engines`` maps a job kind to an already built local engine
+    (benchmarks, load tests); missing ones are loaded from the configs."""
+    session = None
+    if settings.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
     bot = Bot(
         token=settings.TELEGRAM_BOT_TOKEN.get_secret_value(),
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
 
     dp = Dispatcher(storage=storage)
     dp["settings"] = settings
 
-    # NSTEngine initialization
-    dp["nst_engine"] = None
-    if nst_params:
-        try:
-            nst_engine_instance = NSTEngine(nst_params)
-            if nst_engine_instance._initialized:
-                dp["nst_engine"] = nst_engine_instance
-                dp.include_router(nst_router)
-                logger.info("NSTEngine initialized and router registered.")
-            else:
-                logger.warning(
-                    "NSTEngine created, but failed to initialize properly. "
-                    "NST functionality is disabled."
-                )
-        except Exception as e:
-            logger.critical(
-                f"Critical error during NSTEngine initialization: {e}", exc_info=True
-            )
-    else:
-        logger.info("NST config not found, NST functionality is disabled.")
+    if settings.TRACING_ENABLED:
+        configure_tracing(
+            export_path=settings.TRACE_EXPORT_PATH,
+            slow_threshold=settings.TRACE_SLOW_THRESHOLD,
+        )
+        dp.update.outer_middleware(TracingMiddleware())
+    dp["worker_index"] = worker_index
 
-    # CycleGAN initialization
-    dp["cyclegan_engine"] = None
-    if cyclegan_params:
-        try:
-            cyclegan_engine_instance = CycleGANEngine(cyclegan_params)
-            if cyclegan_engine_instance._initialized:
-                dp["cyclegan_engine"] = cyclegan_engine_instance
-                dp.include_router(cyclegan_router)
-                logger.info("CycleGANEngine initialized and router registered.")
-            else:
-                logger.warning(
-                    "CycleGANEngine created, but no models were loaded. "
-                    "CycleGAN functionality is disabled."
-                )
-        except Exception as e:
-            logger.critical(
-                f"Critical error during CycleGANEngine initialization: {e}",
-                exc_info=True,
-            )
+    dp["job_store"] = None
+    if settings.JOB_STORE_PATH:
+        dp["job_store"] = JobStore(
+            settings.JOB_STORE_PATH, lease_seconds=settings.JOB_LEASE_SECONDS
+        )
+        logger.info(f"Durable job store enabled: {settings.JOB_STORE_PATH}")
+
+    if settings.inference_server_urls:
+        _setup_remote_engines(dp, settings)
     else:
-        logger.info("CycleGAN config not found, CycleGAN functionality is disabled.")
+        _setup_local_engines(dp, settings, engines)
+
+    dp["result_cache"] = None
+    if settings.RESULT_CACHE_SIZE > 0:
+        dp["result_cache"] = ResultCache(
+            max_entries=settings.RESULT_CACHE_SIZE, ttl=settings.RESULT_CACHE_TTL
+        )
+
+    dp["photo_cache"] = None
+    if settings.PHOTO_CACHE_MAX_BYTES > 0:
+        dp["photo_cache"] = BoundedCache(
+            settings.PHOTO_CACHE_MAX_BYTES, ttl=settings.PHOTO_CACHE_TTL
+        )
+
+    dp["loop_monitor"] = None
+    if settings.LOOP_LAG_THRESHOLD > 0:
+        dp["loop_monitor"] = LoopLagMonitor(
+            threshold=settings.LOOP_LAG_THRESHOLD,
+            trace_callbacks=settings.LOOP_LAG_TRACE_CALLBACKS,
+        )
+
+    dp["sampling_profiler"] = None
+    if settings.SAMPLING_PROFILER_ENABLED:
+        output_dir = Path(settings.SAMPLING_PROFILER_DIR)
+        if worker_index is not None:
+            output_dir = output_dir / f"worker-{worker_index}"
+        dp["sampling_profiler"] = StackSampler(
+            output_dir=str(output_dir),
+            interval=settings.SAMPLING_PROFILER_INTERVAL,
+            flush_interval=settings.SAMPLING_PROFILER_FLUSH_INTERVAL,
+            max_files=settings.SAMPLING_PROFILER_MAX_FILES,
+        )
+
+    if settings.METRICS_ENABLED:
+        _register_metrics(dp)
+
+    configure_profiler(settings.PROFILE_OUTPUT_DIR)
 
     # Registering other routers
+    dp.include_router(admin_router)
     dp.include_router(common_router)
 
     # Registering startup/shutdown hooks
@@ -196,12 +503,10 @@ def create_bot_and_dispatcher(
     return bot, dp
 
 
-async def main():
-    storage = MemoryStorage()
-
+def load_settings() -> Settings:
     # Load settings and validate environment
     try:
-        app_settings = Settings()
+        return Settings()
     except ValidationError as e:
         logger.critical("Environment validation error. Check yours .the env file.")
         for error in e.errors():
@@ -209,11 +514,26 @@ async def main():
             logger.critical(f"  - Parameter '{field}': {error['msg']}")
         sys.exit(1)
 
-    bot, dp = create_bot_and_dispatcher(app_settings, storage)
+
+async def main(worker_index: Optional[int] = None):
+    app_settings = load_settings()
+    storage = create_storage(app_settings.FSM_STORAGE, app_settings.FSM_STORAGE_PATH)
+
+    bot, dp = create_bot_and_dispatcher(app_settings, storage, worker_index)
 
     aiohttp_runner = None
+    metrics_runner = None
 
     try:
+        # Metrics get their own server, never the public webhook port; each
+        # webhook worker serves its own on the next port
+        if app_settings.METRICS_ENABLED and app_settings.METRICS_PORT:
+            metrics_runner = await start_metrics_server(
+                app_settings.METRICS_HOST,
+                app_settings.METRICS_PORT + (worker_index or 0),
+                app_settings.METRICS_PATH,
+            )
+
         if app_settings.BOT_RUN_MODE == "polling":
             logger.info("Starting polling...")
             await dp.start_polling(bot)
@@ -231,13 +551,18 @@ async def main():
                 if app_settings.WEBHOOK_SECRET
                 else None
             )
-            webhook_requests_handler = SimpleRequestHandler(
+            webhook_requests_handler = BackgroundRequestHandler(
                 dispatcher=dp,
                 bot=bot,
+                max_concurrency=app_settings.WEBHOOK_MAX_CONCURRENT_UPDATES,
+                max_pending=app_settings.WEBHOOK_MAX_PENDING_UPDATES,
+                dedup_size=app_settings.WEBHOOK_DEDUP_WINDOW,
                 secret_token=secret_val,
             )
             webhook_requests_handler.register(app, path=app_settings.WEBHOOK_PATH)
             setup_application(app, dp, bot=bot)
+            if app_settings.METRICS_ENABLED:
+                register_queue_depth(lambda: webhook_requests_handler.pending_count)
 
             aiohttp_runner = web.AppRunner(app)
             await aiohttp_runner.setup()
@@ -245,10 +570,12 @@ async def main():
                 aiohttp_runner,
                 host="0.0.0.0",
                 port=app_settings.WEBHOOK_PORT,
+                reuse_port=worker_index is not None,
             )
             await site.start()
             logger.info(
-                f"Webhook server is running on http://"
+                f"Webhook server{'' if worker_index is None else f' (worker {worker_index})'}"
+                f" is running on http://"
                 f"0.0.0.0:{app_settings.WEBHOOK_PORT}{app_settings.WEBHOOK_PATH}"
             )
             await asyncio.Event().wait()
@@ -278,9 +605,78 @@ async def main():
         elif aiohttp_runner:
             logger.info("Cleaning up aiohttp runner.")
             await aiohttp_runner.cleanup()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
         logger.info("Main finally cleanup finished.")
 
 
+def _run_worker(worker_index: int) -> None:
+    try:
+        asyncio.run(main(worker_index=worker_index))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_webhook_workers(settings: Settings) -> None:
+    """Runs WEBHOOK_WORKERS webhook processes sharing one port (SO_REUSEPORT).
+
+    The supervisor restarts workers that die and forwards SIGTERM/SIGINT to
+    them as SIGINT, so each worker shuts down through its normal cleanup.
+    """
+    job_store = JobStore(settings.JOB_STORE_PATH) if settings.JOB_STORE_PATH else None
+    cleanup_temp_images(job_store)
+    if job_store is not None:
+        job_store.close()
+
+    ctx = multiprocessing.get_context("spawn")
+    workers: dict[int, multiprocessing.Process] = {}
+    stopping = False
+
+    def start_worker(index: int) -> None:
+        process = ctx.Process(target=_run_worker, args=(index,), name=f"bot-worker-{index}")
+        process.start()
+        workers[index] = process
+        logger.info(f"Started webhook worker {index} (pid {process.pid}).")
+
+    def request_stop(signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for index in range(settings.WEBHOOK_WORKERS):
+        start_worker(index)
+
+    while not stopping:
+        time.sleep(1)
+        for index, process in list(workers.items()):
+            if not process.is_alive() and not stopping:
+                logger.warning(
+                    f"Webhook worker {index} exited with code {process.exitcode}. "
+                    "Restarting."
+                )
+                start_worker(index)
+
+    logger.info("Stopping webhook workers...")
+    for process in workers.values():
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGINT)
+    for process in workers.values():
+        process.join(timeout=30)
+        if process.is_alive():
+            process.terminate()
+    logger.info("All webhook workers stopped.")
+
+
+def run() -> None:
+    settings = load_settings()
+    if settings.BOT_RUN_MODE == "webhook" and settings.WEBHOOK_WORKERS > 1:
+        run_webhook_workers(settings)
+    else:
+        asyncio.run(main())
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()
@@ -0,0 +1,335 @@
+"""Startup calibration of the NST image size, worker counts and torch threads.
+
+The YAML configs give one image size per device type, whatever the host's
+actual speed. With calibration enabled, the engines are micro-benchmarked
+once per host: the torch thread count and the worker count with the best
+throughput, then the largest NST image size whose predicted job latency
+(under that concurrency) fits the target. Results are cached in a JSON file
+keyed by a fingerprint of the host and of the calibration inputs, so later
+starts on the same machine cost nothing.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_SIZES = (128, 192, 256, 320, 384, 512)
+# torch.optim.LBFGS runs up to max_iter (20) evaluations per step, so a job
+# can overshoot its step budget by that much
+_LBFGS_MAX_ITER = 20
+
+
+@dataclass
+class CalibrationResult:
+    key: str
+    host: dict
+    threads: int
+    nst_image_size: Optional[int] = None
+    nst_workers: Optional[int] = None
+    cyclegan_workers: Optional[int] = None
+    # Raw timings, for the log and for humans reading the cache file
+    measurements: dict = field(default_factory=dict)
+    created: float = field(default_factory=time.time)
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def host_info() -> dict:
+    cpu_model = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {
+        "cpu": cpu_model,
+        "cores": available_cores(),
+        "torch": torch.__version__,
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+    }
+
+
+def calibration_key(host: dict, inputs: dict) -> str:
+    """Changes with the hardware, the torch build or anything calibrated against."""
+    payload = json.dumps({"host": host, "inputs": inputs}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+class CalibrationCache:
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def _read(self) -> dict:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable calibration cache {self.path}: {e}")
+            return {}
+
+    def get(self, key: str) -> Optional[CalibrationResult]:
+        entry = self._read().get(key)
+        return CalibrationResult(**entry) if entry else None
+
+    def put(self, result: CalibrationResult) -> None:
+        entries = self._read()
+        entries[result.key] = asdict(result)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(entries, indent=2), encoding="utf-8")
+            tmp_path.replace(self.path)
+        except OSError as e:
+            logger.warning(f"Failed to write calibration cache {self.path}: {e}")
+
+
+def _thread_candidates(cores: int) -> list[int]:
+    candidates = {cores}
+    threads = 1
+    while threads < cores:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+
+def _worker_candidates(cores: int, threads: int, max_workers: int) -> list[int]:
+    limit = max(1, min(max_workers, cores // threads))
+    candidates = {1, limit}
+    workers = 2
+    while workers < limit:
+        candidates.add(workers)
+        workers *= 2
+    return sorted(candidates)
+
+
+def measure(
+    make_job: Callable[[], Callable[[], None]], workers: int, threads: int, repeats: int
+) -> tuple[float, float]:
+    """Runs ``repeats`` calls of a job in each of ``workers`` threads at once.
+
+    Returns (mean seconds per call as seen by one worker, calls per second
+    overall). Every worker gets its own job: NST loss modules keep state.
+    """
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(threads)
+    try:
+        jobs = [make_job() for _ in range(workers)]
+        for job in jobs:
+            job()  # warm-up: allocator, kernel selection
+        barrier = threading.Barrier(workers)
+
+        def run(job) -> float:
+            barrier.wait()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                job()
+            return (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers, thread_name_prefix="calibration") as pool:
+            per_call = list(pool.map(run, jobs))
+        wall = time.perf_counter() - start
+    finally:
+        torch.set_num_threads(previous_threads)
+    return sum(per_call) / len(per_call), workers * repeats / wall
+
+
+class Calibrator:
+    def __init__(
+        self,
+        nst_engine=None,
+        cyclegan_engine=None,
+        target_seconds: float = 60.0,
+        image_sizes=DEFAULT_IMAGE_SIZES,
+        max_workers: int = 4,
+        repeats: int = 3,
+    ):
+        self.nst_engine = nst_engine
+        self.cyclegan_engine = cyclegan_engine
+        self.target_seconds = target_seconds
+        self.image_sizes = sorted(image_sizes)
+        self.max_workers = max_workers
+        self.repeats = repeats
+        self.cores = available_cores()
+
+    def inputs(self) -> dict:
+        """Everything the result depends on besides the host."""
+        inputs = {
+            "target_seconds": self.target_seconds,
+            "image_sizes": self.image_sizes,
+            "max_workers": self.max_workers,
+        }
+        if self.nst_engine is not None:
+            config = self.nst_engine.config
+            inputs["nst"] = {
+                "model": str(config.MODEL_PATH),
+                "style_layers": config.STYLE_LAYERS,
+                "content_layers": config.CONTENT_LAYERS,
+                "steps": self.nst_evaluations(),
+                "device": str(self.nst_engine.device),
+            }
+        if self.cyclegan_engine is not None:
+            inputs["cyclegan"] = {
+                "image_size": self.cyclegan_engine.config.IMAGE_SIZE,
+                "device": str(self.cyclegan_engine.device),
+            }
+        return inputs
+
+    def nst_evaluations(self) -> float:
+        """Forward+backward passes of one job at the working size."""
+        config = self.nst_engine.config
+        steps = config.INIT_NUM_STEPS[config.INIT_STRATEGY] + _LBFGS_MAX_ITER
+        if config.INIT_STRATEGY == "low_res":
+            # The low-resolution pass costs roughly in proportion to its pixels
+            steps += (config.INIT_LOW_RES_NUM_STEPS + _LBFGS_MAX_ITER) * (
+                config.INIT_LOW_RES_SCALE**2
+            )
+        return steps
+
+    def _nst_job(self, size: int) -> Callable[[], Callable[[], None]]:
+        engine = self.nst_engine
+
+        def make_job():
+            generator = torch.Generator().manual_seed(0)
+            content = torch.rand(1, 3, size, size, generator=generator).to(engine.device)
+            style = torch.rand(1, 3, size, size, generator=generator).to(engine.device)
+            model, style_losses, content_losses = engine._get_style_model_and_losses(
+                style, content
+            )
+            model.requires_grad_(False)
+            input_img = content.clone().requires_grad_(True)
+
+            def evaluation():
+                input_img.grad = None
+                model(input_img)
+                loss = sum(sl.loss for sl in style_losses) + sum(
+                    cl.loss for cl in content_losses
+                )
+                loss.backward()
+
+            return evaluation
+
+        return make_job
+
+    def _cyclegan_job(self) -> Callable[[], Callable[[], None]]:
+        engine = self.cyclegan_engine
+        style_name = next(iter(engine.models))
+        size = engine.config.IMAGE_SIZE
+
+        def make_job():
+            image = torch.rand(1, 3, size, size, device=engine.device) * 2 - 1
+            return lambda: engine._run_model(image, style_name)
+
+        return make_job
+
+    def _best_concurrency(self, make_job, threads_options) -> tuple[int, int, list]:
+        """(threads, workers) with the highest throughput; ties go to fewer workers."""
+        results = []
+        for threads in threads_options:
+            for workers in _worker_candidates(self.cores, threads, self.max_workers):
+                latency, throughput = measure(make_job, workers, threads, self.repeats)
+                results.append(
+                    {"threads": threads, "workers": workers,
+                     "latency": latency, "throughput": throughput}
+                )
+        # Within 5% counts as a tie: fewer workers means lower latency and memory
+        best_throughput = max(r["throughput"] for r in results)
+        best = min(
+            (r for r in results if r["throughput"] >= 0.95 * best_throughput),
+            key=lambda r: (r["workers"], -r["throughput"]),
+        )
+        return best["threads"], best["workers"], results
+
+    def calibrate(self, key: str, host: dict) -> CalibrationResult:
+        started = time.perf_counter()
+        result = CalibrationResult(key=key, host=host, threads=torch.get_num_threads())
+        thread_options = _thread_candidates(self.cores)
+
+        if self.nst_engine is not None:
+            probe_size = self.nst_engine.image_size or self.image_sizes[0]
+            threads, workers, runs = self._best_concurrency(
+                self._nst_job(probe_size), thread_options
+            )
+            result.threads, result.nst_workers = threads, workers
+            result.measurements["nst_concurrency"] = runs
+
+            evaluations = self.nst_evaluations()
+            result.nst_image_size = self.image_sizes[0]
+            sizes = []
+            for size in self.image_sizes:
+                latency, _ = measure(self._nst_job(size), workers, threads, self.repeats)
+                predicted = latency * evaluations
+                sizes.append({"size": size, "evaluation": latency, "predicted": predicted})
+                if predicted > self.target_seconds:
+                    break  # larger sizes are only slower
+                result.nst_image_size = size
+            result.measurements["nst_sizes"] = sizes
+
+        if self.cyclegan_engine is not None and self.cyclegan_engine.models:
+            # torch threads are process-wide: keep what NST chose, if anything
+            options = [result.threads] if self.nst_engine is not None else thread_options
+            threads, workers, runs = self._best_concurrency(self._cyclegan_job(), options)
+            result.threads, result.cyclegan_workers = threads, workers
+            result.measurements["cyclegan_concurrency"] = runs
+
+        result.measurements["seconds"] = time.perf_counter() - started
+        return result
+
+
+def calibrate_engines(
+    nst_engine,
+    cyclegan_engine,
+    cache_path: str,
+    target_seconds: float = 60.0,
+    image_sizes=DEFAULT_IMAGE_SIZES,
+    max_workers: int = 4,
+) -> CalibrationResult:
+    """Cached calibration result for this host, measuring on a cache miss."""
+    calibrator = Calibrator(
+        nst_engine, cyclegan_engine, target_seconds, image_sizes, max_workers
+    )
+    host = host_info()
+    key = calibration_key(host, calibrator.inputs())
+    cache = CalibrationCache(cache_path)
+    result = cache.get(key)
+    if result is not None:
+        logger.info(f"Using cached calibration {key} from {cache_path}.")
+        return result
+
+    logger.info(f"Calibrating engines for this host ({host['cpu']}, {host['cores']} cores)...")
+    result = calibrator.calibrate(key, host)
+    cache.put(result)
+    logger.info(
+        f"Calibration finished in {result.measurements['seconds']:.1f} s: "
+        f"threads={result.threads}, NST size={result.nst_image_size}, "
+        f"NST workers={result.nst_workers}, CycleGAN workers={result.cyclegan_workers}"
+    )
+    return result
+
+
+def apply_calibration(result: CalibrationResult, nst_engine=None) -> None:
+    """Sets torch threads and the NST image size; worker counts are applied by
+    the caller when it creates the pools."""
+    torch.set_num_threads(result.threads)
+    if nst_engine is not None and result.nst_image_size:
+        nst_engine.image_size = result.nst_image_size
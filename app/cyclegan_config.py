@@ -2,6 +2,9 @@ import yaml
 from pathlib import Path
 import logging
 
+from app.image_decode import DEFAULT_MAX_PIXELS
+from app.image_encode import OutputEncoderConfig
+
 logger = logging.getLogger(__name__)
 
 CONFIG_FILE_PATH = Path(__file__).parent / "configs" / "cyclegan_params.yaml"
@@ -20,6 +23,18 @@ class CycleGANConfig:
             self.OUTPUT_CHANNELS = int(data.get("OUTPUT_CHANNELS", 3))
             self.NUM_RESIDUAL_BLOCKS = int(data.get("NUM_RESIDUAL_BLOCKS", 9))
             self.IMAGE_SIZE = int(data.get("IMAGE_SIZE", 256))
+            self.MAX_INPUT_PIXELS = int(
+                data.get("MAX_INPUT_PIXELS", DEFAULT_MAX_PIXELS)
+            )
+
+            # Preprocessed inputs kept for repeated requests on the same photo
+            self.TENSOR_CACHE_MAX_BYTES = int(
+                data.get("TENSOR_CACHE_MAX_BYTES", 128 * 1024 * 1024)
+            )
+            self.TENSOR_CACHE_TTL = float(data.get("TENSOR_CACHE_TTL", 1800))
+
+            # Encoding of the result sent to the user
+            self.OUTPUT_ENCODER = OutputEncoderConfig.from_dict(data.get("OUTPUT"))
 
             # Style list
             self.styles = data.get("styles", {})
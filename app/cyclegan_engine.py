@@ -1,6 +1,8 @@
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 import torch
-import torchvision.transforms as transforms
 from PIL import Image
 
 import logging
@@ -9,16 +11,31 @@ from app.architectures.cyclegan_networks import ResnetGenerator
 import torch.nn as nn
 import functools
 from app.cyclegan_config import CycleGANConfig
+from app.image_decode import decode_image
+from app.image_tensor import ImageTensorCodec
+from app.photo_cache import BoundedCache
+from app.metrics import CYCLEGAN_BATCH_SIZE
+from app.tracing import span
+from app.profiling import profiled
+from app.timing import DurationModel, current_precision
 
 
 logger = logging.getLogger(__name__)
 
+# Threads reading generator weights at startup
+_MODEL_LOAD_WORKERS = 4
+
 
 class CycleGANModelNotInitializedError(Exception):
     pass
 
 
 class CycleGANEngine:
+    # Dedicated worker pool for run_engine_call (see app.engines.attach_worker_pool)
+    executor: Optional[Executor] = None
+    # Job duration history and predictions (see app.engines.attach_timing_model)
+    timing_model: Optional[DurationModel] = None
+
     def __init__(self, config: CycleGANConfig):
         self.config = config
         self.device = None
@@ -36,6 +53,22 @@ class CycleGANEngine:
             self._initialized = False
             logger.critical(f"CycleGANEngine initialization failed: {e}", exc_info=True)
 
+    @property
+    def working_size(self) -> int:
+        """Shorter side (px) input images are resized to before stylization."""
+        return self.config.IMAGE_SIZE
+
+    def predict_duration(self, style_name: Optional[str] = None) -> Optional[float]:
+        """Expected seconds of stylize_bytes, or None without timing history."""
+        if self.timing_model is None:
+            return None
+        return self.timing_model.predict(
+            "cyclegan",
+            self.config.IMAGE_SIZE,
+            style=style_name,
+            precision=current_precision(self.device),
+        )
+
     def _determine_device(self):
         pref = self.config.DEVICE_PREFERENCE
         determined_device_str = "cpu"
@@ -63,6 +96,55 @@ class CycleGANEngine:
 
         self.device = torch.device(determined_device_str)
 
+    def _load_model(self, style_name: str, style_info: dict) -> Optional[nn.Module]:
+        model_filename = style_info.get("model_file")
+        if not model_filename:
+            logger.warning(
+                f"No 'model_file' specified for style '{style_name}'. Skipping."
+            )
+            return None
+
+        model_path = self.config.MODELS_DIR / Path(model_filename).name
+
+        if not model_path.exists():
+            logger.warning(
+                f"Model file not found for style '{style_name}': {model_path}"
+            )
+            return None
+
+        try:
+            netG = ResnetGenerator(
+                input_nc=self.config.INPUT_CHANNELS,
+                output_nc=self.config.OUTPUT_CHANNELS,
+                ngf=64,
+                norm_layer=functools.partial(
+                    nn.InstanceNorm2d, affine=False, track_running_stats=False
+                ),
+                use_dropout=False,
+                n_blocks=self.config.NUM_RESIDUAL_BLOCKS,
+            )
+
+            netG.load_state_dict(
+                torch.load(
+                    model_path,
+                    map_location=self.device
+                ),
+                strict=False
+            )
+
+            netG.to(self.device).eval()
+
+            logger.info(
+                f"Successfully loaded CycleGAN model for style: {style_name}"
+            )
+            return netG
+        except Exception as e:
+            logger.error(
+                f"Failed to load model for style '{style_name}' from {model_path}: {e}",
+                exc_info=True,
+            )
+            return None
+
     def _load_all_models(self):
         styles = self.config.styles
         if not styles or not isinstance(styles, dict):
@@ -72,53 +154,15 @@ class CycleGANEngine:
             )
             return
 
-        for style_name, style_info in styles.items():
-            model_filename = style_info.get("model_file")
-            if not model_filename:
-                logger.warning(
-                    f"No 'model_file' specified for style '{style_name}'. Skipping."
-                )
-                continue
-
-            model_path = self.config.MODELS_DIR / Path(model_filename).name
-
-            if not model_path.exists():
-                logger.warning(
-                    f"Model file not found for style '{style_name}': {model_path}"
-                )
-                continue
-
-            try:
-                netG = ResnetGenerator(
-                    input_nc=self.config.INPUT_CHANNELS,
-                    output_nc=self.config.OUTPUT_CHANNELS,
-                    ngf=64,
-                    norm_layer=functools.partial(
-                        nn.InstanceNorm2d, affine=False, track_running_stats=False
-                    ),
-                    use_dropout=False,
-                    n_blocks=self.config.NUM_RESIDUAL_BLOCKS,
-                )
-
-                netG.load_state_dict(
-                    torch.load(
-                        model_path,
-                        map_location=self.device
-                    ),
-                    strict=False
-                )
-
-                netG.to(self.device).eval()
-
-                self.models[style_name] = netG
-                logger.info(
-                    f"Successfully loaded CycleGAN model for style: {style_name}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to load model for style '{style_name}' from {model_path}: {e}",
-                    exc_info=True,
-                )
+        # Generators are independent: read and deserialize them in parallel
+        with ThreadPoolExecutor(
+            max_workers=min(_MODEL_LOAD_WORKERS, len(styles)),
+            thread_name_prefix="cyclegan-load",
+        ) as pool:
+            loaded = pool.map(lambda item: self._load_model(*item), styles.items())
+            for style_name, netG in zip(styles, loaded):
+                if netG is not None:
+                    self.models[style_name] = netG
 
         if len(self.models) > 0:
             self._initialized = True
@@ -130,29 +174,74 @@ class CycleGANEngine:
             if name in self.models
         }
 
+    @functools.cached_property
+    def _codec(self) -> ImageTensorCodec:
+        return ImageTensorCodec(self.device, mean=(0.5, 0.5, 0.5), std=(0.5, 0.5, 0.5))
+
     def _image_to_tensor(self, image: Image.Image) -> torch.Tensor:
-        transform = transforms.Compose(
-            [
-                transforms.Resize(self.config.IMAGE_SIZE),
-                transforms.CenterCrop(self.config.IMAGE_SIZE),
-                transforms.ToTensor(),
-                transforms.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5)),
-            ]
-        )
-        return transform(image.convert("RGB")).unsqueeze(0).to(self.device)
+        image = self._codec.resize(image, self.config.IMAGE_SIZE, center_crop=True)
+        return self._codec.to_tensor(image)
 
     def _tensor_to_pil_image(self, tensor: torch.Tensor) -> Image.Image:
-        output_image = tensor.detach().squeeze(0).cpu()
-        output_image = output_image * 0.5 + 0.5  # Denormalization
-        return transforms.ToPILImage()(output_image)
+        return self._codec.to_image(tensor)
 
-    def stylize(self, image: Image.Image, style_name: str) -> Image.Image:
+    @functools.cached_property
+    def _tensor_cache(self) -> BoundedCache:
+        return BoundedCache(
+            self.config.TENSOR_CACHE_MAX_BYTES, ttl=self.config.TENSOR_CACHE_TTL
+        )
+
+    @property
+    def tensor_cache(self) -> BoundedCache:
+        return self._tensor_cache
+
+    def _run_model(self, img_tensor: torch.Tensor, style_name: str) -> torch.Tensor:
         if style_name not in self.models:
             raise ValueError(f"Style '{style_name}' is not a valid or loaded style.")
 
         model = self.models[style_name]
-        img_tensor = self._image_to_tensor(image)
+        CYCLEGAN_BATCH_SIZE.observe(img_tensor.shape[0], style=style_name)
         with torch.no_grad():
-            output_tensor = model(img_tensor)
+            return model(img_tensor)
 
+    def stylize(self, image: Image.Image, style_name: str) -> Image.Image:
+        if style_name not in self.models:
+            raise ValueError(f"Style '{style_name}' is not a valid or loaded style.")
+        output_tensor = self._run_model(self._image_to_tensor(image), style_name)
         return self._tensor_to_pil_image(output_tensor)
+
+    @profiled("cyclegan")
+    def stylize_bytes(self, image_bytes, style_name: str, cache_key=None) -> bytes:
+        """Decodes an encoded photo, stylizes it and returns encoded result bytes.
+
+        With ``cache_key`` (the photo's Telegram file_unique_id) the
+        preprocessed input tensor is kept, so trying another style on the same
+        photo goes straight to the forward pass.
+        """
+        if style_name not in self.models:
+            raise ValueError(f"Style '{style_name}' is not a valid or loaded style.")
+        started = time.perf_counter()
+        tensor_key = (cache_key, self.config.IMAGE_SIZE)
+        img_tensor = self._tensor_cache.get(tensor_key) if cache_key else None
+        if img_tensor is None:
+            with span("decode"):
+                image = decode_image(
+                    image_bytes, self.config.IMAGE_SIZE, self.config.MAX_INPUT_PIXELS
+                )
+                img_tensor = self._image_to_tensor(image)
+            if cache_key:
+                self._tensor_cache.put(tensor_key, img_tensor)
+        with span("forward", style=style_name):
+            output_tensor = self._run_model(img_tensor, style_name)
+        with span("encode"):
+            result = self._codec.encode(output_tensor, self.config.OUTPUT_ENCODER)
+        if self.timing_model is not None:
+            self.timing_model.record(
+                "cyclegan",
+                style_name,
+                self.config.IMAGE_SIZE,
+                current_precision(self.device),
+                1,
+                time.perf_counter() - started,
+            )
+        return result
@@ -0,0 +1,186 @@
+"""Background loading of the local engines.
+
+Building NSTEngine (VGG19) and CycleGANEngine (a generator per style) takes
+seconds to minutes, most of it torch imports and weights. The bot starts
+answering right away instead: every engine is built in its own thread once
+the dispatcher starts, and EngineWarmupMiddleware answers requests for an
+engine that is not ready yet with "try again in N s".
+"""
+
+import asyncio
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from app.job_store import JOB_KIND_CYCLEGAN, JOB_KIND_NST
+
+logger = logging.getLogger(__name__)
+
+ENGINE_LOADING = "loading"
+ENGINE_READY = "ready"
+ENGINE_FAILED = "failed"
+
+# Workflow data key of each engine, which is also the handlers' parameter name
+ENGINE_KEYS = {JOB_KIND_NST: "nst_engine", JOB_KIND_CYCLEGAN: "cyclegan_engine"}
+
+
+class EngineLoader:
+    """Builds engines in parallel threads and publishes them as they get ready.
+
+    ``loaders`` maps an engine kind to a function returning the engine (None
+    if it cannot be loaded). With ``prepare`` (calibration), engines are
+    published together, after ``prepare`` has seen all of them; otherwise
+    each one as soon as it is built. ``on_ready`` callbacks run on the event
+    loop for every engine, loaded or not.
+    """
+
+    def __init__(
+        self,
+        loaders: dict[str, Callable[[], Any]],
+        prepare: Optional[Callable[[dict], None]] = None,
+        expected_seconds: float = 30.0,
+    ):
+        self.loaders = loaders
+        self.prepare = prepare
+        self.expected_seconds = expected_seconds
+        self.states = {kind: ENGINE_LOADING for kind in loaders}
+        self.engines: dict[str, Any] = {}
+        self.load_seconds: dict[str, float] = {}
+        self._callbacks: list[Callable[[str, Any], None]] = []
+        self._started: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def on_ready(self, callback: Callable[[str, Any], None]) -> None:
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._started = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+
+    async def wait(self) -> None:
+        """Returns once every engine is published (or failed to load)."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    def stop(self) -> None:
+        # Loader threads cannot be interrupted; their engines are just dropped
+        if self._task is not None:
+            self._task.cancel()
+
+    def state(self, kind: str) -> Optional[str]:
+        return self.states.get(kind)
+
+    def retry_after(self, kind: str) -> int:
+        """Seconds a user should wait before retrying, rounded up to 5."""
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        remaining = self.expected_seconds - elapsed
+        return max(5, math.ceil(remaining / 5) * 5)
+
+    def _load(self, kind: str, load: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            engine = load()
+        except Exception as e:
+            logger.critical(f"Loading the {kind} engine failed: {e}", exc_info=True)
+            engine = None
+        self.load_seconds[kind] = time.perf_counter() - start
+        logger.info(f"{kind} engine loaded in {self.load_seconds[kind]:.1f} s.")
+        return engine
+
+    def _publish(self, kind: str, engine: Any) -> None:
+        for callback in self._callbacks:
+            try:
+                callback(kind, engine)
+            except Exception as e:
+                logger.error(f"Publishing the {kind} engine failed: {e}", exc_info=True)
+                engine = None
+        if engine is not None:
+            self.engines[kind] = engine
+        self.states[kind] = ENGINE_READY if engine is not None else ENGINE_FAILED
+
+    async def _publish_when_loaded(self, kind: str, loading: Awaitable) -> None:
+        self._publish(kind, await loading)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.loaders)), thread_name_prefix="engine-loader"
+        )
+        try:
+            loads = {
+                kind: loop.run_in_executor(executor, self._load, kind, load)
+                for kind, load in self.loaders.items()
+            }
+            if self.prepare is None:
+                await asyncio.gather(
+                    *(self._publish_when_loaded(kind, f) for kind, f in loads.items())
+                )
+                return
+            engines = dict(zip(loads, await asyncio.gather(*loads.values())))
+            loaded = {kind: engine for kind, engine in engines.items() if engine is not None}
+            if loaded:
+                try:
+                    await loop.run_in_executor(executor, self.prepare, loaded)
+                except Exception as e:
+                    logger.error(f"Preparing the engines failed: {e}", exc_info=True)
+            for kind, engine in engines.items():
+                self._publish(kind, engine)
+        finally:
+            executor.shutdown(wait=False)
+            logger.info(
+                f"Engine warm-up finished in {time.monotonic() - self._started:.1f} s: "
+                + ", ".join(f"{kind} {state}" for kind, state in self.states.items())
+            )
+
+
+class EngineWarmupMiddleware(BaseMiddleware):
+    """Hands loaded engines to handlers and answers for the others.
+
+    A handler needs an engine when it takes its workflow data key
+    (``nst_engine``, ``cyclegan_engine``) as a parameter. The engine is put
+    into the handler data here: polling and webhook handlers copy the
+    workflow data once, before the engines exist.
+    """
+
+    def __init__(self, loader: EngineLoader):
+        self.loader = loader
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        params = getattr(handler_object, "params", ())
+        for kind, key in ENGINE_KEYS.items():
+            if key not in params:
+                continue
+            engine = self.loader.engines.get(kind)
+            if engine is not None:
+                data[key] = engine
+                continue
+            state = self.loader.state(kind)
+            if state == ENGINE_LOADING:
+                text = (
+                    "⏳ Бот только что перезапустился, модель ещё загружается. "
+                    f"Попробуйте через {self.loader.retry_after(kind)} сек."
+                )
+            else:
+                text = "К сожалению, этот режим сейчас недоступен. Попробуйте позже."
+            await _reply(event, text)
+            return None
+        return await handler(event, data)
+
+
+async def _reply(event: TelegramObject, text: str) -> None:
+    if isinstance(event, CallbackQuery):
+        await event.answer(text, show_alert=True)
+    elif isinstance(event, Message):
+        await event.answer(text)
@@ -0,0 +1,268 @@
+import functools
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Optional
+
+from app.nst_config import nst_params
+from app.cyclegan_config import cyclegan_params
+
+# The engine modules import torch and torchvision, which takes seconds:
+# they are imported when an engine is loaded, not with the bot
+if TYPE_CHECKING:
+    from app.cyclegan_engine import CycleGANEngine
+    from app.nst_engine import NSTEngine
+
+logger = logging.getLogger(__name__)
+
+
+class NSTModelNotInitializedError(Exception):
+    pass
+
+
+def load_nst_engine() -> Optional["NSTEngine"]:
+    if not nst_params:
+        logger.info("NST config not found, NST functionality is disabled.")
+        return None
+    try:
+        from app.nst_engine import NSTEngine
+
+        nst_engine_instance = NSTEngine(nst_params)
+    except Exception as e:
+        logger.critical(
+            f"Critical error during NSTEngine initialization: {e}", exc_info=True
+        )
+        return None
+    if not nst_engine_instance._initialized:
+        logger.warning(
+            "NSTEngine created, but failed to initialize properly. "
+            "NST functionality is disabled."
+        )
+        return None
+    return nst_engine_instance
+
+
+def load_cyclegan_engine() -> Optional["CycleGANEngine"]:
+    if not cyclegan_params:
+        logger.info("CycleGAN config not found, CycleGAN functionality is disabled.")
+        return None
+    try:
+        from app.cyclegan_engine import CycleGANEngine
+
+        cyclegan_engine_instance = CycleGANEngine(cyclegan_params)
+    except Exception as e:
+        logger.critical(
+            f"Critical error during CycleGANEngine initialization: {e}",
+            exc_info=True,
+        )
+        return None
+    if not cyclegan_engine_instance._initialized:
+        logger.warning(
+            "CycleGANEngine created, but no models were loaded. "
+            "CycleGAN functionality is disabled."
+        )
+        return None
+    return cyclegan_engine_instance
+
+
+SCHEDULE_FIFO = "fifo"
+SCHEDULE_SJF = "sjf"
+SCHEDULE_DEADLINE = "deadline"
+SCHEDULING_POLICIES = (SCHEDULE_FIFO, SCHEDULE_SJF, SCHEDULE_DEADLINE)
+
+
+@dataclass
+class _PendingCall:
+    fn: Callable
+    future: Future
+    seq: int
+    submitted: float
+    predicted: float
+    deadline: float
+
+
+class WorkerPool(ThreadPoolExecutor):
+    """Thread pool that counts queued and running calls for metrics.
+
+    Calls wait in the pool's own queue and reach a thread only when one is
+    free, so the order can follow ``policy``: "fifo", "sjf" (shortest
+    predicted job first) or "deadline" (earliest deadline first, a job's
+    deadline being its arrival plus ``deadline_factor`` times its predicted
+    duration). Calls without a prediction count as instant, so without
+    timing history every policy is FIFO. Under "sjf" a call waiting longer
+    than ``max_wait`` seconds goes next, whatever its size.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        thread_name_prefix: str = "",
+        policy: str = SCHEDULE_FIFO,
+        max_wait: Optional[float] = None,
+        deadline_factor: float = 3.0,
+    ):
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.max_workers = max_workers
+        self.policy = policy
+        self.max_wait = max_wait
+        self.deadline_factor = deadline_factor
+        self.queued = 0
+        self.busy_workers = 0
+        self._counter_lock = threading.Lock()
+        self._pending: list[_PendingCall] = []
+        self._dispatched = 0
+        # id(future) -> (start time, predicted seconds) of calls on a thread
+        self._running: dict[int, tuple[float, float]] = {}
+        self._seq = itertools.count()
+        self._closed = False
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self.submit_job(functools.partial(fn, *args, **kwargs))
+
+    def submit_job(self, fn: Callable, predicted_seconds: Optional[float] = None) -> Future:
+        """Queues ``fn`` with its predicted duration for the scheduling policy."""
+        now = time.monotonic()
+        predicted = predicted_seconds or 0.0
+        call = _PendingCall(
+            fn=fn,
+            future=Future(),
+            seq=next(self._seq),
+            submitted=now,
+            predicted=predicted,
+            deadline=now + self.deadline_factor * predicted,
+        )
+        with self._counter_lock:
+            if self._closed:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._pending.append(call)
+            self.queued += 1
+            self._dispatch_locked()
+        return call.future
+
+    def expected_wait(self, predicted_seconds: Optional[float] = None) -> float:
+        """Seconds a call submitted now would wait for a thread, from the
+        predictions of the calls that would run before it."""
+        now = time.monotonic()
+        probe = _PendingCall(
+            fn=None,
+            future=None,
+            seq=float("inf"),
+            submitted=now,
+            predicted=predicted_seconds or 0.0,
+            deadline=now + self.deadline_factor * (predicted_seconds or 0.0),
+        )
+        with self._counter_lock:
+            ahead = [
+                call for call in self._pending
+                if self._order_key(call, now) < self._order_key(probe, now)
+            ]
+            remaining = [
+                max(0.0, predicted - (now - started))
+                for started, predicted in self._running.values()
+            ]
+            if self._dispatched < self.max_workers:
+                return 0.0
+        return (sum(call.predicted for call in ahead) + sum(remaining)) / self.max_workers
+
+    def _order_key(self, call: _PendingCall, now: float) -> tuple:
+        if self.policy == SCHEDULE_SJF:
+            if self.max_wait is not None and now - call.submitted >= self.max_wait:
+                return (0, call.seq)
+            return (1, call.predicted, call.seq)
+        if self.policy == SCHEDULE_DEADLINE:
+            return (call.deadline, call.seq)
+        return (call.seq,)
+
+    def _dispatch_locked(self) -> None:
+        now = time.monotonic()
+        while self._pending and self._dispatched < self.max_workers:
+            call = min(self._pending, key=lambda c: self._order_key(c, now))
+            self._pending.remove(call)
+            if not call.future.set_running_or_notify_cancel():
+                self.queued -= 1
+                continue
+            self._dispatched += 1
+            super().submit(self._run, call)
+
+    def _run(self, call: _PendingCall) -> None:
+        with self._counter_lock:
+            self.queued -= 1
+            self.busy_workers += 1
+            self._running[id(call.future)] = (time.monotonic(), call.predicted)
+        try:
+            result = call.fn()
+        except BaseException as e:
+            call.future.set_exception(e)
+        else:
+            call.future.set_result(result)
+        finally:
+            with self._counter_lock:
+                self.busy_workers -= 1
+                self._dispatched -= 1
+                self._running.pop(id(call.future), None)
+                if not self._closed:
+                    self._dispatch_locked()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._counter_lock:
+            self._closed = True
+            pending, self._pending = self._pending, []
+            for call in pending:
+                if cancel_futures:
+                    call.future.cancel()
+                    self.queued -= 1
+                elif call.future.set_running_or_notify_cancel():
+                    # Past the thread limit: the executor's own queue holds them
+                    self._dispatched += 1
+                    super().submit(self._run, call)
+                else:
+                    self.queued -= 1
+        # Calls handed to a thread already have running futures: let them finish
+        super().shutdown(wait=wait)
+
+
+def attach_worker_pool(
+    engine,
+    name: str,
+    max_workers: int,
+    policy: str = SCHEDULE_FIFO,
+    max_wait: Optional[float] = None,
+    deadline_factor: float = 3.0,
+) -> None:
+    """Gives an engine its own thread pool for run_engine_call.
+
+    Long NST runs then cannot occupy the threads CycleGAN requests and the
+    event loop's default executor (FSM storage, file I/O) rely on.
+    """
+    if engine is None:
+        return
+    engine.executor = WorkerPool(
+        max_workers,
+        thread_name_prefix=f"{name}-worker",
+        policy=policy,
+        max_wait=max_wait,
+        deadline_factor=deadline_factor,
+    )
+    logger.info(
+        f"{name} worker pool started with {max_workers} thread(s), {policy} scheduling."
+    )
+
+
+def attach_timing_model(model, *engines) -> None:
+    """Lets local engines record job durations and predict them (app.timing)."""
+    for engine in engines:
+        if engine is not None:
+            engine.timing_model = model
+
+
+def shutdown_worker_pools(*engines) -> None:
+    for engine in engines:
+        executor = getattr(engine, "executor", None)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            engine.executor = None
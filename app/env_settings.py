@@ -24,6 +24,9 @@ class Settings(BaseSettings):
 
     TELEGRAM_BOT_TOKEN: SecretStr
     BOT_RUN_MODE: str = "polling"
+    # Bot API server base URL (self-hosted telegram-bot-api or a load-test
+    # stand-in); the public api.telegram.org when unset
+    TELEGRAM_API_URL: Optional[str] = None
 
     # Webhook settings
     WEBHOOK_URL: Optional[AnyHttpUrl] = None
@@ -31,6 +34,119 @@ class Settings(BaseSettings):
     WEBHOOK_SECRET: Optional[SecretStr] = None
     WEBHOOK_PATH: Optional[str] = None
     WEBHOOK_CERT_PATH: Optional[str] = None
+    WEBHOOK_MAX_CONCURRENT_UPDATES: int = 64
+    WEBHOOK_MAX_PENDING_UPDATES: int = 1000
+    WEBHOOK_DEDUP_WINDOW: int = 10000
+    WEBHOOK_WORKERS: int = 1
+
+    # FSM storage: "memory" (single process) or "sqlite" (shared by workers)
+    FSM_STORAGE: str = "memory"
+    FSM_STORAGE_PATH: str = "data/fsm.sqlite3"
+
+    # Remote inference settings (app.inference_server)
+    INFERENCE_SERVER_URLS: Optional[str] = None
+    INFERENCE_POOL_SIZE: int = 8
+    INFERENCE_TIMEOUT: float = 600.0
+    INFERENCE_HEALTH_INTERVAL: float = 10.0
+    INFERENCE_USE_SHM: bool = False
+
+    # Worker threads per local engine (decode, inference and encode run there)
+    NST_WORKERS: int = 1
+    CYCLEGAN_WORKERS: int = 2
+    # Local engines load in background threads after startup; until then
+    # their requests are answered with "try again in N s", N counting down
+    # from this estimate of the loading time
+    ENGINE_WARMUP_ESTIMATE: float = 30.0
+
+    # Startup calibration of the NST image size, worker counts and torch
+    # threads for this host (see app.calibration); results are cached per host
+    CALIBRATION_ENABLED: bool = False
+    CALIBRATION_CACHE_PATH: str = "data/calibration.json"
+    CALIBRATION_NST_TARGET_SECONDS: float = 60.0
+    CALIBRATION_NST_IMAGE_SIZES: str = "128,192,256,320,384,512"
+    CALIBRATION_MAX_WORKERS: int = 4
+
+    # Job duration history (SQLite) for ETAs and scheduling, see app.timing;
+    # disabled when the path is not set. TIMING_MIN_SAMPLES jobs are needed
+    # before durations are predicted
+    TIMING_STORE_PATH: Optional[str] = None
+    TIMING_MIN_SAMPLES: int = 5
+    # Order of queued jobs in the engine worker pools: "fifo", "sjf" (shortest
+    # predicted first; after SCHEDULER_MAX_WAIT seconds a job goes next anyway)
+    # or "deadline" (earliest of arrival + SCHEDULER_DEADLINE_FACTOR x predicted)
+    SCHEDULER_POLICY: str = "fifo"
+    SCHEDULER_MAX_WAIT: float = 300.0
+    SCHEDULER_DEADLINE_FACTOR: float = 3.0
+
+    # Opt-in event loop lag monitor: logs stalls longer than this many
+    # seconds (0.1 is a sensible start); 0 disables it
+    LOOP_LAG_THRESHOLD: float = 0.0
+    LOOP_LAG_TRACE_CALLBACKS: bool = False
+
+    # Cache of sent results (Telegram file_id) for repeated identical requests;
+    # RESULT_CACHE_SIZE=0 disables it
+    RESULT_CACHE_SIZE: int = 1000
+    RESULT_CACHE_TTL: float = 86400.0
+
+    # Downloaded photos kept by file_unique_id for retries with another style;
+    # PHOTO_CACHE_MAX_BYTES=0 disables it
+    PHOTO_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    PHOTO_CACHE_TTL: float = 1800.0
+
+    # Opt-in Prometheus metrics on a separate internal server, never on the
+    # public webhook port; webhook worker N listens on METRICS_PORT + N
+    METRICS_ENABLED: bool = False
+    METRICS_PATH: str = "/metrics"
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9100
+
+    # Opt-in per-request tracing: one JSON log line per update with its stage spans.
+    # TRACE_EXPORT_PATH additionally appends traces in OTLP/JSON format;
+    # TRACE_SLOW_THRESHOLD (seconds) keeps only slower updates
+    TRACING_ENABLED: bool = False
+    TRACE_EXPORT_PATH: Optional[str] = None
+    TRACE_SLOW_THRESHOLD: float = 0.0
+
+    # Telegram user ids allowed to run admin commands (/profile), comma-separated
+    ADMIN_IDS: Optional[str] = None
+    # torch.profiler captures armed by /profile
+    PROFILE_OUTPUT_DIR: str = "data/profiles"
+    PROFILE_MAX_JOBS: int = 10
+
+    # Opt-in sampling profiler: collapsed stacks of the event loop and engine
+    # threads, written every SAMPLING_PROFILER_FLUSH_INTERVAL seconds
+    SAMPLING_PROFILER_ENABLED: bool = False
+    SAMPLING_PROFILER_INTERVAL: float = 0.05
+    SAMPLING_PROFILER_DIR: str = "data/stacks"
+    SAMPLING_PROFILER_FLUSH_INTERVAL: float = 300.0
+    SAMPLING_PROFILER_MAX_FILES: int = 288
+
+    # Durable job store (SQLite); disabled when the path is not set
+    JOB_STORE_PATH: Optional[str] = None
+    JOB_MAX_ATTEMPTS: int = 3
+    # A worker keeps renewing its jobs' leases; jobs of a worker that stopped
+    # renewing for this long are resumed by another one
+    JOB_LEASE_SECONDS: float = 60.0
+
+    @property
+    def inference_server_urls(self) -> list[str]:
+        if not self.INFERENCE_SERVER_URLS:
+            return []
+        return [
+            url.strip() for url in self.INFERENCE_SERVER_URLS.split(",") if url.strip()
+        ]
+
+    @property
+    def calibration_image_sizes(self) -> list[int]:
+        return [
+            int(size) for size in self.CALIBRATION_NST_IMAGE_SIZES.split(",") if size.strip()
+        ]
+
+    @property
+    def admin_ids(self) -> set[int]:
+        if not self.ADMIN_IDS:
+            return set()
+        return {int(uid) for uid in self.ADMIN_IDS.split(",") if uid.strip()}
 
     @field_validator("BOT_RUN_MODE")
     @classmethod
@@ -40,6 +156,41 @@ class Settings(BaseSettings):
             raise ValueError("BOT_RUN_MODE must be 'polling' or 'webhook'")
         return mode
 
+    @field_validator("FSM_STORAGE")
+    @classmethod
+    def validate_fsm_storage(cls, v: str) -> str:
+        backend = v.lower()
+        if backend not in ["memory", "sqlite"]:
+            raise ValueError("FSM_STORAGE must be 'memory' or 'sqlite'")
+        return backend
+
+    @field_validator("SCHEDULER_POLICY")
+    @classmethod
+    def validate_scheduler_policy(cls, v: str) -> str:
+        policy = v.lower()
+        if policy not in ["fifo", "sjf", "deadline"]:
+            raise ValueError("SCHEDULER_POLICY must be 'fifo', 'sjf' or 'deadline'")
+        return policy
+
+    @field_validator("WEBHOOK_WORKERS")
+    @classmethod
+    def validate_webhook_workers(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("WEBHOOK_WORKERS must be at least 1")
+        return v
+
+    @model_validator(mode="after")
+    def check_workers_share_fsm_storage(self) -> "Settings":
+        if (
+            self.BOT_RUN_MODE == "webhook"
+            and self.WEBHOOK_WORKERS > 1
+            and self.FSM_STORAGE == "memory"
+        ):
+            raise ValueError(
+                "WEBHOOK_WORKERS > 1 requires a shared FSM storage (FSM_STORAGE=sqlite)"
+            )
+        return self
+
     @model_validator(mode="after")
     def check_webhook_settings_are_present(self) -> "Settings":
         if self.BOT_RUN_MODE == "webhook":
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}'
+);
+"""
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM storage in a local SQLite file, shared by all bot worker processes.
+
+    Lets a user's /nst or /cyclegan dialog continue no matter which webhook
+    worker receives the next update. Data must be JSON serializable.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        key_builder: Optional[KeyBuilder] = None,
+        busy_timeout: float = 30.0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.key_builder = key_builder or DefaultKeyBuilder(
+            with_bot_id=True, with_destiny=True
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=busy_timeout, check_same_thread=False
+        )
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _execute(self, query: str, params: tuple) -> Optional[tuple]:
+        with self._lock, self._conn:
+            return self._conn.execute(query, params).fetchone()
+
+    async def _run(self, query: str, params: tuple) -> Optional[tuple]:
+        # Another worker may hold the write lock; wait for it off the event loop.
+        return await asyncio.to_thread(self._execute, query, params)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(
+            "INSERT INTO fsm (key, state) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (self.key_builder.build(key), value),
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._run(
+            "SELECT state FROM fsm WHERE key = ?", (self.key_builder.build(key),)
+        )
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._run(
+            "INSERT INTO fsm (key, data) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (self.key_builder.build(key), json.dumps(data)),
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._run(
+            "SELECT data FROM fsm WHERE key = ?", (self.key_builder.build(key),)
+        )
+        return json.loads(row[0]) if row else {}
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_storage(backend: str, path: Optional[str] = None) -> BaseStorage:
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("FSM_STORAGE_PATH is required for the sqlite FSM storage.")
+        return SQLiteStorage(path)
+    raise ValueError(f"Unknown FSM storage backend: {backend}")
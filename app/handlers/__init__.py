@@ -1,10 +1,12 @@
 from .common import router as common_router
 from .nst import router as nst_router
 from .cyclegan import router as cyclegan_router
+from .admin import router as admin_router
 
 all_routers = [
     nst_router,
     cyclegan_router,
+    admin_router,
     # other_specific_router,
     common_router,
 ]
@@ -0,0 +1,94 @@
+import logging
+from typing import Optional
+
+from aiogram import Router
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+
+from app.env_settings import Settings
+from app.inference_client import InferenceClient
+from app.profiling import PROFILED_ENGINES, PROFILER
+
+logger = logging.getLogger(__name__)
+router = Router()
+
+
+def _format_status(status: dict) -> str:
+    armed = ", ".join(f"{engine}: {count}" for engine, count in status["armed"].items())
+    lines = [f"Осталось задач для профилирования — {armed}"]
+    for capture in status["captures"][-3:]:
+        lines.append(
+            f"\n{capture['engine']} ({capture['duration']:.1f} сек.): {capture['trace']}"
+        )
+        for op, cpu_ms, device_ms, allocated in capture["top_ops"]:
+            lines.append(
+                f"  • {op}: CPU {cpu_ms:.1f} мс, GPU {device_ms:.1f} мс, "
+                f"{allocated / 1024 / 1024:.1f} МБ"
+            )
+    return "\n".join(lines)
+
+
+@router.message(Command("profile"))
+async def cmd_profile(
+    message: Message,
+    command: CommandObject,
+    settings: Settings,
+    inference_client: Optional[InferenceClient] = None,
+):
+    """/profile [nst|cyclegan|all] [N] | status | off — только для администраторов."""
+    if message.from_user.id not in settings.admin_ids:
+        await message.answer("Эта команда доступна только администраторам.")
+        return
+
+    args = (command.args or "").split()
+    action = args[0].lower() if args else "all"
+
+    if action == "status":
+        if inference_client is not None:
+            statuses = await inference_client.profiler_status()
+            await message.answer(
+                "\n\n".join(
+                    f"{url}:\n"
+                    + (status["error"] if "error" in status else _format_status(status))
+                    for url, status in statuses.items()
+                )
+            )
+        else:
+            await message.answer(_format_status(PROFILER.status()))
+        return
+
+    if action == "off":
+        count = 0
+    else:
+        if action != "all" and action not in PROFILED_ENGINES:
+            await message.answer(
+                "Использование: /profile [nst|cyclegan|all] [N], /profile status, "
+                "/profile off"
+            )
+            return
+        try:
+            count = int(args[1]) if len(args) > 1 else 1
+        except ValueError:
+            await message.answer("N должно быть целым числом.")
+            return
+        count = max(1, min(count, settings.PROFILE_MAX_JOBS))
+
+    engines = PROFILED_ENGINES if action in ("all", "off") else (action,)
+    if inference_client is not None:
+        # Engines run on the inference servers; captures are written there
+        await inference_client.arm_profiler(
+            "all" if action in ("all", "off") else action, count
+        )
+    elif count:
+        PROFILER.arm(engines, count)
+    else:
+        PROFILER.disarm()
+
+    logger.info(f"Admin {message.from_user.id} set profiling of {action} to {count} job(s).")
+    if count:
+        await message.answer(
+            f"Профилирование включено для следующих {count} задач ({', '.join(engines)}). "
+            "Результаты: /profile status"
+        )
+    else:
+        await message.answer("Профилирование отключено.")
@@ -1,8 +1,7 @@
 import asyncio
-import functools
-import io
 import logging
 import time
+from typing import TYPE_CHECKING, Optional
 from aiogram import Bot, Router, F
 from aiogram.filters import Command, StateFilter
 from aiogram.types import Message, CallbackQuery, BufferedInputFile
@@ -11,13 +10,26 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 
-from PIL import Image
-
-from app.cyclegan_engine import CycleGANEngine
+from app.image_encode import result_filename
+from app.job_store import JOB_KIND_CYCLEGAN, JobStore
+from app.result_cache import ResultCache
+from app.photo_cache import BoundedCache
+from app.metrics import stage_timer, track_request
 from app.handlers.common import cmd_start
 
-from .utils import format_duration
+from .utils import (
+    download_photo,
+    estimate_job,
+    format_duration,
+    format_eta,
+    run_deduplicated,
+    run_engine_call,
+    select_photo_size,
+    update_job,
+)
 
+if TYPE_CHECKING:
+    from app.cyclegan_engine import CycleGANEngine
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -31,7 +43,7 @@ class CycleGANStates(StatesGroup):
 
 @router.message(Command("cyclegan"))
 async def cmd_cyclegan_start(
-    message: Message, state: FSMContext, cyclegan_engine: CycleGANEngine
+    message: Message, state: FSMContext, cyclegan_engine: "CycleGANEngine"
 ):
     await state.clear()
 
@@ -75,8 +87,11 @@ async def cq_choose_style(callback: CallbackQuery, state: FSMContext):
 async def handle_photo_for_cyclegan(
     message: Message,
     state: FSMContext,
-    cyclegan_engine: CycleGANEngine,
+    cyclegan_engine: "CycleGANEngine",
     bot: Bot,
+    job_store: Optional[JobStore] = None,
+    result_cache: Optional[ResultCache] = None,
+    photo_cache: Optional[BoundedCache] = None,
 ):
     user_data = await state.get_data()
     style_code = user_data.get("chosen_style")
@@ -88,28 +103,48 @@ async def handle_photo_for_cyclegan(
         await state.clear()
         return
 
+    predicted_seconds, eta_seconds = estimate_job(cyclegan_engine, style_code)
+    wait_text = (
+        f"Ожидаемое время: {format_eta(eta_seconds)}"
+        if eta_seconds is not None
+        else "Это может занять несколько секунд."
+    )
     processing_msg = await message.answer(
-        "Принял фото. Начинаю творить магию... ✨\nЭто может занять несколько секунд.",
+        f"Принял фото. Начинаю творить магию... ✨\n{wait_text}",
         reply_markup=get_cancel_cyclegan_keyboard(),
     )
 
-    try:
-        photo_bio = io.BytesIO()
-        await bot.download(message.photo[-1].file_id, destination=photo_bio)
-        content_image = Image.open(photo_bio)
+    photo = select_photo_size(message.photo, cyclegan_engine.working_size)
+    photo_file_id = photo.file_id
+    cache_key = (
+        JOB_KIND_CYCLEGAN,
+        photo.file_unique_id,
+        style_code,
+        cyclegan_engine.working_size,
+    )
+    job_id = None
 
-        loop = asyncio.get_running_loop()
+    async def stylize_and_send() -> str:
+        with stage_timer(JOB_KIND_CYCLEGAN, "download"):
+            image_bytes = await download_photo(
+                bot, photo_file_id, photo_cache, photo.file_unique_id
+            )
+
+        if job_id:
+            await update_job(job_store.mark_running, job_id)
         start_time = time.monotonic()
 
-        func_to_run = functools.partial(
-            cyclegan_engine.stylize, image=content_image, style_name=style_code
+        with stage_timer(JOB_KIND_CYCLEGAN, "inference"):
+            result_bytes = await run_engine_call(
+                cyclegan_engine.stylize_bytes,
+                image_bytes=image_bytes,
+                style_name=style_code,
+                cache_key=photo.file_unique_id,
+                predicted_seconds=predicted_seconds,
+            )
+        file_to_send = BufferedInputFile(
+            result_bytes, filename=result_filename(result_bytes)
         )
-        result_image = await loop.run_in_executor(None, func_to_run)
-
-        result_bio = io.BytesIO()
-        result_image.save(result_bio, format="JPEG")
-        result_bio.seek(0)
-        file_to_send = BufferedInputFile(result_bio.read(), filename="result.jpg")
 
         duration_str = format_duration(start_time)
         final_caption = (
@@ -118,9 +153,39 @@ async def handle_photo_for_cyclegan(
             "Для начала нового сеанса введите /start"
         )
 
-        await message.answer_photo(photo=file_to_send, caption=final_caption)
+        with stage_timer(JOB_KIND_CYCLEGAN, "send"):
+            sent = await message.answer_photo(photo=file_to_send, caption=final_caption)
+        return sent.photo[-1].file_id
+
+    try:
+        if job_store is not None:
+            job_id = await asyncio.to_thread(
+                job_store.add,
+                JOB_KIND_CYCLEGAN,
+                chat_id=message.chat.id,
+                user_id=message.from_user.id,
+                inputs={"content_file_id": photo_file_id},
+                params={"style": style_code},
+            )
+        with track_request(JOB_KIND_CYCLEGAN):
+            cached_file_id = await run_deduplicated(
+                result_cache, cache_key, message.chat.id, stylize_and_send
+            )
+        if cached_file_id is not None:
+            await message.answer_photo(
+                photo=cached_file_id,
+                caption=(
+                    f"Готово! Ваш шедевр в стиле «{style_code}»\n"
+                    "⚡ Такой результат уже был готов, отправляю сразу.\n\n"
+                    "Для начала нового сеанса введите /start"
+                ),
+            )
+        if job_id:
+            await update_job(job_store.mark_done, job_id)
 
     except Exception as e:
+        if job_id:
+            await update_job(job_store.mark_failed, job_id, str(e))
         print(f"Error during CycleGAN stylization: {e}")
         await message.answer(
             "Ой, что-то пошло не так во время обработки. Попробуйте другое фото или начните заново."
@@ -1,10 +1,8 @@
 import asyncio
-import functools
 import logging
 import time
-import os
-import uuid
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 from aiogram import Router, F, Bot
 from aiogram.filters import Command, StateFilter
@@ -14,15 +12,66 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from app.nst_engine import NSTEngine, NSTModelNotInitializedError
+from app.engines import NSTModelNotInitializedError
 from app.nst_config import nst_params
+from app.image_encode import result_filename
+from app.job_store import JOB_KIND_NST, JobStore
+from app.result_cache import ResultCache
+from app.photo_cache import BoundedCache
+from app.image_store import InputImageStore
+from app.image_decode import ImageTooLargeError
+from app.metrics import stage_timer, track_request
 
 from .common import cmd_start as common_cmd_start
-from .utils import format_duration
+from .utils import (
+    download_photo,
+    estimate_job,
+    format_duration,
+    format_eta,
+    run_deduplicated,
+    run_engine_call,
+    select_photo_size,
+    update_job,
+)
+
+if TYPE_CHECKING:
+    from app.nst_engine import NSTEngine
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+# Uploaded style images waiting for the content image, one per user
+style_image_store: Optional[InputImageStore] = (
+    InputImageStore(
+        max_bytes=nst_params.INPUT_CACHE_MAX_BYTES,
+        spill_threshold=nst_params.INPUT_SPILL_THRESHOLD_BYTES,
+        spill_dir=nst_params.TEMP_IMAGE_DIR,
+        ttl=nst_params.INPUT_CACHE_TTL,
+    )
+    if nst_params
+    else None
+)
+
+
+# Background style preparations, referenced so they are not garbage collected
+_style_preparations: set[asyncio.Task] = set()
+
+
+async def _prepare_style(nst_engine: "NSTEngine", style_bytes: bytes, style_key: str):
+    try:
+        await run_engine_call(nst_engine.prepare_style, style_bytes, style_key)
+    except Exception as e:
+        # Only an optimization: the content handler computes the style itself
+        logger.warning(f"Speculative preparation of style {style_key} failed: {e}")
+
+
+def _schedule_style_preparation(
+    nst_engine: "NSTEngine", style_bytes: bytes, style_key: str
+) -> None:
+    task = asyncio.create_task(_prepare_style(nst_engine, style_bytes, style_key))
+    _style_preparations.add(task)
+    task.add_done_callback(_style_preparations.discard)
+
 
 # FSM for NST
 class NSTStates(StatesGroup):
@@ -32,7 +81,7 @@ class NSTStates(StatesGroup):
 
 
 @router.message(Command("nst"))
-async def cmd_nst_start(message: Message, state: FSMContext, nst_engine: NSTEngine):
+async def cmd_nst_start(message: Message, state: FSMContext, nst_engine: "NSTEngine"):
     await state.clear()
 
     builder = InlineKeyboardBuilder()
@@ -93,7 +142,9 @@ async def cb_default_style(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(NSTStates.waiting_for_style_upload, F.photo)
-async def nst_style_image_uploaded(message: Message, state: FSMContext, bot: Bot):
+async def nst_style_image_uploaded(
+    message: Message, state: FSMContext, bot: Bot, nst_engine: "NSTEngine"
+):
     if not message.photo:
         await message.answer(
             "Пожалуйста, отправьте картинку (не файл).",
@@ -101,17 +152,12 @@ async def nst_style_image_uploaded(message: Message, state: FSMContext, bot: Bot
         )
         return
 
-    photo_file_id = message.photo[-1].file_id
-
-    # Saving the image to a temporary file
-    file_info = await bot.get_file(photo_file_id)
-    file_ext = Path(file_info.file_path).suffix or ".jpg"
-    temp_style_filename = f"style_{message.from_user.id}_{uuid.uuid4().hex}{file_ext}"
-    temp_style_path = nst_params.TEMP_IMAGE_DIR / temp_style_filename
+    style_photo = select_photo_size(message.photo, nst_engine.working_size)
+    photo_file_id = style_photo.file_id
 
+    # Keeping the image in memory until the content image arrives
     try:
-        await bot.download_file(file_info.file_path, destination=str(temp_style_path))
-        logger.info(f"Style image saved to: {temp_style_path}")
+        style_bytes = await download_photo(bot, photo_file_id)
     except Exception as e:
         logger.error(f"Error downloading style image: {e}")
         await message.answer(
@@ -120,8 +166,17 @@ async def nst_style_image_uploaded(message: Message, state: FSMContext, bot: Bot
         )
         return
 
+    if style_image_store is not None:
+        await style_image_store.put(message.from_user.id, style_bytes)
+    logger.info(f"Style image received: {len(style_bytes)} bytes")
+
+    # The user needs a while to pick the content photo; prepare the style now
+    _schedule_style_preparation(nst_engine, style_bytes, style_photo.file_unique_id)
+
     await state.update_data(
-        style_image_path=str(temp_style_path), style_is_default=False
+        style_file_id=photo_file_id,
+        style_file_unique_id=style_photo.file_unique_id,
+        style_is_default=False,
     )
     await state.set_state(NSTStates.waiting_for_content_image)
     await message.answer(
@@ -143,54 +198,97 @@ async def nst_style_image_invalid_upload(message: Message):
 
 @router.message(NSTStates.waiting_for_content_image, F.photo)
 async def nst_content_image_received(
-    message: Message, state: FSMContext, bot: Bot, nst_engine: NSTEngine
+    message: Message,
+    state: FSMContext,
+    bot: Bot,
+    nst_engine: "NSTEngine",
+    job_store: Optional[JobStore] = None,
+    result_cache: Optional[ResultCache] = None,
+    photo_cache: Optional[BoundedCache] = None,
 ):
     # 1. Получаем данные из FSM
     user_data = await state.get_data()
     style_image_path = user_data.get("style_image_path")
+    style_file_id = user_data.get("style_file_id")
     style_is_default = user_data.get("style_is_default", False)
 
-    if not style_image_path:
-        logger.error("Style image path not found in state data!")
+    if not style_image_path and not style_file_id:
+        logger.error("Style image not found in state data!")
         await message.answer(
             "Произошла внутренняя ошибка (не найден путь к стилю). Пожалуйста, начните заново /nst."
         )
         await state.clear()
         return
 
-    # 2. Сообщаем пользователю о начале работы
-    processing_msg = await message.answer(
-        "Контент принят! ✨ Начинаю творить магию... \nЭто может занять некоторое время. ⏳"
+    content_photo = select_photo_size(message.photo, nst_engine.working_size)
+    content_photo_file_id = content_photo.file_id
+
+    # Same content, style and resolution give the same picture
+    style_identity = (
+        f"default:{Path(style_image_path).name}"
+        if style_is_default
+        else user_data.get("style_file_unique_id")
     )
+    cache_key = None
+    if style_identity:
+        cache_key = (
+            JOB_KIND_NST,
+            content_photo.file_unique_id,
+            style_identity,
+            nst_engine.working_size,
+        )
 
-    # 3. Объявляем переменные, которые понадобятся в `finally`
-    temp_content_path = None
+    # 2. Сообщаем пользователю о начале работы и ожидаемом времени
+    predicted_seconds, eta_seconds = estimate_job(nst_engine, style_identity)
+    wait_text = (
+        f"Ожидаемое время: {format_eta(eta_seconds)} ⏳"
+        if eta_seconds is not None
+        else "Это может занять некоторое время. ⏳"
+    )
+    processing_msg = await message.answer(
+        f"Контент принят! ✨ Начинаю творить магию... \n{wait_text}"
+    )
 
-    try:
-        # 4. Скачиваем изображение контента
-        content_photo_file_id = message.photo[-1].file_id
-        file_info = await bot.get_file(content_photo_file_id)
-        file_ext = Path(file_info.file_path).suffix or ".jpg"
-        temp_content_filename = (
-            f"content_{message.from_user.id}_{uuid.uuid4().hex}{file_ext}"
-        )
-        temp_content_path = nst_params.TEMP_IMAGE_DIR / temp_content_filename
+    job_id = None
+
+    async def stylize_and_send() -> str:
+        # 4. Получаем стиль и скачиваем контент прямо в память
+        with stage_timer(JOB_KIND_NST, "download"):
+            if style_is_default:
+                style_source = style_image_path
+            else:
+                style_source = (
+                    style_image_store.get(message.from_user.id)
+                    if style_image_store is not None
+                    else None
+                )
+                if style_source is None:
+                    # Evicted, expired or stored by another worker: fetch it again
+                    style_source = await download_photo(bot, style_file_id)
 
-        await bot.download_file(file_info.file_path, destination=str(temp_content_path))
-        logger.info(f"Content image saved to: {temp_content_path}")
+            content_bytes = await download_photo(
+                bot, content_photo_file_id, photo_cache, content_photo.file_unique_id
+            )
 
         # 5. Запускаем "тяжелую" операцию
-        loop = asyncio.get_running_loop()
+        if job_id:
+            await update_job(job_store.mark_running, job_id)
         start_time = time.monotonic()
 
-        func_to_run = functools.partial(
-            nst_engine.process_images, style_image_path, str(temp_content_path)
-        )
-        stylized_image_bytes = await loop.run_in_executor(None, func_to_run)
+        with stage_timer(JOB_KIND_NST, "inference"):
+            stylized_image_bytes = await run_engine_call(
+                nst_engine.process_images,
+                style_source,
+                content_bytes,
+                content_key=content_photo.file_unique_id,
+                style_key=style_identity,
+                predicted_seconds=predicted_seconds,
+            )
 
         # 6. Готовим и отправляем результат
         result_photo = BufferedInputFile(
-            stylized_image_bytes, filename="stylized_result.jpg"
+            stylized_image_bytes,
+            filename=result_filename(stylized_image_bytes, "stylized_result"),
         )
         duration_str = format_duration(start_time)  # Используем утилиту
         final_caption = (
@@ -199,20 +297,67 @@ async def nst_content_image_received(
             "Для начала нового сеанса введите /start"
         )
 
-        await message.answer_photo(result_photo, caption=final_caption)
+        with stage_timer(JOB_KIND_NST, "send"):
+            sent = await message.answer_photo(result_photo, caption=final_caption)
+        return sent.photo[-1].file_id
+
+    try:
+        # Записываем задачу, чтобы она пережила перезапуск бота
+        if job_store is not None:
+            job_id = await asyncio.to_thread(
+                job_store.add,
+                JOB_KIND_NST,
+                chat_id=message.chat.id,
+                user_id=message.from_user.id,
+                inputs={
+                    "style_path": style_image_path,
+                    "style_file_id": style_file_id,
+                    "content_file_id": content_photo_file_id,
+                },
+            )
+        with track_request(JOB_KIND_NST):
+            cached_file_id = await run_deduplicated(
+                result_cache, cache_key, message.chat.id, stylize_and_send
+            )
+        if cached_file_id is not None:
+            await message.answer_photo(
+                cached_file_id,
+                caption=(
+                    "Готово! Вот ваш стилизованный шедевр. 🖼️\n\n"
+                    "⚡ Такой результат уже был готов, отправляю сразу.\n\n"
+                    "Для начала нового сеанса введите /start"
+                ),
+            )
+        if job_id:
+            await update_job(job_store.mark_done, job_id)
 
     except NSTModelNotInitializedError:
+        if job_id:
+            await update_job(
+                job_store.mark_failed, job_id, "NST engine is not initialized."
+            )
         logger.error("NST engine was not initialized when called.")
         await message.answer(
             "Ошибка инициализации сервиса стилизации. Пожалуйста, попробуйте позже."
         )
+    except ImageTooLargeError as e:
+        if job_id:
+            await update_job(job_store.mark_failed, job_id, str(e))
+        logger.warning(f"Rejected NST input: {e}")
+        await message.answer(
+            "Изображение слишком большое. Пожалуйста, отправьте фото поменьше."
+        )
     except RuntimeError as e:
+        if job_id:
+            await update_job(job_store.mark_failed, job_id, str(e))
         logger.error(f"NST Runtime Error: {e}", exc_info=True)
         await message.answer(
             f"К сожалению, во время стилизации произошла ошибка: {e}. "
             "Попробуйте другие изображения."
         )
     except Exception as e:
+        if job_id:
+            await update_job(job_store.mark_failed, job_id, str(e))
         logger.error(
             f"Error during NST processing or sending result: {e}", exc_info=True
         )
@@ -230,25 +375,9 @@ async def nst_content_image_received(
             except Exception:
                 pass  # Игнорируем ошибки при удалении сообщения
 
-        # Очищаем временный файл с контентом, если он был создан
-        if temp_content_path and Path(temp_content_path).exists():
-            try:
-                os.remove(temp_content_path)
-                logger.info(f"Removed temporary content image: {temp_content_path}")
-            except OSError as e:
-                logger.error(f"Error removing temporary content image: {e}")
-
-        # Очищаем временный файл со стилем, только если он был загружен пользователем
-        if (
-            not style_is_default
-            and style_image_path
-            and Path(style_image_path).exists()
-        ):
-            try:
-                os.remove(style_image_path)
-                logger.info(f"Removed temporary style image: {style_image_path}")
-            except OSError as e:
-                logger.error(f"Error removing temporary style image: {e}")
+        # Загруженный пользователем стиль больше не нужен
+        if style_image_store is not None:
+            style_image_store.discard(message.from_user.id)
 
         await state.clear()
 
@@ -300,29 +429,8 @@ async def cancel_nst_operation(
         f"Cancelling state {current_state} for user {message_or_callback.from_user.id}"
     )
 
-    user_data = await state.get_data()
-    style_img_path = user_data.get("style_image_path")
-    content_img_path = user_data.get("content_image_path")
-
-    if (
-        style_img_path
-        and not user_data.get("style_is_default", False)
-        and Path(style_img_path).exists()
-    ):
-        try:
-            os.remove(style_img_path)
-            logger.info(f"Removed temporary style image: {style_img_path}")
-        except OSError as e:
-            logger.error(f"Error removing temporary style image {style_img_path}: {e}")
-
-    if content_img_path and Path(content_img_path).exists():
-        try:
-            os.remove(content_img_path)
-            logger.info(f"Removed temporary content image: {content_img_path}")
-        except OSError as e:
-            logger.error(
-                f"Error removing temporary content image {content_img_path}: {e}"
-            )
+    if style_image_store is not None:
+        style_image_store.discard(message_or_callback.from_user.id)
 
     await state.clear()
 
@@ -1,4 +1,21 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import io
+import logging
+import sqlite3
 import time
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.types import PhotoSize
+
+from app.photo_cache import BoundedCache
+from app.result_cache import ResultCache
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
 
 
 def format_duration(start_time: float) -> str:
@@ -8,3 +25,131 @@ def format_duration(start_time: float) -> str:
     if minutes > 0:
         return f"{minutes} мин. {seconds} сек."
     return f"{seconds} сек."
+
+
+class _ContextPartial(functools.partial):
+    """functools.partial that runs in the context it was created in."""
+
+    def __new__(cls, func, /, *args, **kwargs):
+        self = super().__new__(cls, func, *args, **kwargs)
+        self.context = contextvars.copy_context()
+        return self
+
+    def __call__(self, /, *args, **kwargs):
+        return self.context.run(super().__call__, *args, **kwargs)
+
+
+async def run_engine_call(func, *args, predicted_seconds=None, **kwargs):
+    """Runs an engine method without blocking the event loop.
+
+    Local engines are synchronous and go to the engine's own worker pool
+    (or the loop's default executor); remote engine proxies
+    (see app.inference_client) are awaited directly. The caller's context
+    goes with the call, so engine trace spans land in the request's trace.
+    ``predicted_seconds`` is the call's expected duration, for worker pools
+    that schedule shortest or earliest-deadline jobs first.
+    """
+    if inspect.iscoroutinefunction(func):
+        return await func(*args, **kwargs)
+    executor = getattr(getattr(func, "__self__", None), "executor", None)
+    loop = asyncio.get_running_loop()
+    func_to_run = _ContextPartial(func, *args, **kwargs)
+    submit_job = getattr(executor, "submit_job", None)
+    if predicted_seconds is not None and submit_job is not None:
+        return await asyncio.wrap_future(submit_job(func_to_run, predicted_seconds))
+    return await loop.run_in_executor(executor, func_to_run)
+
+
+async def update_job(update: Callable[..., None], job_id: str, *args) -> None:
+    """Records a job status change (a JobStore method) off the event loop.
+
+    The job row only matters for resuming after a restart, so a store that
+    stays locked past its busy timeout is logged, not reported to the user.
+    """
+    try:
+        await asyncio.to_thread(update, job_id, *args)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to update job {job_id} ({update.__name__}): {e}")
+
+
+def estimate_job(engine, style=None) -> tuple[Optional[float], Optional[float]]:
+    """(predicted job seconds, ETA seconds including the queue), None if unknown.
+
+    Only local engines with timing history can predict (see app.timing).
+    """
+    predict = getattr(engine, "predict_duration", None)
+    predicted = predict(style) if predict is not None else None
+    if predicted is None:
+        return None, None
+    executor = getattr(engine, "executor", None)
+    expected_wait = getattr(executor, "expected_wait", None)
+    wait = expected_wait(predicted) if expected_wait is not None else 0.0
+    return predicted, wait + predicted
+
+
+def format_eta(seconds: float) -> str:
+    """Rounded-up estimate for users: "~40 сек.", "~3 мин."."""
+    if seconds < 60:
+        return f"~{max(5, int(-(-seconds // 5) * 5))} сек."
+    return f"~{int(-(-seconds // 60))} мин."
+
+
+async def download_photo(
+    bot: Bot,
+    file_id: str,
+    cache: Optional[BoundedCache] = None,
+    file_unique_id: Optional[str] = None,
+) -> bytes:
+    """Downloads a Telegram file straight into memory.
+
+    With a cache, the bytes are kept under ``file_unique_id`` so the same
+    photo tried with another style is not downloaded again.
+    """
+    if cache is not None and file_unique_id:
+        data = cache.get(file_unique_id)
+        if data is not None:
+            return data
+    # bot.download resolves the file path (getFile) and fetches the bytes
+    with span("telegram.download") as download_span:
+        photo_bio = io.BytesIO()
+        await bot.download(file_id, destination=photo_bio)
+        data = photo_bio.getvalue()
+        download_span.set_attribute("bytes", len(data))
+    if cache is not None and file_unique_id:
+        cache.put(file_unique_id, data)
+    return data
+
+
+def select_photo_size(
+    photo_sizes: list[PhotoSize], min_side: Optional[int]
+) -> PhotoSize:
+    """Picks the smallest photo variant whose shorter side covers ``min_side``.
+
+    Engines downscale inputs to their working resolution anyway, so a larger
+    variant only costs download bytes and decode time. Falls back to the
+    largest variant when none is big enough or the size is unknown.
+    """
+    largest = max(photo_sizes, key=lambda p: p.width * p.height)
+    if not min_side:
+        return largest
+    covering = [p for p in photo_sizes if min(p.width, p.height) >= min_side]
+    if not covering:
+        return largest
+    return min(covering, key=lambda p: p.width * p.height)
+
+
+async def run_deduplicated(
+    result_cache: Optional[ResultCache],
+    key,
+    chat_id: int,
+    produce: Callable[[], Awaitable[Optional[str]]],
+) -> Optional[str]:
+    """Runs ``produce`` through the result cache when one is configured.
+
+    Returns the file_id of an earlier identical result that still has to be
+    sent to ``chat_id``, or None if nothing is left to send.
+    """
+    if result_cache is None:
+        await produce()
+        return None
+    return await result_cache.run(key, chat_id, produce)
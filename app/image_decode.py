@@ -0,0 +1,68 @@
+import io
+import logging
+from pathlib import Path
+from typing import Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ImageSource = Union[str, Path, bytes, bytearray, memoryview]
+
+# Telegram photos are at most 2560 px on a side; anything far beyond that is
+# a crafted file or a document sent by mistake.
+DEFAULT_MAX_PIXELS = 40_000_000
+
+# Modes Image.reduce works on; the rest is converted to RGB first
+_REDUCIBLE_MODES = ("L", "LA", "RGB", "RGBA")
+
+
+class ImageTooLargeError(ValueError):
+    pass
+
+
+def _open(source: ImageSource) -> Image.Image:
+    if isinstance(source, (str, Path)):
+        return Image.open(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    raise ValueError("Image source must be a file path (str/Path) or bytes.")
+
+
+def decode_image(
+    source: ImageSource,
+    target_size: int,
+    max_pixels: int = DEFAULT_MAX_PIXELS,
+) -> Image.Image:
+    """Decodes an image to RGB at roughly ``target_size`` on the shorter side.
+
+    Only the header is parsed before the size check, so oversized images are
+    rejected without allocating a pixel buffer. JPEGs are decoded directly at
+    1/2, 1/4 or 1/8 scale via DCT scaling (``Image.draft``); other formats are
+    shrunk with ``Image.reduce``. Both steps keep each side at least
+    ``target_size`` so the final resample done by the engine is unchanged.
+    """
+    try:
+        image = _open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image of {width}x{height} px exceeds the limit of {max_pixels} pixels."
+        )
+
+    if image.format == "JPEG":
+        image.draft("RGB", (target_size, target_size))
+    else:
+        factor = min(width, height) // target_size
+        if factor >= 2:
+            if image.mode not in _REDUCIBLE_MODES:
+                # reduce() rejects palette, 1-bit and 16-bit images
+                image = image.convert("RGB")
+            image = image.reduce(factor)
+
+    if image.size != (width, height):
+        logger.debug(f"Decoded {width}x{height} image at {image.size[0]}x{image.size[1]}")
+    return image.convert("RGB")
@@ -0,0 +1,121 @@
+import io
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ("JPEG", "WEBP", "PNG")
+
+_CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+
+@dataclass(frozen=True)
+class OutputEncoderConfig:
+    """How stylized results are encoded before they are sent to Telegram.
+
+    ``max_bytes`` enables the size target: quality is binary-searched between
+    ``min_quality`` and ``quality`` for the best result that fits. ``quality``
+    and ``max_bytes`` do not apply to PNG.
+    """
+
+    format: str = "JPEG"
+    quality: int = 75
+    progressive: bool = False
+    subsampling: str = "4:2:0"
+    optimize: bool = False
+    webp_method: int = 4
+    max_bytes: Optional[int] = None
+    min_quality: int = 40
+
+    def __post_init__(self):
+        fmt = self.format.upper()
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(
+                f"Unsupported output format '{self.format}'. "
+                f"Use one of: {', '.join(SUPPORTED_FORMATS)}"
+            )
+        object.__setattr__(self, "format", fmt)
+        if not 1 <= self.min_quality <= self.quality <= 100:
+            raise ValueError("Output quality must satisfy 1 <= MIN_QUALITY <= QUALITY <= 100")
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "OutputEncoderConfig":
+        data = data or {}
+        max_bytes = data.get("MAX_BYTES")
+        return cls(
+            format=str(data.get("FORMAT", "JPEG")),
+            quality=int(data.get("QUALITY", 75)),
+            progressive=bool(data.get("PROGRESSIVE", False)),
+            subsampling=str(data.get("SUBSAMPLING", "4:2:0")),
+            optimize=bool(data.get("OPTIMIZE", False)),
+            webp_method=int(data.get("WEBP_METHOD", 4)),
+            max_bytes=int(max_bytes) if max_bytes else None,
+            min_quality=int(data.get("MIN_QUALITY", 40)),
+        )
+
+
+def _save(image: Image.Image, config: OutputEncoderConfig, quality: int) -> bytes:
+    if config.format == "JPEG":
+        options = {
+            "quality": quality,
+            "progressive": config.progressive,
+            "subsampling": config.subsampling,
+            "optimize": config.optimize,
+        }
+    elif config.format == "WEBP":
+        options = {"quality": quality, "method": config.webp_method}
+    else:
+        options = {"optimize": config.optimize}
+    result_bio = io.BytesIO()
+    image.save(result_bio, format=config.format, **options)
+    return result_bio.getvalue()
+
+
+def encode_image(image: Image.Image, config: OutputEncoderConfig) -> bytes:
+    data = _save(image, config, config.quality)
+    if not config.max_bytes or len(data) <= config.max_bytes or config.format == "PNG":
+        return data
+
+    # Largest quality that still fits into max_bytes
+    best = None
+    low, high = config.min_quality, config.quality - 1
+    while low <= high:
+        quality = (low + high) // 2
+        candidate = _save(image, config, quality)
+        if len(candidate) <= config.max_bytes:
+            best = candidate
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    if best is None:
+        best = _save(image, config, config.min_quality)
+    if len(best) > config.max_bytes:
+        logger.warning(
+            f"Result is {len(best)} bytes even at quality {config.min_quality}, "
+            f"above the {config.max_bytes} bytes target."
+        )
+    return best
+
+
+def _detect_format(data: bytes) -> str:
+    if data[:3] == b"\xff\xd8\xff":
+        return "JPEG"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "PNG"
+    return "JPEG"
+
+
+def content_type_for(data: bytes) -> str:
+    return _CONTENT_TYPES[_detect_format(data)]
+
+
+def result_filename(data: bytes, stem: str = "result") -> str:
+    """File name with an extension matching the encoded bytes."""
+    return f"{stem}.{_EXTENSIONS[_detect_format(data)]}"
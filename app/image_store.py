@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    data: Optional[bytes]
+    path: Optional[Path]
+    created_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.data) if self.data is not None else 0
+
+
+class InputImageStore:
+    """Bounded per-user store for uploaded images waiting for the next step.
+
+    Each user holds at most one image (a new upload replaces the old one).
+    Images are kept in memory; only payloads above ``spill_threshold`` bytes
+    are written to ``spill_dir``. When the memory budget or TTL is exceeded the
+    oldest entries are dropped, and callers fall back to re-downloading the
+    image from Telegram by its file_id.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        spill_threshold: int,
+        spill_dir: Path,
+        ttl: float = 3600.0,
+    ):
+        self.max_bytes = max_bytes
+        self.spill_threshold = spill_threshold
+        self.spill_dir = Path(spill_dir)
+        self.ttl = ttl
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._memory_bytes = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def put(self, owner: int, data: bytes) -> None:
+        self.discard(owner)
+        if len(data) > self.spill_threshold:
+            path = self.spill_dir / f"input_{owner}_{uuid.uuid4().hex}.bin"
+            # Large photos take a while to write; keep the event loop free
+            await asyncio.to_thread(self._spill, path, data)
+            logger.info(f"Input image of {len(data)} bytes spilled to {path}")
+            # Another upload of the same user may have landed meanwhile
+            self.discard(owner)
+            now = time.monotonic()
+            self._entries[owner] = _Entry(data=None, path=path, created_at=now)
+        else:
+            now = time.monotonic()
+            self._entries[owner] = _Entry(data=data, path=None, created_at=now)
+            self._memory_bytes += len(data)
+        self._evict(now)
+
+    def _spill(self, path: Path, data: bytes) -> None:
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def get(self, owner: int) -> Optional[Union[bytes, Path]]:
+        entry = self._entries.get(owner)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl:
+            self.discard(owner)
+            return None
+        self._entries.move_to_end(owner)
+        if entry.path is not None:
+            if not entry.path.exists():
+                self.discard(owner)
+                return None
+            return entry.path
+        return entry.data
+
+    def discard(self, owner: int) -> None:
+        entry = self._entries.pop(owner, None)
+        if entry is None:
+            return
+        self._memory_bytes -= entry.size
+        if entry.path is not None:
+            try:
+                entry.path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.error(f"Error removing spilled input image {entry.path}: {e}")
+
+    def _evict(self, now: float) -> None:
+        for owner in [o for o, e in self._entries.items() if now - e.created_at > self.ttl]:
+            self.discard(owner)
+        while self._memory_bytes > self.max_bytes and self._entries:
+            oldest_owner = next(iter(self._entries))
+            logger.info(f"Input image store is full, dropping image of {oldest_owner}")
+            self.discard(oldest_owner)
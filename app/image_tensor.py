@@ -0,0 +1,99 @@
+import threading
+import warnings
+from typing import Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.image_encode import OutputEncoderConfig, encode_image
+
+
+class ImageTensorCodec:
+    """Converts between decoded RGB images and model tensors without Compose.
+
+    Built once per engine. Input goes uint8 HWC buffer -> NCHW float in a
+    single fused ``x * scale + bias`` (``scale = 1 / (255 * std)``,
+    ``bias = -mean / std``); output applies the inverse and rounds straight to
+    uint8 before encoding. On CUDA devices the host-side float buffer is a
+    reusable pinned tensor, one per worker thread and image shape.
+    """
+
+    def __init__(
+        self,
+        device: torch.device,
+        mean: Optional[Sequence[float]] = None,
+        std: Optional[Sequence[float]] = None,
+        pin_memory: Optional[bool] = None,
+    ):
+        self.device = torch.device(device)
+        mean_t = torch.tensor(mean if mean is not None else [0.0, 0.0, 0.0])
+        std_t = torch.tensor(std if std is not None else [1.0, 1.0, 1.0])
+        self._scale = (1.0 / (255.0 * std_t)).view(3, 1, 1)
+        self._bias = (-mean_t / std_t).view(3, 1, 1)
+        self._out_scale = (255.0 * std_t).view(3, 1, 1).to(self.device)
+        self._out_bias = (255.0 * mean_t).view(3, 1, 1).to(self.device)
+        if pin_memory is None:
+            pin_memory = self.device.type == "cuda"
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+        self._local = threading.local()
+
+    @staticmethod
+    def resize(image: Image.Image, size: int, center_crop: bool = False) -> Image.Image:
+        """Resizes to ``size`` x ``size`` in one resample.
+
+        With ``center_crop`` the shorter side is scaled to ``size`` and the
+        centre is kept (Resize + CenterCrop); otherwise the image is squashed.
+        """
+        width, height = image.size
+        box = None
+        if center_crop:
+            side = min(width, height)
+            left = (width - side) / 2
+            top = (height - side) / 2
+            box = (left, top, left + side, top + side)
+        if box is None and image.size == (size, size):
+            return image
+        return image.resize((size, size), Image.Resampling.BILINEAR, box=box)
+
+    def _host_buffer(self, shape: tuple) -> torch.Tensor:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get(shape)
+        if buffer is None:
+            buffer = torch.empty(shape, dtype=torch.float32, pin_memory=True)
+            buffers[shape] = buffer
+        return buffer
+
+    def to_tensor(self, image: Image.Image) -> torch.Tensor:
+        """RGB image -> normalized float tensor of shape (1, 3, H, W) on the device."""
+        array = np.asarray(image.convert("RGB"))
+        with warnings.catch_warnings():
+            # The array is read-only; the view below is only ever read from
+            warnings.simplefilter("ignore", UserWarning)
+            chw = torch.from_numpy(array).permute(2, 0, 1)  # uint8 view, no copy
+        if self.pin_memory:
+            out = self._host_buffer(tuple(chw.shape))
+        else:
+            out = torch.empty(chw.shape, dtype=torch.float32)
+        torch.addcmul(self._bias, chw, self._scale, out=out)
+        tensor = out.unsqueeze(0)
+        if self.device.type != "cpu":
+            # A pinned buffer is reused by the next request of this thread,
+            # so the copy must finish before returning.
+            tensor = tensor.to(self.device, non_blocking=False)
+        return tensor
+
+    def to_uint8(self, tensor: torch.Tensor) -> np.ndarray:
+        """Normalized (1, 3, H, W) tensor -> HWC uint8 array."""
+        chw = tensor.detach().squeeze(0)
+        pixels = torch.addcmul(self._out_bias, chw, self._out_scale)
+        pixels = pixels.round_().clamp_(0, 255).to(torch.uint8)
+        return pixels.permute(1, 2, 0).cpu().numpy()
+
+    def to_image(self, tensor: torch.Tensor) -> Image.Image:
+        return Image.fromarray(self.to_uint8(tensor))
+
+    def encode(self, tensor: torch.Tensor, encoder: OutputEncoderConfig) -> bytes:
+        return encode_image(self.to_image(tensor), encoder)
@@ -0,0 +1,353 @@
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+
+from app.shm_transport import SharedBufferPool
+from app.tracing import TRACEPARENT_HEADER, traceparent
+
+logger = logging.getLogger(__name__)
+
+UNIX_URL_PREFIX = "unix:"
+
+
+class InferenceServiceError(RuntimeError):
+    pass
+
+
+class InferenceBackend:
+    """One inference server instance with its own pooled session."""
+
+    def __init__(self, url: str, pool_size: int, timeout: float):
+        self.url = url
+        self.is_unix_socket = url.startswith(UNIX_URL_PREFIX)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.healthy = True
+        self.in_flight = 0
+        self.session: Optional[aiohttp.ClientSession] = None
+
+        if self.is_unix_socket:
+            self.socket_path = "/" + url[len(UNIX_URL_PREFIX):].lstrip("/")
+            self.base_url = "http://localhost"
+        else:
+            self.socket_path = None
+            self.base_url = url.rstrip("/")
+
+    def open(self) -> None:
+        if self.is_unix_socket:
+            connector = aiohttp.UnixConnector(
+                path=self.socket_path, limit=self.pool_size
+            )
+        else:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class InferenceClient:
+    """Client for app.inference_server with pooling and load balancing.
+
+    Requests go to the healthy backend with the fewest in-flight jobs
+    (round-robin between equals). A backend that fails a request or a health
+    check is skipped until the next successful health check.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        pool_size: int = 8,
+        timeout: float = 600.0,
+        health_interval: float = 10.0,
+        use_shared_memory: bool = False,
+    ):
+        if not urls:
+            raise ValueError("At least one inference server URL is required.")
+        self.backends = [InferenceBackend(url, pool_size, timeout) for url in urls]
+        self.health_interval = health_interval
+        self.use_shared_memory = use_shared_memory
+        self.buffer_pool = SharedBufferPool() if use_shared_memory else None
+        self.styles: dict[str, dict[str, str]] = {"nst": {}, "cyclegan": {}}
+        self.working_sizes: dict[str, Optional[int]] = {"nst": None, "cyclegan": None}
+        self._round_robin = itertools.count()
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        for backend in self.backends:
+            backend.open()
+        await self.check_health()
+        await self.refresh_styles()
+        if self.health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        for backend in self.backends:
+            await backend.close()
+        if self.buffer_pool is not None:
+            self.buffer_pool.close()
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+            await self.refresh_styles()
+
+    async def _check_backend(self, backend: InferenceBackend) -> None:
+        try:
+            async with backend.session.get(f"{backend.base_url}/health") as resp:
+                healthy = resp.status == 200
+                if healthy:
+                    self._update_working_sizes(await resp.json())
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            healthy = False
+        if healthy != backend.healthy:
+            logger.warning(
+                f"Inference backend {backend.url} is now "
+                f"{'healthy' if healthy else 'unhealthy'}."
+            )
+        backend.healthy = healthy
+
+    def _update_working_sizes(self, health: dict) -> None:
+        # Backends may be configured differently; the largest size covers them all
+        for engine_name, size in (health.get("working_size") or {}).items():
+            if engine_name in self.working_sizes and size is not None:
+                current = self.working_sizes[engine_name]
+                self.working_sizes[engine_name] = max(size, current or 0)
+
+    async def check_health(self) -> bool:
+        await asyncio.gather(*(self._check_backend(b) for b in self.backends))
+        return any(b.healthy for b in self.backends)
+
+    async def refresh_styles(self) -> None:
+        for engine_name in ("nst", "cyclegan"):
+            try:
+                async with self._backend_slot() as backend:
+                    url = f"{backend.base_url}/styles/{engine_name}"
+                    async with backend.session.get(url) as resp:
+                        resp.raise_for_status()
+                        self.styles[engine_name] = await resp.json()
+            except (InferenceServiceError, aiohttp.ClientError) as e:
+                logger.warning(f"Could not refresh {engine_name} styles: {e}")
+
+    def _pick_backend(self, exclude: set) -> Optional[InferenceBackend]:
+        available = [b for b in self.backends if b.url not in exclude]
+        # If every backend looks down, still try one: health state may be stale.
+        candidates = [b for b in available if b.healthy] or available
+        if not candidates:
+            return None
+        least_loaded = min(b.in_flight for b in candidates)
+        candidates = [b for b in candidates if b.in_flight == least_loaded]
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    @asynccontextmanager
+    async def _backend_slot(self, exclude: Optional[set] = None):
+        backend = self._pick_backend(exclude or set())
+        if backend is None:
+            raise InferenceServiceError("No healthy inference servers.")
+        backend.in_flight += 1
+        try:
+            yield backend
+        finally:
+            backend.in_flight -= 1
+
+    async def _post_images(
+        self, path: str, images: dict[str, bytes], params: dict
+    ) -> bytes:
+        tried = set()
+        while True:
+            async with self._backend_slot(exclude=tried) as backend:
+                tried.add(backend.url)
+                try:
+                    return await self._post_to_backend(backend, path, images, params)
+                except asyncio.TimeoutError as e:
+                    # The job may still be running there; don't start a duplicate.
+                    raise InferenceServiceError(
+                        f"Inference server {backend.url} timed out."
+                    ) from e
+                except aiohttp.ClientConnectionError as e:
+                    logger.warning(
+                        f"Inference backend {backend.url} failed: {e}. Trying another."
+                    )
+                    backend.healthy = False
+                    if len(tried) >= len(self.backends):
+                        raise InferenceServiceError(
+                            f"All inference servers failed: {e}"
+                        ) from e
+
+    async def _post_to_backend(
+        self, backend: InferenceBackend, path: str, images: dict, params: dict
+    ) -> bytes:
+        url = f"{backend.base_url}{path}"
+        trace_context = traceparent()
+        headers = {TRACEPARENT_HEADER: trace_context} if trace_context else None
+        if self.buffer_pool is not None and backend.is_unix_socket:
+            descriptors = {
+                name: self.buffer_pool.put(data) for name, data in images.items()
+            }
+            try:
+                payload = {k: d.to_dict() for k, d in descriptors.items()}
+                payload.update(params)
+                async with backend.session.post(
+                    url, json=payload, headers=headers
+                ) as resp:
+                    return await self._read_result(resp)
+            finally:
+                for descriptor in descriptors.values():
+                    self.buffer_pool.release(descriptor)
+
+        form = aiohttp.FormData()
+        for name, data in images.items():
+            form.add_field(
+                name, data, filename=f"{name}.jpg", content_type="image/jpeg"
+            )
+        async with backend.session.post(
+            url, data=form, params=params, headers=headers
+        ) as resp:
+            return await self._read_result(resp)
+
+    @staticmethod
+    async def _read_result(resp: aiohttp.ClientResponse) -> bytes:
+        if not 200 <= resp.status < 300:
+            try:
+                error = (await resp.json()).get("error", resp.reason)
+            except (aiohttp.ContentTypeError, ValueError):
+                error = await resp.text()
+            raise InferenceServiceError(f"Inference server error: {error}")
+        return await resp.read()
+
+    async def process_images(
+        self,
+        style_image: bytes,
+        content_image: bytes,
+        content_key: Optional[str] = None,
+        style_key: Optional[str] = None,
+    ) -> bytes:
+        params = {
+            name: value
+            for name, value in (("content_key", content_key), ("style_key", style_key))
+            if value
+        }
+        return await self._post_images(
+            "/nst", {"style": style_image, "content": content_image}, params
+        )
+
+    async def prepare_style(self, style_image: bytes, style_key: str) -> None:
+        # With several backends the preparation helps only if the request
+        # later lands on the same one; it is a best-effort hint.
+        await self._post_images(
+            "/nst/prepare", {"style": style_image}, {"style_key": style_key}
+        )
+
+    async def _profile_request(self, method: str, params: dict) -> dict[str, dict]:
+        async def request(backend: InferenceBackend) -> dict:
+            url = f"{backend.base_url}/profile"
+            async with backend.session.request(method, url, params=params) as resp:
+                if resp.status != 200:
+                    await self._read_result(resp)
+                return await resp.json()
+
+        results = await asyncio.gather(
+            *(request(b) for b in self.backends), return_exceptions=True
+        )
+        statuses = {}
+        for backend, result in zip(self.backends, results):
+            if isinstance(result, BaseException):
+                statuses[backend.url] = {"error": str(result)}
+            else:
+                statuses[backend.url] = result
+        return statuses
+
+    async def arm_profiler(self, engine: str, count: int) -> dict[str, dict]:
+        """Arms (count > 0) or disarms the profiler on every backend."""
+        return await self._profile_request(
+            "POST", {"engine": engine, "count": str(count)}
+        )
+
+    async def profiler_status(self) -> dict[str, dict]:
+        return await self._profile_request("GET", {})
+
+    async def stylize_bytes(
+        self, image_bytes: bytes, style_name: str, cache_key: Optional[str] = None
+    ) -> bytes:
+        params = {"style": style_name}
+        if cache_key:
+            params["cache_key"] = cache_key
+        return await self._post_images("/cyclegan", {"image": image_bytes}, params)
+
+
+def _read_image_source(image_path_or_bytes) -> bytes:
+    if isinstance(image_path_or_bytes, (str, Path)):
+        return Path(image_path_or_bytes).read_bytes()
+    return image_path_or_bytes
+
+
+class RemoteNSTEngine:
+    """Drop-in replacement for NSTEngine in handlers, backed by InferenceClient."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+        self._initialized = True
+
+    @property
+    def working_size(self) -> Optional[int]:
+        return self.client.working_sizes["nst"]
+
+    def get_available_styles(self) -> dict[str, str]:
+        return self.client.styles["nst"]
+
+    async def prepare_style(self, style_image_path_or_bytes, style_key) -> None:
+        await self.client.prepare_style(
+            _read_image_source(style_image_path_or_bytes), style_key
+        )
+
+    async def process_images(
+        self,
+        style_image_path_or_bytes,
+        content_image_path_or_bytes,
+        content_key=None,
+        style_key=None,
+    ):
+        return await self.client.process_images(
+            _read_image_source(style_image_path_or_bytes),
+            _read_image_source(content_image_path_or_bytes),
+            content_key=content_key,
+            style_key=style_key,
+        )
+
+
+class RemoteCycleGANEngine:
+    """Drop-in replacement for CycleGANEngine in handlers."""
+
+    def __init__(self, client: InferenceClient):
+        self.client = client
+        self._initialized = True
+
+    @property
+    def working_size(self) -> Optional[int]:
+        return self.client.working_sizes["cyclegan"]
+
+    def get_available_styles(self) -> dict:
+        return self.client.styles["cyclegan"]
+
+    async def stylize_bytes(
+        self, image_bytes: bytes, style_name: str, cache_key=None
+    ) -> bytes:
+        return await self.client.stylize_bytes(image_bytes, style_name, cache_key)
@@ -0,0 +1,445 @@
+"""Standalone inference service hosting NSTEngine and CycleGANEngine.
+
+Run with:
+    python -m app.inference_server --port 8500
+    python -m app.inference_server --unix-socket /tmp/dls_inference.sock
+
+The bot talks to it through app.inference_client when INFERENCE_SERVER_URLS
+is set in the environment.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import functools
+import logging
+import socket
+import sys
+from contextlib import ExitStack
+
+from aiohttp import web
+
+from app.calibration import apply_calibration, calibrate_engines
+from app.engines import (
+    SCHEDULE_FIFO,
+    SCHEDULING_POLICIES,
+    attach_timing_model,
+    attach_worker_pool,
+    load_cyclegan_engine,
+    load_nst_engine,
+)
+from app.image_encode import content_type_for
+from app.metrics import (
+    REGISTRY,
+    register_cache_metrics,
+    register_executor_metrics,
+    setup_metrics,
+)
+from app.shm_transport import SEGMENT_PREFIX, BufferDescriptor, attach_buffer
+from app.profiling import PROFILED_ENGINES, PROFILER, configure_profiler
+from app.timing import DurationModel, TimingStore
+from app.tracing import TRACEPARENT_HEADER, configure_tracing, parse_traceparent, trace
+
+logger = logging.getLogger(__name__)
+
+NST_ENGINE_KEY = web.AppKey("nst_engine", object)
+CYCLEGAN_ENGINE_KEY = web.AppKey("cyclegan_engine", object)
+IN_FLIGHT_KEY = web.AppKey("in_flight", dict)
+
+MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+
+def _engine_unavailable(name: str) -> web.Response:
+    return web.json_response(
+        {"error": f"{name} engine is not available on this server."}, status=503
+    )
+
+
+async def _run_in_executor(engine, func, *args, predicted_seconds=None, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    executor = getattr(engine, "executor", None)
+    call = functools.partial(context.run, functools.partial(func, *args, **kwargs))
+    submit_job = getattr(executor, "submit_job", None)
+    if predicted_seconds is not None and submit_job is not None:
+        # Lets a shortest-job-first or deadline pool order the call
+        return await asyncio.wrap_future(submit_job(call, predicted_seconds))
+    return await loop.run_in_executor(executor, call)
+
+
+async def _read_image_parts(request: web.Request, names: tuple[str, ...]) -> dict:
+    """Reads named image parts from a multipart body."""
+    parts = {}
+    reader = await request.multipart()
+    async for part in reader:
+        if part.name in names:
+            parts[part.name] = await part.read(decode=False)
+    missing = [name for name in names if name not in parts]
+    if missing:
+        raise web.HTTPBadRequest(text=f"Missing image parts: {', '.join(missing)}")
+    return parts
+
+
+def _is_unix_socket(request: web.Request) -> bool:
+    sock = request.transport.get_extra_info("socket") if request.transport else None
+    return sock is not None and sock.family == socket.AF_UNIX
+
+
+async def _read_descriptors(
+    request: web.Request, names: tuple[str, ...]
+) -> tuple[dict, dict[str, BufferDescriptor]]:
+    """Parses the JSON body and the shared memory descriptors of ``names``."""
+    try:
+        payload = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body is not valid JSON.")
+    if not isinstance(payload, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object.")
+    descriptors = {}
+    for name in names:
+        try:
+            descriptor = BufferDescriptor.from_dict(payload[name])
+        except (KeyError, TypeError, ValueError):
+            raise web.HTTPBadRequest(text=f"Missing or invalid buffer descriptor: {name}")
+        # Only segments made by the bot's buffer pools, never arbitrary /dev/shm files
+        if not descriptor.name.startswith(SEGMENT_PREFIX) or descriptor.size < 0:
+            raise web.HTTPBadRequest(text=f"Invalid buffer descriptor: {name}")
+        descriptors[name] = descriptor
+    return payload, descriptors
+
+
+def _predictor(engine, style_param: str):
+    """Expected job seconds from request parameters, for engines with timing history."""
+    predict_duration = getattr(engine, "predict_duration", None)
+    if predict_duration is None:
+        return None
+    return lambda params: predict_duration(params.get(style_param))
+
+
+async def _run_with_inputs(
+    request: web.Request, engine, names: tuple[str, ...], func, predict=None
+):
+    """Resolves inputs either from shared memory descriptors or from multipart.
+
+    Descriptors (a JSON body) are only accepted over a Unix socket, where the
+    client shares the host and its /dev/shm with the server.
+
+    With descriptors the segments stay mapped for the whole engine call, so the
+    engine reads the producer's memory directly instead of an HTTP body copy.
+    ``predict`` maps the request parameters to the job's expected seconds.
+    """
+    if request.content_type == "application/json":
+        if not _is_unix_socket(request):
+            # Over TCP any client could make the server read any segment
+            raise web.HTTPBadRequest(
+                text="Shared memory inputs are only accepted over a Unix socket."
+            )
+        payload, descriptors = await _read_descriptors(request, names)
+        predicted = predict(payload) if predict is not None else None
+        with ExitStack() as stack:
+            try:
+                buffers = {
+                    name: stack.enter_context(attach_buffer(descriptor))
+                    for name, descriptor in descriptors.items()
+                }
+            except FileNotFoundError as e:
+                raise web.HTTPBadRequest(text=f"Shared memory segment not found: {e}")
+            return await _run_in_executor(
+                engine, func, buffers, payload, predicted_seconds=predicted
+            )
+    parts = await _read_image_parts(request, names)
+    params = dict(request.query)
+    predicted = predict(params) if predict is not None else None
+    return await _run_in_executor(engine, func, parts, params, predicted_seconds=predicted)
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    app = request.app
+    return web.json_response(
+        {
+            "status": "ok",
+            "nst": app[NST_ENGINE_KEY] is not None,
+            "cyclegan": app[CYCLEGAN_ENGINE_KEY] is not None,
+            "in_flight": sum(app[IN_FLIGHT_KEY].values()),
+            "working_size": {
+                name: engine.working_size if engine is not None else None
+                for name, engine in (
+                    ("nst", app[NST_ENGINE_KEY]),
+                    ("cyclegan", app[CYCLEGAN_ENGINE_KEY]),
+                )
+            },
+        }
+    )
+
+
+async def handle_styles(request: web.Request) -> web.Response:
+    engine_name = request.match_info["engine"]
+    if engine_name == "nst":
+        engine = request.app[NST_ENGINE_KEY]
+    elif engine_name == "cyclegan":
+        engine = request.app[CYCLEGAN_ENGINE_KEY]
+    else:
+        raise web.HTTPNotFound(text=f"Unknown engine: {engine_name}")
+    if engine is None:
+        return web.json_response({})
+    return web.json_response(engine.get_available_styles())
+
+
+async def handle_nst(request: web.Request) -> web.Response:
+    engine = request.app[NST_ENGINE_KEY]
+    if engine is None:
+        return _engine_unavailable("NST")
+
+    def run(images, params):
+        # The engine reuses features cached under these keys
+        extra = {
+            name: params[name] for name in ("content_key", "style_key") if params.get(name)
+        }
+        return engine.process_images(images["style"], images["content"], **extra)
+
+    in_flight = request.app[IN_FLIGHT_KEY]
+    in_flight["nst"] += 1
+    try:
+        result = await _run_with_inputs(
+            request,
+            engine,
+            ("style", "content"),
+            run,
+            predict=_predictor(engine, "style_key"),
+        )
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"NST request failed: {e}", exc_info=True)
+        return web.json_response({"error": str(e)}, status=500)
+    finally:
+        in_flight["nst"] -= 1
+    return web.Response(body=result, content_type=content_type_for(result))
+
+
+async def handle_nst_prepare(request: web.Request) -> web.Response:
+    engine = request.app[NST_ENGINE_KEY]
+    if engine is None:
+        return _engine_unavailable("NST")
+
+    def run(images, params):
+        style_key = params.get("style_key")
+        if not style_key:
+            raise ValueError("Style key is required.")
+        engine.prepare_style(images["style"], style_key)
+
+    try:
+        await _run_with_inputs(request, engine, ("style",), run)
+    except web.HTTPException:
+        raise
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"NST style preparation failed: {e}", exc_info=True)
+        return web.json_response({"error": str(e)}, status=500)
+    return web.Response(status=204)
+
+
+async def handle_cyclegan(request: web.Request) -> web.Response:
+    engine = request.app[CYCLEGAN_ENGINE_KEY]
+    if engine is None:
+        return _engine_unavailable("CycleGAN")
+
+    def run(images, params):
+        style_name = params.get("style")
+        if not style_name:
+            raise ValueError("Style name is required.")
+        extra = {"cache_key": params["cache_key"]} if params.get("cache_key") else {}
+        return engine.stylize_bytes(images["image"], style_name, **extra)
+
+    in_flight = request.app[IN_FLIGHT_KEY]
+    in_flight["cyclegan"] += 1
+    try:
+        result = await _run_with_inputs(
+            request,
+            engine,
+            ("image",),
+            run,
+            predict=_predictor(engine, "style"),
+        )
+    except web.HTTPException:
+        raise
+    except ValueError as e:
+        return web.json_response({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"CycleGAN request failed: {e}", exc_info=True)
+        return web.json_response({"error": str(e)}, status=500)
+    finally:
+        in_flight["cyclegan"] -= 1
+    return web.Response(body=result, content_type=content_type_for(result))
+
+
+async def handle_profile_status(request: web.Request) -> web.Response:
+    return web.json_response(PROFILER.status())
+
+
+async def handle_profile_arm(request: web.Request) -> web.Response:
+    """Arms torch.profiler for the next ``count`` jobs of ``engine`` (or all)."""
+    engine = request.query.get("engine", "all")
+    engines = PROFILED_ENGINES if engine == "all" else (engine,)
+    if any(name not in PROFILED_ENGINES for name in engines):
+        return web.json_response({"error": f"Unknown engine: {engine}"}, status=400)
+    try:
+        count = int(request.query.get("count", "1"))
+    except ValueError:
+        return web.json_response({"error": "count must be an integer"}, status=400)
+    if count > 0:
+        PROFILER.arm(engines, count)
+    else:
+        PROFILER.disarm()
+    return web.json_response(PROFILER.status())
+
+
+@web.middleware
+async def tracing_middleware(request: web.Request, handler):
+    """Continues the caller's trace (``traceparent``) for engine requests."""
+    trace_id, parent_span_id = parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
+    if trace_id is None:
+        return await handler(request)
+    with trace(request.path, trace_id=trace_id, parent_span_id=parent_span_id):
+        return await handler(request)
+
+
+def create_inference_app(nst_engine, cyclegan_engine) -> web.Application:
+    app = web.Application(
+        client_max_size=MAX_REQUEST_SIZE, middlewares=[tracing_middleware]
+    )
+    app[NST_ENGINE_KEY] = nst_engine
+    app[CYCLEGAN_ENGINE_KEY] = cyclegan_engine
+    app[IN_FLIGHT_KEY] = {"nst": 0, "cyclegan": 0}
+
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/styles/{engine}", handle_styles)
+    app.router.add_post("/nst", handle_nst)
+    app.router.add_post("/nst/prepare", handle_nst_prepare)
+    app.router.add_post("/cyclegan", handle_cyclegan)
+    app.router.add_get("/profile", handle_profile_status)
+    app.router.add_post("/profile", handle_profile_arm)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="dls_bot inference server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument(
+        "--unix-socket", default=None, help="Listen on a Unix socket instead of TCP"
+    )
+    parser.add_argument("--nst-workers", type=int, default=1)
+    parser.add_argument("--cyclegan-workers", type=int, default=2)
+    parser.add_argument(
+        "--trace-export", default=None, help="Append finished traces (OTLP/JSON) here"
+    )
+    parser.add_argument(
+        "--trace-slow-threshold",
+        type=float,
+        default=0.0,
+        help="Only log traces longer than this many seconds",
+    )
+    parser.add_argument(
+        "--profile-dir", default="data/profiles", help="Where profiler captures go"
+    )
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        help="Pick the NST image size, worker counts and torch threads for this host",
+    )
+    parser.add_argument("--calibration-cache", default="data/calibration.json")
+    parser.add_argument(
+        "--nst-target-seconds",
+        type=float,
+        default=60.0,
+        help="Calibration: NST job latency the image size must fit",
+    )
+    parser.add_argument(
+        "--timing-store",
+        default=None,
+        help="SQLite file with job durations, used to predict them (app.timing)",
+    )
+    parser.add_argument(
+        "--scheduler",
+        choices=SCHEDULING_POLICIES,
+        default=SCHEDULE_FIFO,
+        help="Order of queued jobs in the worker pools",
+    )
+    parser.add_argument(
+        "--scheduler-max-wait",
+        type=float,
+        default=300.0,
+        help="sjf: seconds after which a queued job goes next regardless of size",
+    )
+    parser.add_argument(
+        "--deadline-factor",
+        type=float,
+        default=3.0,
+        help="deadline: a job's deadline is arrival + factor x predicted duration",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        stream=sys.stdout,
+    )
+
+    configure_tracing(
+        "stylebot-inference", args.trace_export, args.trace_slow_threshold
+    )
+    configure_profiler(args.profile_dir)
+
+    nst_engine = load_nst_engine()
+    cyclegan_engine = load_cyclegan_engine()
+    if nst_engine is None and cyclegan_engine is None:
+        logger.critical("No engines could be loaded. Inference server not started.")
+        sys.exit(1)
+    nst_workers, cyclegan_workers = args.nst_workers, args.cyclegan_workers
+    if args.calibrate:
+        calibration = calibrate_engines(
+            nst_engine,
+            cyclegan_engine,
+            args.calibration_cache,
+            target_seconds=args.nst_target_seconds,
+        )
+        apply_calibration(calibration, nst_engine)
+        nst_workers = calibration.nst_workers or nst_workers
+        cyclegan_workers = calibration.cyclegan_workers or cyclegan_workers
+    scheduling = {
+        "policy": args.scheduler,
+        "max_wait": args.scheduler_max_wait,
+        "deadline_factor": args.deadline_factor,
+    }
+    attach_worker_pool(nst_engine, "nst", nst_workers, **scheduling)
+    attach_worker_pool(cyclegan_engine, "cyclegan", cyclegan_workers, **scheduling)
+    if args.timing_store:
+        timing_model = DurationModel(TimingStore(args.timing_store))
+        # Handlers only read cached fits; fit the stored history before serving
+        timing_model.load()
+        attach_timing_model(timing_model, nst_engine, cyclegan_engine)
+
+    app = create_inference_app(nst_engine, cyclegan_engine)
+    setup_metrics(app)
+    register_executor_metrics({"nst": nst_engine, "cyclegan": cyclegan_engine})
+    register_cache_metrics(
+        {
+            "nst_tensors": getattr(nst_engine, "tensor_cache", None),
+            "cyclegan_tensors": getattr(cyclegan_engine, "tensor_cache", None),
+        }
+    )
+    REGISTRY.register_collector(
+        "stylebot_inference_in_flight",
+        "Requests being processed by this inference server.",
+        lambda: [({"engine": name}, n) for name, n in app[IN_FLIGHT_KEY].items()],
+    )
+    if args.unix_socket:
+        web.run_app(app, path=args.unix_socket)
+    else:
+        web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
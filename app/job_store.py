@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND_NST = "nst"
+JOB_KIND_CYCLEGAN = "cyclegan"
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    UNFINISHED = (QUEUED, RUNNING)
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    chat_id: int
+    user_id: int
+    inputs: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+    status: str = JobStatus.QUEUED
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    owner: Optional[str] = None
+    lease_until: Optional[float] = None
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    inputs TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status);
+"""
+
+# Columns added after the first release, for stores created before them
+_MIGRATIONS = {
+    "owner": "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    "lease_until": "ALTER TABLE jobs ADD COLUMN lease_until REAL",
+}
+
+# A job is up for grabs when nobody owns it or its owner stopped renewing it
+_CLAIMABLE = "(owner IS NULL OR lease_until IS NULL OR lease_until < ?)"
+
+
+def default_owner() -> str:
+    # Host and pid repeat across container restarts (the bot runs as PID 1),
+    # so a random token tells this run apart from the one that crashed
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobStore:
+    """SQLite-backed record of queued and running stylization jobs.
+
+    Inputs are stored as references (Telegram file_id, local paths), never as
+    image data, so a restarted bot can re-download them and finish the job.
+
+    Several worker processes share one store. Each job is leased by the
+    process working on it (``owner``) until ``lease_until``; the owner keeps
+    renewing its leases, and a job is resumed elsewhere only after its lease
+    ran out, i.e. its owner died.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        owner: Optional[str] = None,
+        lease_seconds: float = 60.0,
+        busy_timeout: float = 30.0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=busy_timeout, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, statement in _MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(statement)
+
+    def add(
+        self,
+        kind: str,
+        chat_id: int,
+        user_id: int,
+        inputs: dict,
+        params: Optional[dict] = None,
+    ) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, chat_id, user_id, inputs, params, "
+                "status, attempts, created_at, updated_at, owner, lease_until) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    kind,
+                    chat_id,
+                    user_id,
+                    json.dumps(inputs),
+                    json.dumps(params or {}),
+                    JobStatus.QUEUED,
+                    now,
+                    now,
+                    self.owner,
+                    now + self.lease_seconds,
+                ),
+            )
+        return job_id
+
+    def _set_status(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def mark_running(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ?",
+                (JobStatus.RUNNING, time.time(), job_id),
+            )
+
+    def requeue(self, job_id: str) -> None:
+        self._set_status(job_id, JobStatus.QUEUED)
+
+    def mark_done(self, job_id: str) -> None:
+        # Finished jobs carry no value after delivery; keep the table small.
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        self._set_status(job_id, JobStatus.FAILED, error)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def unfinished(self) -> list[Job]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                JobStatus.UNFINISHED,
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def _claimable(self, take_over: bool) -> tuple[str, tuple]:
+        now = time.time()
+        if take_over:
+            return f"(owner IS NOT ? OR {_CLAIMABLE})", (self.owner, now)
+        return _CLAIMABLE, (now,)
+
+    def claim(self, job_id: str, take_over: bool = False) -> bool:
+        """Leases an unfinished job to this process; False if another one holds it.
+
+        ``take_over`` also takes jobs leased by other owners: a single bot
+        process that restarted knows their owner is gone.
+        """
+        condition, params = self._claimable(take_over)
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET owner = ?, lease_until = ?, updated_at = ? "
+                f"WHERE id = ? AND status IN (?, ?) AND {condition}",
+                (self.owner, now + self.lease_seconds, now, job_id)
+                + JobStatus.UNFINISHED
+                + params,
+            )
+        return cursor.rowcount == 1
+
+    def claim_unfinished(self, take_over: bool = False) -> list[Job]:
+        """Claims every unfinished job whose owner is gone, oldest first."""
+        condition, params = self._claimable(take_over)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE status IN (?, ?) AND {condition} "
+                "ORDER BY created_at",
+                JobStatus.UNFINISHED + params,
+            ).fetchall()
+        claimed = [row["id"] for row in rows if self.claim(row["id"], take_over)]
+        return [job for job in map(self.get, claimed) if job is not None]
+
+    def renew_leases(self) -> int:
+        """Extends the leases of this process' unfinished jobs."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (now + self.lease_seconds, self.owner) + JobStatus.UNFINISHED,
+            )
+        return cursor.rowcount
+
+    def referenced_paths(self) -> set[Path]:
+        """Local files that unfinished jobs still need."""
+        paths = set()
+        for job in self.unfinished():
+            for key, value in job.inputs.items():
+                if key.endswith("_path") and value:
+                    paths.add(Path(value).resolve())
+        return paths
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Job:
+        return Job(
+            id=row["id"],
+            kind=row["kind"],
+            chat_id=row["chat_id"],
+            user_id=row["user_id"],
+            inputs=json.loads(row["inputs"]),
+            params=json.loads(row["params"]),
+            status=row["status"],
+            attempts=row["attempts"],
+            error=row["error"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            owner=row["owner"],
+            lease_until=row["lease_until"],
+        )
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+
+from app.image_encode import result_filename
+from app.handlers.utils import download_photo, run_engine_call, update_job
+from app.job_store import JOB_KIND_NST, Job, JobStore
+
+logger = logging.getLogger(__name__)
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def execute_nst_job(bot: Bot, nst_engine, job: Job) -> bytes:
+    style_path = job.inputs.get("style_path")
+    if style_path and Path(style_path).exists():
+        style_source = style_path
+    elif job.inputs.get("style_file_id"):
+        style_source = await download_photo(bot, job.inputs["style_file_id"])
+    else:
+        raise FileNotFoundError("Style image for the job is no longer available.")
+
+    content_bytes = await download_photo(bot, job.inputs["content_file_id"])
+    return await run_engine_call(nst_engine.process_images, style_source, content_bytes)
+
+
+async def execute_cyclegan_job(bot: Bot, cyclegan_engine, job: Job) -> bytes:
+    image_bytes = await download_photo(bot, job.inputs["content_file_id"])
+    return await run_engine_call(
+        cyclegan_engine.stylize_bytes,
+        image_bytes=image_bytes,
+        style_name=job.params["style"],
+    )
+
+
+async def _notify_failed(bot: Bot, job: Job) -> None:
+    try:
+        await bot.send_message(
+            job.chat_id,
+            "К сожалению, не удалось завершить обработку, прерванную "
+            "перезапуском бота. Пожалуйста, попробуйте снова.",
+        )
+    except Exception:
+        pass
+
+
+async def resume_job(bot: Bot, job_store: JobStore, engines: dict, job: Job) -> None:
+    engine = engines.get(job.kind)
+    if engine is None:
+        await update_job(job_store.mark_failed, job.id, f"Engine '{job.kind}' is not available.")
+        logger.warning(f"Cannot resume job {job.id}: engine {job.kind} unavailable.")
+        await _notify_failed(bot, job)
+        return
+
+    executor = execute_nst_job if job.kind == JOB_KIND_NST else execute_cyclegan_job
+    try:
+        await asyncio.to_thread(job_store.mark_running, job.id)
+        result_bytes = await executor(bot, engine, job)
+        await bot.send_photo(
+            chat_id=job.chat_id,
+            photo=BufferedInputFile(result_bytes, filename=result_filename(result_bytes)),
+            caption=(
+                "Готово! Это результат обработки, прерванной перезапуском бота.\n\n"
+                "Для начала нового сеанса введите /start"
+            ),
+        )
+        await update_job(job_store.mark_done, job.id)
+        logger.info(f"Resumed job {job.id} ({job.kind}) delivered to {job.chat_id}.")
+    except Exception as e:
+        logger.error(f"Failed to resume job {job.id}: {e}", exc_info=True)
+        await update_job(job_store.mark_failed, job.id, str(e))
+        await _notify_failed(bot, job)
+
+
+async def resume_unfinished_jobs(
+    bot: Bot,
+    job_store: JobStore,
+    engines: dict,
+    max_attempts: int,
+    take_over: bool = False,
+) -> None:
+    """Resumes the unfinished jobs this process manages to claim.
+
+    Only jobs without a live lease are claimed, so jobs still running in
+    other worker processes are left alone. ``take_over`` claims those too;
+    it is for a single bot process, where other owners are previous runs.
+    """
+    try:
+        jobs = await asyncio.to_thread(job_store.claim_unfinished, take_over)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to claim unfinished jobs: {e}")
+        return
+    if not jobs:
+        return
+    logger.info(f"Claimed {len(jobs)} unfinished job(s) of a stopped bot process.")
+
+    async def resume(job: Job) -> None:
+        if job.attempts >= max_attempts:
+            logger.warning(
+                f"Job {job.id} reached {job.attempts} attempts, giving up."
+            )
+            await update_job(job_store.mark_failed, job.id, "Too many attempts.")
+            await _notify_failed(bot, job)
+            return
+        await update_job(job_store.requeue, job.id)
+        await resume_job(bot, job_store, engines, job)
+
+    # All at once: the engines' worker pools decide how many actually run
+    await asyncio.gather(*(resume(job) for job in jobs))
+
+
+def schedule_resume(
+    bot: Bot,
+    job_store: Optional[JobStore],
+    engines: dict,
+    max_attempts: int,
+    take_over: bool = False,
+) -> None:
+    """Starts resuming unfinished jobs without delaying bot startup."""
+    if job_store is None:
+        return
+    task = asyncio.create_task(
+        resume_unfinished_jobs(bot, job_store, engines, max_attempts, take_over)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def maintain_jobs(
+    bot: Bot,
+    job_store: JobStore,
+    engines: dict,
+    max_attempts: int,
+    take_over: bool = False,
+) -> None:
+    """Keeps this process' job leases alive and picks up jobs of dead workers.
+
+    Runs until cancelled. Every third of the lease the own leases are renewed
+    and jobs whose lease ran out, e.g. of a crashed sibling worker, are resumed.
+    """
+    schedule_resume(bot, job_store, engines, max_attempts, take_over)
+    interval = job_store.lease_seconds / 3
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(job_store.renew_leases)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to renew job leases: {e}")
+            continue
+        schedule_resume(bot, job_store, engines, max_attempts)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from asyncio import events
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_original_handle_run = events.Handle._run
+_active_monitors: set["LoopLagMonitor"] = set()
+
+
+def _timed_handle_run(self):
+    start = time.perf_counter()
+    try:
+        return _original_handle_run(self)
+    finally:
+        duration = time.perf_counter() - start
+        for monitor in tuple(_active_monitors):
+            if duration >= monitor.threshold:
+                monitor._record_slow_callback(self, duration)
+
+
+class LoopLagMonitor:
+    """Detects callbacks that block the event loop longer than ``threshold``.
+
+    A heartbeat task measures how late ``asyncio.sleep(interval)`` wakes up;
+    the excess is the loop lag. With ``trace_callbacks`` every callback run by
+    the loop is timed as well, so the culprit is logged by name (like asyncio
+    debug mode, without its other overhead). ``max_lag``, ``stall_count`` and
+    ``slow_callbacks`` are kept for export.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        interval: float = 0.5,
+        trace_callbacks: bool = False,
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.trace_callbacks = trace_callbacks
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.slow_callbacks = 0
+        self.last_slow_callback: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        if self.trace_callbacks:
+            _active_monitors.add(self)
+            events.Handle._run = _timed_handle_run
+        self._task = asyncio.create_task(self._heartbeat())
+        logger.info(
+            f"Event loop lag monitor started (threshold {self.threshold * 1000:.0f} ms)."
+        )
+
+    async def stop(self) -> None:
+        _active_monitors.discard(self)
+        if not _active_monitors:
+            events.Handle._run = _original_handle_run
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _record_slow_callback(self, handle: events.Handle, duration: float) -> None:
+        self.slow_callbacks += 1
+        self.last_slow_callback = repr(handle)
+        logger.warning(
+            f"Event loop blocked for {duration * 1000:.0f} ms by {self.last_slow_callback}"
+        )
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self.stall_count += 1
+                if not self.trace_callbacks:
+                    logger.warning(f"Event loop lagged by {lag * 1000:.0f} ms.")
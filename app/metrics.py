@@ -0,0 +1,430 @@
+"""Prometheus metrics in the text exposition format, without extra dependencies.
+
+Instrumented code updates the module-level metrics below; values that
+already live elsewhere (cache counters, executor queues, the loop monitor)
+are read at scrape time by collectors registered with ``register_collector``.
+``metrics_handler`` serves a registry from any aiohttp app, and
+``start_metrics_server`` runs a small standalone one, which the bot uses so
+that metrics never share the public webhook port.
+"""
+
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Sequence
+
+from aiohttp import web
+
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# (labels, value) pairs produced by a collector for one metric
+Samples = Iterable[tuple[dict, float]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._labels(key), value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def total(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[1] if state else 0.0
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        with self._lock:
+            items = [(key, ([*s[0]], s[1], s[2])) for key, s in self._values.items()]
+        for key, (bucket_counts, total, count) in items:
+            labels = self._labels(key)
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, bucket_count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class _CollectedMetric:
+    """A metric whose samples are produced by a callback at scrape time."""
+
+    def __init__(
+        self, name: str, documentation: str, type_name: str, collect: Callable[[], Samples]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.type_name = type_name
+        self._collect = collect
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        for labels, value in self._collect():
+            yield self.name, labels, value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered.")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Samples],
+        type_name: str = "gauge",
+    ) -> None:
+        """Registers (or replaces) a metric read from ``collect`` on every scrape."""
+        with self._lock:
+            self._metrics[name] = _CollectedMetric(name, documentation, type_name, collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.warning(f"Failed to collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+JOBS_IN_FLIGHT = REGISTRY.gauge(
+    "stylebot_jobs_in_flight", "Stylization requests being processed.", ["engine"]
+)
+JOBS_TOTAL = REGISTRY.counter(
+    "stylebot_jobs_total", "Finished stylization requests.", ["engine", "outcome"]
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "stylebot_stage_seconds",
+    "Duration of request stages (download, inference, send, total).",
+    ["engine", "stage"],
+)
+NST_STEPS = REGISTRY.histogram(
+    "stylebot_nst_steps",
+    "LBFGS closure evaluations per NST optimization run.",
+    buckets=(10, 25, 50, 100, 150, 200, 300, 500, 1000),
+)
+CYCLEGAN_BATCH_SIZE = REGISTRY.histogram(
+    "stylebot_cyclegan_batch_size",
+    "Images per CycleGAN generator call.",
+    ["style"],
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+
+
+def process_rss_bytes() -> float:
+    """Current resident set size; falls back to the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+REGISTRY.register_collector(
+    "stylebot_process_resident_memory_bytes",
+    "Resident memory of this process.",
+    lambda: [({}, process_rss_bytes())],
+)
+
+
+def register_cache_metrics(caches: dict, registry: Registry = REGISTRY) -> None:
+    """Exports hit/miss counters of caches that have ``hits`` and ``misses``."""
+
+    def counts(attr):
+        return [
+            ({"cache": name}, getattr(cache, attr))
+            for name, cache in caches.items()
+            if cache is not None
+        ]
+
+    registry.register_collector(
+        "stylebot_cache_hits_total", "Cache hits.", lambda: counts("hits"), "counter"
+    )
+    registry.register_collector(
+        "stylebot_cache_misses_total", "Cache misses.", lambda: counts("misses"), "counter"
+    )
+
+    def hit_ratio():
+        for name, cache in caches.items():
+            if cache is None:
+                continue
+            total = cache.hits + cache.misses
+            yield {"cache": name}, cache.hits / total if total else 0.0
+
+    registry.register_collector(
+        "stylebot_cache_hit_ratio", "Cache hits / lookups since start.", hit_ratio
+    )
+
+
+def register_executor_metrics(engines: dict, registry: Registry = REGISTRY) -> None:
+    """Exports busy/total threads and queue depth of engine worker pools."""
+
+    def pools():
+        for name, engine in engines.items():
+            pool = getattr(engine, "executor", None)
+            if pool is not None and hasattr(pool, "busy_workers"):
+                yield name, pool
+
+    registry.register_collector(
+        "stylebot_executor_busy_workers",
+        "Worker threads currently running engine calls.",
+        lambda: [({"engine": name}, pool.busy_workers) for name, pool in pools()],
+    )
+    registry.register_collector(
+        "stylebot_executor_max_workers",
+        "Worker threads per engine pool.",
+        lambda: [({"engine": name}, pool.max_workers) for name, pool in pools()],
+    )
+    registry.register_collector(
+        "stylebot_executor_queue_depth",
+        "Engine calls waiting for a free worker thread.",
+        lambda: [({"engine": name}, pool.queued) for name, pool in pools()],
+    )
+    registry.register_collector(
+        "stylebot_executor_utilization",
+        "Busy / total worker threads.",
+        lambda: [
+            ({"engine": name}, pool.busy_workers / pool.max_workers)
+            for name, pool in pools()
+        ],
+    )
+
+
+def register_loop_monitor_metrics(monitor, registry: Registry = REGISTRY) -> None:
+    if monitor is None:
+        return
+    registry.register_collector(
+        "stylebot_event_loop_lag_seconds",
+        "Last measured event loop lag.",
+        lambda: [({}, monitor.last_lag)],
+    )
+    registry.register_collector(
+        "stylebot_event_loop_max_lag_seconds",
+        "Largest event loop lag since start.",
+        lambda: [({}, monitor.max_lag)],
+    )
+    registry.register_collector(
+        "stylebot_event_loop_stalls_total",
+        "Heartbeats that exceeded the lag threshold.",
+        lambda: [({}, monitor.stall_count)],
+        "counter",
+    )
+
+
+def register_queue_depth(collect: Callable[[], float], registry: Registry = REGISTRY) -> None:
+    """Exports the number of updates accepted but not yet handled."""
+    registry.register_collector(
+        "stylebot_update_queue_depth",
+        "Telegram updates waiting for or in processing.",
+        lambda: [({}, collect())],
+    )
+
+
+def metrics_handler(registry: Registry = REGISTRY):
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=registry.render().encode("utf-8"),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+    return handle_metrics
+
+
+def setup_metrics(
+    app: web.Application, path: str = "/metrics", registry: Registry = REGISTRY
+) -> None:
+    app.router.add_get(path, metrics_handler(registry))
+
+
+async def start_metrics_server(
+    host: str, port: int, path: str = "/metrics", registry: Registry = REGISTRY
+) -> web.AppRunner:
+    """Serves only the metrics endpoint; returns the runner to clean up."""
+    app = web.Application()
+    setup_metrics(app, path, registry)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Metrics are served on http://{host}:{port}{path}")
+    return runner
+
+
+@contextmanager
+def track_request(engine: str):
+    """Counts a stylization request as in flight and records its outcome and duration."""
+    outcome = "error"
+    start = time.perf_counter()
+    try:
+        with JOBS_IN_FLIGHT.track_inprogress(engine=engine):
+            yield
+        outcome = "ok"
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, engine=engine, stage="total")
+        JOBS_TOTAL.inc(engine=engine, outcome=outcome)
+
+
+@contextmanager
+def stage_timer(engine: str, stage: str):
+    """Records a request stage both in the latency histogram and as a trace span."""
+    with STAGE_SECONDS.time(engine=engine, stage=stage), span(stage, engine=engine):
+        yield
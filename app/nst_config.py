@@ -2,10 +2,16 @@ import yaml
 from pathlib import Path
 import logging
 
+from app.image_decode import DEFAULT_MAX_PIXELS
+from app.image_encode import OutputEncoderConfig
+
 logger = logging.getLogger(__name__)
 
 CONFIG_FILE_PATH = Path(__file__).parent / "configs" / "nst_params.yaml"
 
+# How the optimized image is initialized, see NSTEngine._initial_input
+INIT_STRATEGIES = ("content", "color_transfer", "low_res")
+
 
 class NSTConfig:
     def __init__(self, data: dict):
@@ -24,6 +30,9 @@ class NSTConfig:
             self.IMAGE_SIZE = int(data.get("IMAGE_SIZE", 256))
             self.IMAGE_SIZE_CPU = int(data.get("IMAGE_SIZE_CPU", self.IMAGE_SIZE))
             self.IMAGE_SIZE_CUDA = int(data.get("IMAGE_SIZE_CUDA", self.IMAGE_SIZE))
+            self.MAX_INPUT_PIXELS = int(
+                data.get("MAX_INPUT_PIXELS", DEFAULT_MAX_PIXELS)
+            )
 
             # Normalization for VGG19 (ImageNet)
             self.NORMALIZATION_MEAN = data.get(
@@ -43,6 +52,40 @@ class NSTConfig:
             self.NUM_STEPS = int(data.get("NUM_STEPS", 200))
             self.STYLE_WEIGHT = float(data.get("STYLE_WEIGHT", 1000000))
             self.CONTENT_WEIGHT = float(data.get("CONTENT_WEIGHT", 1))
+
+            # Initialization of the optimized image
+            init = data.get("INIT") or {}
+            self.INIT_STRATEGY = str(init.get("STRATEGY", "content")).lower()
+            if self.INIT_STRATEGY not in INIT_STRATEGIES:
+                raise ValueError(
+                    f"Unknown INIT.STRATEGY '{self.INIT_STRATEGY}'. "
+                    f"Use one of: {', '.join(INIT_STRATEGIES)}"
+                )
+            # Steps to run after each initialization; a better start needs fewer
+            self.INIT_NUM_STEPS = {
+                strategy: int((init.get("NUM_STEPS") or {}).get(strategy, self.NUM_STEPS))
+                for strategy in INIT_STRATEGIES
+            }
+            self.INIT_LOW_RES_SCALE = float(init.get("LOW_RES_SCALE", 0.5))
+            self.INIT_LOW_RES_NUM_STEPS = int(init.get("LOW_RES_NUM_STEPS", 100))
+
+            # In-memory storage of uploaded style images
+            self.INPUT_CACHE_MAX_BYTES = int(
+                data.get("INPUT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+            )
+            self.INPUT_SPILL_THRESHOLD_BYTES = int(
+                data.get("INPUT_SPILL_THRESHOLD_BYTES", 8 * 1024 * 1024)
+            )
+            self.INPUT_CACHE_TTL = float(data.get("INPUT_CACHE_TTL", 3600))
+
+            # Preprocessed inputs kept for repeated requests on the same photo
+            self.TENSOR_CACHE_MAX_BYTES = int(
+                data.get("TENSOR_CACHE_MAX_BYTES", 128 * 1024 * 1024)
+            )
+            self.TENSOR_CACHE_TTL = float(data.get("TENSOR_CACHE_TTL", 1800))
+
+            # Encoding of the result sent to the user
+            self.OUTPUT_ENCODER = OutputEncoderConfig.from_dict(data.get("OUTPUT"))
         except KeyError as e:
             raise KeyError(f"The required key is missing in {CONFIG_FILE_PATH}: {e}")
 
@@ -2,25 +2,44 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-from PIL import Image
-import torchvision.transforms as transforms
 
 from torchvision.models import vgg19
 
+import functools
 import logging
-import io
+import threading
+import time
+from concurrent.futures import Executor
 from pathlib import Path
+from typing import Optional
 from app.nst_config import NSTConfig
+from app.engines import NSTModelNotInitializedError
+from app.image_decode import decode_image
+from app.image_tensor import ImageTensorCodec
+from app.photo_cache import BoundedCache
+from app.metrics import NST_STEPS
+from app.tracing import span
+from app.profiling import profiled
+from app.timing import DurationModel, current_precision
 
 
 logger = logging.getLogger(__name__)
 
+_STYLE_LOCKS_GUARD = threading.Lock()
 
-class NSTModelNotInitializedError(Exception):
-    pass
+
+def _describe_source(source) -> str:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    return str(source)
 
 
 class NSTEngine:
+    # Dedicated worker pool for run_engine_call (see app.engines.attach_worker_pool)
+    executor: Optional[Executor] = None
+    # Job duration history and predictions (see app.engines.attach_timing_model)
+    timing_model: Optional[DurationModel] = None
+
     def __init__(self, config: NSTConfig):
         self.config = config
         self.device = None
@@ -43,6 +62,30 @@ class NSTEngine:
             self._initialized = False
             logger.critical(f"NSTEngine initialization failed: {e}", exc_info=True)
 
+    @property
+    def working_size(self) -> Optional[int]:
+        """Side (px) input images are resized to before stylization."""
+        return self.image_size
+
+    @staticmethod
+    def _timing_style(style_key) -> str:
+        # Uploaded styles are one-offs: only the default ones get their own fit
+        if style_key and str(style_key).startswith("default:"):
+            return str(style_key)
+        return "custom"
+
+    def predict_duration(self, style_key=None) -> Optional[float]:
+        """Expected seconds of process_images at the current settings, or None."""
+        if self.timing_model is None:
+            return None
+        return self.timing_model.predict(
+            "nst",
+            self.image_size,
+            steps=self.config.INIT_NUM_STEPS[self.config.INIT_STRATEGY],
+            style=self._timing_style(style_key),
+            precision=current_precision(self.device),
+        )
+
     def _determine_device_and_image_size(self):
         pref = self.config.DEVICE_PREFERENCE
         determined_device_str = "cpu"
@@ -202,9 +245,11 @@ class NSTEngine:
         return G.div(a * b * c * d)
 
     class StyleLoss(nn.Module):
-        def __init__(self, target_feature):
+        def __init__(self, target_feature=None, target_gram=None):
             super().__init__()
-            self.target = NSTEngine.gram_matrix(target_feature).detach()
+            if target_gram is None:
+                target_gram = NSTEngine.gram_matrix(target_feature)
+            self.target = target_gram.detach()
             self.loss = None
 
         def forward(self, input_tensor):
@@ -221,63 +266,40 @@ class NSTEngine:
         def forward(self, img):
             return (img - self.mean) / self.std
 
+    @functools.cached_property
+    def _codec(self) -> ImageTensorCodec:
+        # VGG normalization is part of the model, so inputs stay in [0, 1]
+        return ImageTensorCodec(self.device)
+
     def _image_loader(self, image_path_or_bytes):
         if not self._initialized:
             raise NSTModelNotInitializedError(
                 "NSTEngine is not initialized. Cannot load image."
             )
-        loader_transform = transforms.Compose(
-            [
-                transforms.Resize((self.image_size, self.image_size)),
-                transforms.ToTensor(),
-            ]
-        )
-        if isinstance(image_path_or_bytes, (str, Path)):
-            image = Image.open(image_path_or_bytes).convert("RGB")
-        elif isinstance(image_path_or_bytes, bytes):
-            image = Image.open(io.BytesIO(image_path_or_bytes)).convert("RGB")
-        else:
-            raise ValueError(
-                "image_path_or_bytes must be a file path (str/Path) or bytes."
+        with span("decode"):
+            image = decode_image(
+                image_path_or_bytes, self.image_size, self.config.MAX_INPUT_PIXELS
             )
-        image = loader_transform(image).unsqueeze(0)
-        return image.to(self.device, torch.float)
+            image = self._codec.resize(image, self.image_size)
+            return self._codec.to_tensor(image)
 
     def _tensor_to_pil_image(self, tensor):
         if not self._initialized:
             raise NSTModelNotInitializedError(
                 "NSTEngine is not initialized. " "Cannot convert tensor to PIL image."
             )
-        image = tensor.cpu().clone()
-        image = image.squeeze(0)
-        unloader = transforms.ToPILImage()
-        image = unloader(image)
-        return image
-
-    def _get_style_model_and_losses(self, style_img_tensor, content_img_tensor):
-        if not self._initialized:
-            raise NSTModelNotInitializedError(
-                "NSTEngine is not initialized. Cannot get style model and losses."
-            )
-        if self.cnn_model is None:
-            raise NSTModelNotInitializedError(
-                "CNN model (VGG features) is not loaded in NSTEngine."
-            )
+        return self._codec.to_image(tensor)
 
-        normalization = NSTEngine.Normalization(
+    def _normalization(self) -> "NSTEngine.Normalization":
+        return NSTEngine.Normalization(
             self.cnn_normalization_mean.tolist(),
             self.cnn_normalization_std.tolist(),
             self.device,
         ).to(self.device)
 
-        content_losses = []
-        style_losses = []
-        model = nn.Sequential(normalization).to(self.device)
+    def _named_layers(self):
+        """Yields (index, name, layer) for the VGG feature layers, e.g. conv_3."""
         i = 0
-
-        content_layers_cfg = self.config.CONTENT_LAYERS
-        style_layers_cfg = self.config.STYLE_LAYERS
-
         for layer in self.cnn_model.children():
             if isinstance(layer, nn.Conv2d):
                 i += 1
@@ -291,18 +313,65 @@ class NSTEngine:
                 name = f"bn_{i}"
             else:
                 raise RuntimeError(f"Unrecognized layer: {layer.__class__.__name__}")
+            yield i, name, layer
+
+    def _extract_features(self, img_tensor, layer_names) -> dict:
+        """Runs VGG once and returns the activations of the named layers."""
+        wanted = set(layer_names)
+        features = {}
+        with torch.no_grad():
+            x = self._normalization()(img_tensor)
+            for _, name, layer in self._named_layers():
+                x = layer(x)
+                if name in wanted:
+                    features[name] = x.detach()
+                    if len(features) == len(wanted):
+                        break
+        return features
+
+    def _content_targets(self, content_img_tensor) -> dict:
+        return self._extract_features(content_img_tensor, self.config.CONTENT_LAYERS)
+
+    def _style_targets(self, style_img_tensor) -> dict:
+        """Gram matrices of the style layers, the only part of the style the loss needs."""
+        features = self._extract_features(style_img_tensor, self.config.STYLE_LAYERS)
+        return {name: NSTEngine.gram_matrix(f) for name, f in features.items()}
+
+    def _get_style_model_and_losses(
+        self,
+        style_img_tensor,
+        content_img_tensor,
+        content_targets=None,
+        style_targets=None,
+    ):
+        if not self._initialized:
+            raise NSTModelNotInitializedError(
+                "NSTEngine is not initialized. Cannot get style model and losses."
+            )
+        if self.cnn_model is None:
+            raise NSTModelNotInitializedError(
+                "CNN model (VGG features) is not loaded in NSTEngine."
+            )
+
+        if content_targets is None:
+            content_targets = self._content_targets(content_img_tensor)
+        if style_targets is None:
+            style_targets = self._style_targets(style_img_tensor)
 
+        content_losses = []
+        style_losses = []
+        model = nn.Sequential(self._normalization()).to(self.device)
+
+        for i, name, layer in self._named_layers():
             model.add_module(name, layer)
 
-            if name in content_layers_cfg:
-                target = model(content_img_tensor).detach()
-                content_loss = NSTEngine.ContentLoss(target)
+            if name in content_targets:
+                content_loss = NSTEngine.ContentLoss(content_targets[name])
                 model.add_module(f"content_loss_{i}", content_loss)
                 content_losses.append(content_loss)
 
-            if name in style_layers_cfg:
-                target_feature = model(style_img_tensor).detach()
-                style_loss = NSTEngine.StyleLoss(target_feature)
+            if name in style_targets:
+                style_loss = NSTEngine.StyleLoss(target_gram=style_targets[name])
                 model.add_module(f"style_loss_{i}", style_loss)
                 style_losses.append(style_loss)
 
@@ -324,7 +393,13 @@ class NSTEngine:
         return optimizer
 
     def _run_style_transfer_core(
-        self, content_img_tensor, style_img_tensor, input_img_tensor
+        self,
+        content_img_tensor,
+        style_img_tensor,
+        input_img_tensor,
+        content_targets=None,
+        style_targets=None,
+        num_steps=None,
     ):
         if not self._initialized:
             raise NSTModelNotInitializedError(
@@ -332,9 +407,10 @@ class NSTEngine:
             )
         logger.info("Building the style transfer model..")
 
-        model, style_losses, content_losses = self._get_style_model_and_losses(
-            style_img_tensor, content_img_tensor
-        )
+        with span("build_model"):
+            model, style_losses, content_losses = self._get_style_model_and_losses(
+                style_img_tensor, content_img_tensor, content_targets, style_targets
+            )
 
         input_img_tensor.requires_grad_(True)
         model.requires_grad_(False)
@@ -342,66 +418,220 @@ class NSTEngine:
         optimizer = self._get_input_optimizer(input_img_tensor)
         logger.info("Optimizing..")
         run = [0]
-        num_steps = self.config.NUM_STEPS
+        if num_steps is None:
+            num_steps = self.config.NUM_STEPS
         style_weight = self.config.STYLE_WEIGHT
         content_weight = self.config.CONTENT_WEIGHT
 
-        while run[0] <= num_steps:
-
-            def closure():
-                with torch.no_grad():
-                    input_img_tensor.clamp_(0, 1)
-                optimizer.zero_grad()
-                model(input_img_tensor)
-                style_score = 0
-                content_score = 0
-                for sl in style_losses:
-                    style_score += sl.loss
-                for cl in content_losses:
-                    content_score += cl.loss
-                style_score *= style_weight
-                content_score *= content_weight
-                loss = style_score + content_score
-                loss.backward()
-                run[0] += 1
-                if run[0] % 50 == 0:
-                    logger.info(
-                        f"run {run[0]}: Style Loss : {style_score.item():4f} "
-                        f"Content Loss: {content_score.item():4f}"
-                    )
-                return style_score + content_score
-
-            optimizer.step(closure)
-
+        with span("optimize", max_steps=num_steps) as optimize_span:
+            while run[0] <= num_steps:
+
+                def closure():
+                    with torch.no_grad():
+                        input_img_tensor.clamp_(0, 1)
+                    optimizer.zero_grad()
+                    model(input_img_tensor)
+                    style_score = 0
+                    content_score = 0
+                    for sl in style_losses:
+                        style_score += sl.loss
+                    for cl in content_losses:
+                        content_score += cl.loss
+                    style_score *= style_weight
+                    content_score *= content_weight
+                    loss = style_score + content_score
+                    loss.backward()
+                    run[0] += 1
+                    if run[0] % 50 == 0:
+                        logger.info(
+                            f"run {run[0]}: Style Loss : {style_score.item():4f} "
+                            f"Content Loss: {content_score.item():4f}"
+                        )
+                    return style_score + content_score
+
+                optimizer.step(closure)
+            optimize_span.set_attribute("steps", run[0])
+
+        NST_STEPS.observe(run[0])
         with torch.no_grad():
             input_img_tensor.clamp_(0, 1)
         return input_img_tensor
 
-    def process_images(self, style_image_path_or_bytes, content_image_path_or_bytes):
+    @staticmethod
+    def _match_color_statistics(content_img_tensor, style_img_tensor):
+        """Content with each channel's mean and std set to the style's ones."""
+        dims = (2, 3)
+        c_mean = content_img_tensor.mean(dim=dims, keepdim=True)
+        c_std = content_img_tensor.std(dim=dims, keepdim=True).clamp_min(1e-5)
+        s_mean = style_img_tensor.mean(dim=dims, keepdim=True)
+        s_std = style_img_tensor.std(dim=dims, keepdim=True)
+        matched = (content_img_tensor - c_mean) / c_std * s_std + s_mean
+        return matched.clamp_(0, 1)
+
+    def _low_res_result(self, content_img_tensor, style_img_tensor):
+        """Short NST run at reduced resolution, upsampled to the working size."""
+        size = content_img_tensor.shape[-2:]
+        low_size = [max(8, int(side * self.config.INIT_LOW_RES_SCALE)) for side in size]
+
+        def downscale(tensor):
+            return F.interpolate(
+                tensor, size=low_size, mode="bilinear", align_corners=False, antialias=True
+            )
+
+        low_content = downscale(content_img_tensor)
+        low_result = self._run_style_transfer_core(
+            low_content,
+            downscale(style_img_tensor),
+            low_content.clone(),
+            num_steps=self.config.INIT_LOW_RES_NUM_STEPS,
+        )
+        with torch.no_grad():
+            result = F.interpolate(
+                low_result.detach(), size=size, mode="bilinear", align_corners=False
+            )
+        return result.clamp_(0, 1)
+
+    def _initial_input(self, content_img_tensor, style_img_tensor):
+        """Starting image for the optimization and the number of steps to run.
+
+        A start that already carries the style's colours (``color_transfer``)
+        or its texture (``low_res``) reaches the same loss in fewer steps, so
+        each strategy has its own ``INIT.NUM_STEPS``.
+        """
+        strategy = self.config.INIT_STRATEGY
+        if strategy == "color_transfer":
+            input_img_tensor = self._match_color_statistics(
+                content_img_tensor, style_img_tensor
+            )
+        elif strategy == "low_res":
+            input_img_tensor = self._low_res_result(content_img_tensor, style_img_tensor)
+        else:
+            input_img_tensor = content_img_tensor.clone()
+        return input_img_tensor, self.config.INIT_NUM_STEPS[strategy]
+
+    @functools.cached_property
+    def _tensor_cache(self) -> BoundedCache:
+        return BoundedCache(
+            self.config.TENSOR_CACHE_MAX_BYTES, ttl=self.config.TENSOR_CACHE_TTL
+        )
+
+    def _content_inputs(self, content_image_path_or_bytes, content_key=None):
+        """Content tensor and content-layer features, reused for the same photo."""
+        cache_key = ("content", content_key, self.image_size)
+        if content_key is not None:
+            cached = self._tensor_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Using cached content features for {content_key}.")
+                return cached
+        content_img_tensor = self._image_loader(content_image_path_or_bytes)
+        inputs = (content_img_tensor, self._content_targets(content_img_tensor))
+        if content_key is not None:
+            self._tensor_cache.put(cache_key, inputs)
+        return inputs
+
+    @property
+    def tensor_cache(self) -> BoundedCache:
+        return self._tensor_cache
+
+    @functools.cached_property
+    def _style_locks(self) -> dict:
+        return {}
+
+    def _style_inputs(self, style_image_path_or_bytes, style_key=None):
+        """Style tensor and Gram targets, computed once per style_key.
+
+        Concurrent calls for the same key (a background preparation and the
+        request it was started for) wait for each other instead of
+        duplicating the VGG pass.
+        """
+        if style_key is None:
+            style_img_tensor = self._image_loader(style_image_path_or_bytes)
+            return style_img_tensor, self._style_targets(style_img_tensor)
+
+        cache_key = ("style", style_key, self.image_size)
+        with _STYLE_LOCKS_GUARD:
+            lock = self._style_locks.setdefault(cache_key, threading.Lock())
+        try:
+            with lock:
+                cached = self._tensor_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+                style_img_tensor = self._image_loader(style_image_path_or_bytes)
+                inputs = (style_img_tensor, self._style_targets(style_img_tensor))
+                self._tensor_cache.put(cache_key, inputs)
+                return inputs
+        finally:
+            with _STYLE_LOCKS_GUARD:
+                self._style_locks.pop(cache_key, None)
+
+    def prepare_style(self, style_image_path_or_bytes, style_key) -> None:
+        """Precomputes style targets ahead of the content image (see _style_inputs)."""
+        if not self._initialized:
+            raise NSTModelNotInitializedError(
+                "NSTEngine is not initialized. Cannot prepare style."
+            )
+        self._style_inputs(style_image_path_or_bytes, style_key)
+        logger.info(f"Style {style_key} prepared.")
+
+    @profiled("nst")
+    def process_images(
+        self,
+        style_image_path_or_bytes,
+        content_image_path_or_bytes,
+        content_key=None,
+        style_key=None,
+    ):
+        """Stylizes the content image; returns encoded result bytes.
+
+        ``content_key`` (the photo's Telegram file_unique_id) lets the engine
+        reuse the preprocessed content tensor and features of an earlier run;
+        ``style_key`` does the same for the style's Gram targets.
+        """
         if not self._initialized:
             raise NSTModelNotInitializedError(
                 "NSTEngine is not initialized. Call initialize() first or check logs."
             )
+        started = time.perf_counter()
 
         try:
-            style_img_tensor = self._image_loader(style_image_path_or_bytes)
-            content_img_tensor = self._image_loader(content_image_path_or_bytes)
+            style_img_tensor, style_targets = self._style_inputs(
+                style_image_path_or_bytes, style_key
+            )
+            content_img_tensor, content_targets = self._content_inputs(
+                content_image_path_or_bytes, content_key
+            )
         except Exception as e:
             logger.error(f"Error loading images for NST: {e}")
             raise
 
-        input_img_tensor = content_img_tensor.clone()
-
         logger.info(
-            f"Starting NST process for style: {style_image_path_or_bytes}, "
-            f"content: {content_image_path_or_bytes}"
+            f"Starting NST process for style: {_describe_source(style_image_path_or_bytes)}, "
+            f"content: {_describe_source(content_image_path_or_bytes)}, "
+            f"init: {self.config.INIT_STRATEGY}"
         )
+        with span("init", strategy=self.config.INIT_STRATEGY):
+            input_img_tensor, num_steps = self._initial_input(
+                content_img_tensor, style_img_tensor
+            )
         output_tensor = self._run_style_transfer_core(
-            content_img_tensor, style_img_tensor, input_img_tensor
+            content_img_tensor,
+            style_img_tensor,
+            input_img_tensor,
+            content_targets,
+            style_targets,
+            num_steps=num_steps,
         )
         logger.info("NST process finished.")
 
-        output_pil_image = self._tensor_to_pil_image(output_tensor)
-        img_byte_arr = io.BytesIO()
-        output_pil_image.save(img_byte_arr, format="JPEG")
-        return img_byte_arr.getvalue()
+        with span("encode"):
+            result = self._codec.encode(output_tensor, self.config.OUTPUT_ENCODER)
+        if self.timing_model is not None:
+            self.timing_model.record(
+                "nst",
+                self._timing_style(style_key),
+                self.image_size,
+                current_precision(self.device),
+                num_steps,
+                time.perf_counter() - started,
+            )
+        return result
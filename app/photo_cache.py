@@ -0,0 +1,80 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+def cost_of(value: Any) -> int:
+    """Approximate memory held by a cached value, in bytes."""
+    # No tensors can exist before torch is imported, and the bot alone never does
+    torch = sys.modules.get("torch")
+    if torch is not None and isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(cost_of(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(cost_of(v) for v in value)
+    return 0
+
+
+class BoundedCache:
+    """Thread-safe LRU cache bounded by total size in bytes and by TTL.
+
+    Used for per-photo work that is worth keeping between requests: the
+    downloaded bytes of a Telegram photo (keyed by ``file_unique_id``) and
+    the preprocessed tensors and features engines derive from them (keyed by
+    ``file_unique_id`` and target size). Engines call it from worker threads.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = 1800.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[Any, int, float]] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] > self.ttl:
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        size = cost_of(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _pop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
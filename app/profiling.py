@@ -0,0 +1,177 @@
+"""On-demand torch.profiler captures of live engine jobs.
+
+An admin arms the profiler for the next N jobs of an engine (``/profile`` in
+the bot, ``POST /profile`` on the inference server). Engine entry points are
+wrapped with ``profiled(name)``; an armed job runs under ``torch.profiler``
+with shapes and memory recorded, and leaves a Chrome trace
+(``*.pt.trace.json``, also readable by the TensorBoard profiler plugin) and a
+top-ops table next to it.
+"""
+
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILED_ENGINES = ("nst", "cyclegan")
+
+
+@dataclass
+class ProfileCapture:
+    engine: str
+    trace_path: Path
+    summary_path: Path
+    duration: float
+    # (operator, self CPU ms, self device ms, self allocated bytes) of the
+    # most expensive operators
+    top_ops: list[tuple[str, float, float, int]] = field(default_factory=list)
+
+
+class ProfilerControl:
+    """Counts armed jobs per engine and records their profiles.
+
+    torch.profiler is process-wide, so only one job is captured at a time;
+    a job starting while another is being profiled runs normally and the
+    armed count is left for the next one.
+    """
+
+    def __init__(self, output_dir: str = "data/profiles", row_limit: int = 30):
+        self.output_dir = Path(output_dir)
+        self.row_limit = row_limit
+        self.captures: deque[ProfileCapture] = deque(maxlen=20)
+        self._armed: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._capture_lock = threading.Lock()
+
+    def arm(self, engines: Iterable[str], count: int) -> None:
+        engines = tuple(engines)
+        with self._lock:
+            for engine in engines:
+                self._armed[engine] = count
+        logger.info(f"Profiler armed for {count} job(s) of {', '.join(engines)}.")
+
+    def disarm(self) -> None:
+        with self._lock:
+            self._armed.clear()
+
+    def remaining(self, engine: str) -> int:
+        return self._armed.get(engine, 0)
+
+    def _take(self, engine: str) -> bool:
+        with self._lock:
+            if self._armed.get(engine, 0) <= 0:
+                return False
+            if not self._capture_lock.acquire(blocking=False):
+                return False
+            self._armed[engine] -= 1
+            return True
+
+    @contextmanager
+    def capture(self, engine: str):
+        if not self._take(engine):
+            yield
+            return
+        # Imported on use: the bot imports this module long before any engine
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        try:
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            start = time.perf_counter()
+            with profile(
+                activities=activities, record_shapes=True, profile_memory=True
+            ) as prof:
+                yield
+            self._save(engine, prof, time.perf_counter() - start)
+        finally:
+            self._capture_lock.release()
+
+    def _save(self, engine: str, prof, duration: float) -> None:
+        import torch
+
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            stem = f"{engine}-{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1000000}"
+            trace_path = self.output_dir / f"{stem}.pt.trace.json"
+            summary_path = self.output_dir / f"{stem}.txt"
+            prof.export_chrome_trace(str(trace_path))
+
+            sort_by = (
+                "self_device_time_total"
+                if torch.cuda.is_available()
+                else "self_cpu_time_total"
+            )
+            averages = prof.key_averages()
+            summary_path.write_text(
+                averages.table(sort_by=sort_by, row_limit=self.row_limit)
+                + "\n\nBy input shape:\n"
+                + prof.key_averages(group_by_input_shape=True).table(
+                    sort_by=sort_by, row_limit=self.row_limit
+                ),
+                encoding="utf-8",
+            )
+
+            events = sorted(averages, key=lambda e: getattr(e, sort_by), reverse=True)
+            top_ops = [
+                (
+                    e.key,
+                    e.self_cpu_time_total / 1000,
+                    e.self_device_time_total / 1000,
+                    e.self_cpu_memory_usage + e.self_device_memory_usage,
+                )
+                for e in events[:5]
+            ]
+            self.captures.append(
+                ProfileCapture(engine, trace_path, summary_path, duration, top_ops)
+            )
+            logger.info(f"Profile of a {engine} job saved to {trace_path}")
+        except Exception as e:
+            logger.error(f"Failed to save {engine} profile: {e}", exc_info=True)
+
+    def status(self) -> dict:
+        return {
+            "armed": {engine: self.remaining(engine) for engine in PROFILED_ENGINES},
+            "captures": [
+                {
+                    "engine": c.engine,
+                    "trace": str(c.trace_path),
+                    "summary": str(c.summary_path),
+                    "duration": round(c.duration, 3),
+                    "top_ops": c.top_ops,
+                }
+                for c in self.captures
+            ],
+        }
+
+
+PROFILER = ProfilerControl()
+
+
+def configure_profiler(output_dir: str, row_limit: Optional[int] = None) -> ProfilerControl:
+    PROFILER.output_dir = Path(output_dir)
+    if row_limit is not None:
+        PROFILER.row_limit = row_limit
+    return PROFILER
+
+
+def profiled(engine: str):
+    """Runs the wrapped engine entry point under PROFILER.capture(engine)."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with PROFILER.capture(engine):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Telegram file_ids of results already sent, plus in-flight deduplication.
+
+    Keys identify a request completely, e.g. ``(engine, content
+    file_unique_id, style identity, working size)``. A cache hit is answered by
+    re-sending the stored file_id: no inference and no upload. Identical
+    requests arriving while one is running wait for it instead of starting
+    their own (singleflight). Entries are bounded by count (LRU) and TTL.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[str, float]] = OrderedDict()
+        self._in_flight: dict[Hashable, tuple[asyncio.Future, int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] > self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, file_id: str) -> None:
+        self._entries[key] = (file_id, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def run(
+        self,
+        key: Optional[Hashable],
+        chat_id: int,
+        produce: Callable[[], Awaitable[Optional[str]]],
+    ) -> Optional[str]:
+        """Produces the result once per key.
+
+        ``produce`` computes and sends the result itself and returns the
+        file_id of the sent photo. Returns a file_id the caller still has to
+        send to ``chat_id``, or None when nothing is left to send (the result
+        was produced by this call, or by a duplicate request from the same
+        chat, e.g. a double tap). A failure of the running request is raised
+        in every request waiting for it. ``key=None`` disables caching.
+        """
+        if key is None:
+            await produce()
+            return None
+
+        file_id = self.get(key)
+        if file_id is not None:
+            logger.info(f"Result cache hit for {key}.")
+            return file_id
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            future, leader_chat_id = in_flight
+            logger.info(f"Joining in-flight request for {key}.")
+            try:
+                file_id = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this request itself was cancelled
+                raise RuntimeError("The identical request being waited on was cancelled.")
+            return None if leader_chat_id == chat_id else file_id
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (future, chat_id)
+        try:
+            file_id = await produce()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; avoid "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(file_id)
+            if file_id is not None:
+                self.put(key, file_id)
+            return None
+        finally:
+            self._in_flight.pop(key, None)
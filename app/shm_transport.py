@@ -0,0 +1,157 @@
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Iterator, Union
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "dlsbot_"
+
+# Names of segments created by pools in this process (tracked by our own
+# resource tracker registration, which must be left intact).
+_local_segments: set[str] = set()
+
+
+@dataclass(frozen=True)
+class BufferDescriptor:
+    """Small, picklable/JSON-able reference to a shared memory segment."""
+
+    name: str
+    size: int
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "size": self.size}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BufferDescriptor":
+        return cls(name=str(data["name"]), size=int(data["size"]))
+
+
+def _attach_segment(name: str) -> shared_memory.SharedMemory:
+    # Segments are owned (and unlinked) by the producer's SharedBufferPool.
+    # The consumer must not register them with its own resource tracker,
+    # otherwise the tracker unlinks them when the consumer process exits.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        segment = shared_memory.SharedMemory(name=name)
+        if name not in _local_segments:
+            try:
+                resource_tracker.unregister(segment._name, "shared_memory")
+            except Exception:
+                pass
+        return segment
+
+
+@contextmanager
+def attach_buffer(descriptor: BufferDescriptor) -> Iterator[memoryview]:
+    """Maps a segment created by another process and yields a read-only view.
+
+    The view is only valid inside the ``with`` block. Callers that need the data
+    afterwards (e.g. PIL lazy decoding) must finish using it before leaving.
+    """
+    segment = _attach_segment(descriptor.name)
+    view = segment.buf[: descriptor.size]
+    readonly_view = view.toreadonly()
+    try:
+        yield readonly_view
+    finally:
+        readonly_view.release()
+        view.release()
+        segment.close()
+
+
+class SharedBufferPool:
+    """Producer side of the shared memory transport.
+
+    Image payloads are written once into ``multiprocessing.shared_memory``
+    segments; only ``BufferDescriptor`` objects travel over the control channel.
+    Each segment is reference counted and unlinked when the last reference is
+    released, so a crashed consumer can't leak memory past ``close()``.
+    """
+
+    def __init__(self, prefix: str = SEGMENT_PREFIX):
+        self.prefix = prefix
+        self._segments: dict[str, shared_memory.SharedMemory] = {}
+        self._refcounts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, size: int) -> tuple[BufferDescriptor, memoryview]:
+        """Creates a segment and returns a writable view for in-place filling."""
+        if size <= 0:
+            raise ValueError("Shared buffer size must be positive.")
+        name = f"{self.prefix}{uuid.uuid4().hex[:16]}"
+        segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        with self._lock:
+            self._segments[name] = segment
+            self._refcounts[name] = 1
+            _local_segments.add(name)
+        return BufferDescriptor(name=name, size=size), segment.buf[:size]
+
+    def put(self, data: Union[bytes, bytearray, memoryview]) -> BufferDescriptor:
+        payload = memoryview(data).cast("B")
+        descriptor, view = self.allocate(payload.nbytes)
+        try:
+            view[:] = payload
+        finally:
+            view.release()
+        return descriptor
+
+    def get(self, descriptor: BufferDescriptor) -> memoryview:
+        """Returns a read-only view of a segment owned by this pool."""
+        with self._lock:
+            segment = self._segments.get(descriptor.name)
+        if segment is None:
+            raise KeyError(f"Unknown or released shared buffer: {descriptor.name}")
+        return segment.buf[: descriptor.size].toreadonly()
+
+    def acquire(self, descriptor: BufferDescriptor) -> None:
+        with self._lock:
+            if descriptor.name not in self._refcounts:
+                raise KeyError(f"Unknown or released shared buffer: {descriptor.name}")
+            self._refcounts[descriptor.name] += 1
+
+    def release(self, descriptor: BufferDescriptor) -> None:
+        with self._lock:
+            count = self._refcounts.get(descriptor.name)
+            if count is None:
+                return
+            if count > 1:
+                self._refcounts[descriptor.name] = count - 1
+                return
+            del self._refcounts[descriptor.name]
+            segment = self._segments.pop(descriptor.name)
+        self._destroy(segment)
+
+    def refcount(self, descriptor: BufferDescriptor) -> int:
+        with self._lock:
+            return self._refcounts.get(descriptor.name, 0)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._segments)
+
+    def close(self) -> None:
+        with self._lock:
+            segments = list(self._segments.values())
+            self._segments.clear()
+            self._refcounts.clear()
+        for segment in segments:
+            self._destroy(segment)
+
+    @staticmethod
+    def _destroy(segment: shared_memory.SharedMemory) -> None:
+        _local_segments.discard(segment.name)
+        try:
+            segment.close()
+        except BufferError:
+            # A view is still exported; the mapping goes away with the process,
+            # but the name must be unlinked regardless.
+            logger.warning(f"Shared buffer {segment.name} still has live views.")
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,225 @@
+"""Job duration history and the model that predicts durations from it.
+
+Engines record how long each job took, keyed by engine, style, image size,
+precision and optimization steps, in a small SQLite table. ``DurationModel``
+fits ``seconds ≈ a + b · megapixels · steps`` by least squares over that
+history: per style when the style has enough samples of its own, otherwise
+per engine and precision. Predictions feed the users' ETAs and the
+shortest-job-first / deadline scheduling of ``app.engines.WorkerPool``.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_PRECISION_NAMES = {
+    "torch.float32": "fp32",
+    "torch.bfloat16": "bf16",
+    "torch.float16": "fp16",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_timings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    engine TEXT NOT NULL,
+    style TEXT NOT NULL,
+    image_size INTEGER NOT NULL,
+    precision TEXT NOT NULL,
+    steps INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_timings_engine_idx ON job_timings (engine, precision);
+"""
+
+
+def current_precision(device) -> str:
+    """Precision engine code runs at on ``device``: fp32 unless under autocast."""
+    import torch  # loaded by the engine calling this anyway
+
+    device_type = torch.device(device).type if device is not None else "cpu"
+    if torch.is_autocast_enabled(device_type):
+        dtype = torch.get_autocast_dtype(device_type)
+        return _PRECISION_NAMES.get(str(dtype), str(dtype).removeprefix("torch."))
+    return "fp32"
+
+
+class TimingStore:
+    """SQLite-backed history of job durations, ``max_rows`` newest per engine."""
+
+    def __init__(self, path: Path | str, max_rows: int = 5000, busy_timeout: float = 30.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=busy_timeout, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def add(
+        self,
+        engine: str,
+        style: str,
+        image_size: int,
+        precision: str,
+        steps: int,
+        seconds: float,
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO job_timings (engine, style, image_size, precision, "
+                "steps, seconds, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (engine, style, image_size, precision, steps, seconds, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM job_timings WHERE engine = ? AND id <= ("
+                "SELECT id FROM job_timings WHERE engine = ? "
+                "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (engine, engine, self.max_rows),
+            )
+
+    def samples(self, engine: str, precision: str) -> list[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT style, image_size, steps, seconds FROM job_timings "
+                "WHERE engine = ? AND precision = ? ORDER BY id",
+                (engine, precision),
+            ).fetchall()
+
+    def groups(self) -> list[tuple[str, str]]:
+        """(engine, precision) pairs with recorded history."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT engine, precision FROM job_timings"
+            ).fetchall()
+        return [(row["engine"], row["precision"]) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _work(image_size: int, steps: int) -> float:
+    """Megapixel-steps: NST cost grows with both, CycleGAN has one step."""
+    return image_size * image_size / 1e6 * max(steps, 1)
+
+
+def _fit(rows) -> tuple[float, float]:
+    """Least-squares (intercept, slope) of seconds over work; both kept >= 0."""
+    import numpy as np
+
+    work = np.array([_work(r["image_size"], r["steps"]) for r in rows])
+    seconds = np.array([r["seconds"] for r in rows])
+    if np.ptp(work) == 0:
+        # One size and step count seen so far: nothing to fit a slope with
+        return 0.0, float(np.median(seconds) / work[0])
+    design = np.stack([np.ones_like(work), work], axis=1)
+    (intercept, slope), *_ = np.linalg.lstsq(design, seconds, rcond=None)
+    if slope < 0 or intercept < 0:
+        # Noise on a narrow range of sizes; proportional cost is the safer guess
+        return 0.0, float(np.sum(seconds * work) / np.sum(work * work))
+    return float(intercept), float(slope)
+
+
+class DurationModel:
+    """Predicts job seconds from a TimingStore, refitting as history grows.
+
+    Fitting reads the store and runs numpy, so it happens in ``record`` (on
+    the engine worker thread that finished the job) and in ``load``; the
+    handlers' ``predict`` only reads the cached fits and never blocks the
+    event loop.
+    """
+
+    def __init__(self, store: TimingStore, min_samples: int = 5, refit_every: int = 10):
+        self.store = store
+        self.min_samples = min_samples
+        self.refit_every = refit_every
+        self._lock = threading.Lock()
+        # (engine, precision) -> {style or None: (intercept, slope)}
+        self._fits: dict[tuple[str, str], dict] = {}
+        self._new_samples: dict[tuple[str, str], int] = {}
+
+    def load(self, engine: Optional[str] = None) -> None:
+        """Fits the stored history of ``engine`` (all engines if None)."""
+        try:
+            groups = self.store.groups()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read job timing history: {e}")
+            return
+        for group_engine, precision in groups:
+            if engine is None or group_engine == engine:
+                self.refit(group_engine, precision)
+
+    def refit(self, engine: str, precision: str) -> None:
+        group = (engine, precision)
+        try:
+            rows = self.store.samples(engine, precision)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read {engine} job timings: {e}")
+            return
+        fits = {}
+        if len(rows) >= self.min_samples:
+            fits[None] = _fit(rows)
+            by_style: dict[str, list] = {}
+            for row in rows:
+                by_style.setdefault(row["style"], []).append(row)
+            for style, style_rows in by_style.items():
+                if len(style_rows) >= self.min_samples:
+                    fits[style] = _fit(style_rows)
+        with self._lock:
+            self._fits[group] = fits
+            self._new_samples[group] = 0
+
+    def record(
+        self,
+        engine: str,
+        style: str,
+        image_size: int,
+        precision: str,
+        steps: int,
+        seconds: float,
+    ) -> None:
+        try:
+            self.store.add(engine, style, image_size, precision, steps, seconds)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to record {engine} job timing: {e}")
+            return
+        group = (engine, precision)
+        with self._lock:
+            self._new_samples[group] = self._new_samples.get(group, 0) + 1
+            # Until the first fit exists every sample may be the one it needs
+            stale = (
+                None not in self._fits.get(group, {})
+                or self._new_samples[group] >= self.refit_every
+            )
+        if stale:
+            self.refit(engine, precision)
+
+    def predict(
+        self,
+        engine: str,
+        image_size: Optional[int],
+        steps: int = 1,
+        style: Optional[str] = None,
+        precision: str = "fp32",
+    ) -> Optional[float]:
+        """Expected seconds of one job; None until the history is long enough."""
+        if not image_size:
+            return None
+        with self._lock:
+            fits = self._fits.get((engine, precision), {})
+            fit = fits.get(style) or fits.get(None)
+        if fit is None:
+            return None
+        intercept, slope = fit
+        return intercept + slope * _work(image_size, steps)
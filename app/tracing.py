@@ -0,0 +1,282 @@
+"""Per-request tracing: a request id and timed spans for every stage.
+
+``TracingMiddleware`` opens a trace for each Telegram update; its id is the
+request id. ``span()`` records a stage under the current trace from anywhere
+below it, including engine code running in worker threads (``run_engine_call``
+copies the context) and the inference server (the trace id travels in a W3C
+``traceparent`` header). A finished trace is logged as one JSON line and, if
+configured, appended to a file in the OTLP/JSON format that an OpenTelemetry
+Collector ``otlpjsonfile`` receiver can read.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+
+class Trace:
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or _new_id(16)
+        self.spans: list[Span] = []
+
+    @property
+    def request_id(self) -> str:
+        return self.trace_id
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def current_request_id() -> Optional[str]:
+    active_trace = _current_trace.get()
+    return active_trace.request_id if active_trace is not None else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times a stage of the current request; a no-op outside of a trace."""
+    active_trace = _current_trace.get()
+    if active_trace is None:
+        yield _NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(
+        name, active_trace.trace_id, parent.span_id if parent else None, attributes
+    )
+    active_trace.spans.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def traceparent() -> Optional[str]:
+    """W3C trace context of the current span, for outgoing requests."""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f"00-{current.trace_id}-{current.span_id}-01"
+
+
+def parse_traceparent(value: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    parts = (value or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    def __init__(
+        self,
+        service_name: str = "stylebot",
+        export_path: Optional[str] = None,
+        slow_threshold: float = 0.0,
+    ):
+        self.service_name = service_name
+        self.export_path = Path(export_path) if export_path else None
+        self.slow_threshold = slow_threshold
+        self._export_lock = threading.Lock()
+        if self.export_path is not None:
+            self.export_path.parent.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def trace(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_span_id: Optional[str] = None,
+        **attributes,
+    ):
+        new_trace = Trace(trace_id)
+        trace_token = _current_trace.set(new_trace)
+        root = Span(name, new_trace.trace_id, parent_span_id, attributes)
+        new_trace.spans.append(root)
+        span_token = _current_span.set(root)
+        try:
+            yield new_trace
+        except BaseException as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            root.end_ns = time.time_ns()
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if root.duration >= self.slow_threshold:
+                self._emit(new_trace)
+
+    def _emit(self, finished: Trace) -> None:
+        spans = list(finished.spans)
+        root = spans[0]
+        logger.info(
+            json.dumps(
+                {
+                    "request_id": finished.request_id,
+                    "name": root.name,
+                    "duration_ms": round(root.duration * 1000, 1),
+                    "error": root.error,
+                    "spans": [
+                        {
+                            "name": s.name,
+                            "offset_ms": round((s.start_ns - root.start_ns) / 1e6, 1),
+                            "duration_ms": round(s.duration * 1000, 1),
+                            **({"error": s.error} if s.error else {}),
+                            **s.attributes,
+                        }
+                        for s in spans[1:]
+                    ],
+                },
+                ensure_ascii=False,
+                default=str,
+            )
+        )
+        if self.export_path is not None:
+            self._export(spans)
+
+    def _export(self, spans: list[Span]) -> None:
+        otlp_spans = []
+        for s in spans:
+            otlp_span = {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns or time.time_ns()),
+                "attributes": [
+                    {"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()
+                ],
+                "status": (
+                    {"code": 2, "message": s.error} if s.error else {"code": 1}
+                ),
+            }
+            if s.parent_id:
+                otlp_span["parentSpanId"] = s.parent_id
+            otlp_spans.append(otlp_span)
+        record = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": otlp_spans}],
+                }
+            ]
+        }
+        line = json.dumps(record, default=str) + "\n"
+        try:
+            with self._export_lock, open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to export trace to {self.export_path}: {e}")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracing(
+    service_name: str = "stylebot",
+    export_path: Optional[str] = None,
+    slow_threshold: float = 0.0,
+) -> Tracer:
+    global _tracer
+    _tracer = Tracer(service_name, export_path, slow_threshold)
+    return _tracer
+
+
+@contextmanager
+def trace(
+    name: str,
+    trace_id: Optional[str] = None,
+    parent_span_id: Optional[str] = None,
+    **attributes,
+):
+    """Starts a trace with the configured tracer; a no-op if tracing is off."""
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.trace(name, trace_id, parent_span_id, **attributes) as current:
+        yield current
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Opens a trace per update and passes its id to handlers as ``request_id``."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        attributes = {}
+        if isinstance(event, Update):
+            attributes["update_id"] = event.update_id
+            attributes["update_type"] = event.event_type
+        with trace("update", **attributes) as current:
+            data["request_id"] = current.request_id if current is not None else None
+            return await handler(event, data)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """Remembers the last ``size`` update ids to drop Telegram redeliveries."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._seen: OrderedDict[int, None] = OrderedDict()
+
+    def check_and_add(self, update_id: int) -> bool:
+        """Returns True if the update was already seen."""
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        return False
+
+    def forget(self, update_id: int) -> None:
+        self._seen.pop(update_id, None)
+
+
+class BackgroundRequestHandler(SimpleRequestHandler):
+    """Webhook handler that acknowledges updates before processing them.
+
+    Telegram gets an empty 200 as soon as the update is parsed; the handler
+    chain runs in a background task. At most ``max_concurrency`` updates are
+    processed at once and at most ``max_pending`` more may wait for a slot
+    (beyond that Telegram gets 503 and redelivers later). Redelivered updates
+    are dropped by ``update_id``.
+
+    Only the public request handler API is overridden (``handle``, ``close``)
+    and updates are fed through the public Dispatcher methods, so aiogram
+    upgrades cannot silently change the backlog accounting.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        max_concurrency: int = 64,
+        max_pending: int = 1000,
+        dedup_size: int = 10000,
+        shutdown_timeout: float = 10.0,
+        **kwargs: Any,
+    ):
+        super().__init__(
+            dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs
+        )
+        self.max_pending = max_pending
+        self.shutdown_timeout = shutdown_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._deduplicator = UpdateDeduplicator(dedup_size)
+        self._tasks: set[asyncio.Task] = set()
+        self._waiting = 0
+
+    @property
+    def pending_count(self) -> int:
+        """Updates accepted and not finished yet, running or waiting."""
+        return len(self._tasks)
+
+    @property
+    def waiting_count(self) -> int:
+        """Accepted updates still waiting for a processing slot."""
+        return self._waiting
+
+    async def _feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(bot=bot, result=result)
+
+    async def _bounded_feed_update(self, bot: Bot, update: dict[str, Any]) -> None:
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            await self._feed_update(bot, update)
+        except Exception as e:
+            logger.error(
+                f"Error while processing update {update.get('update_id')}: {e}",
+                exc_info=True,
+            )
+        finally:
+            self._semaphore.release()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+
+        update = await request.json(loads=bot.session.json_loads)
+        update_id: Optional[int] = update.get("update_id")
+
+        if update_id is not None and self._deduplicator.check_and_add(update_id):
+            logger.info(f"Dropping duplicate update {update_id}.")
+            return web.json_response({}, dumps=bot.session.json_dumps)
+
+        if self._waiting >= self.max_pending:
+            logger.warning(
+                f"Webhook backlog is full ({self._waiting} updates waiting), "
+                f"asking Telegram to redeliver update {update_id}."
+            )
+            if update_id is not None:
+                self._deduplicator.forget(update_id)
+            return web.Response(status=503, text="Too many pending updates")
+
+        self._waiting += 1
+        task = asyncio.create_task(self._bounded_feed_update(bot=bot, update=update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def close(self) -> None:
+        pending = set(self._tasks)
+        if pending:
+            logger.info(f"Waiting for {len(pending)} background update(s)...")
+            _, still_running = await asyncio.wait(pending, timeout=self.shutdown_timeout)
+            for task in still_running:
+                task.cancel()
+        await super().close()
@@ -0,0 +1 @@
+"""Offline engine benchmarks: ``python -m benchmarks run`` / ``python -m benchmarks compare``."""
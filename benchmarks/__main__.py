@@ -0,0 +1,305 @@
+"""Offline benchmarks of the NST and CycleGAN engines.
+
+    python -m benchmarks run --engines nst cyclegan --sizes 128 256 --output bench.json
+    python -m benchmarks compare baseline.json bench.json --threshold 0.1
+    python -m benchmarks loadtest --users 50 --rate 2 --mix nst=1,cyclegan=3
+    python -m benchmarks loadtest --replay updates.jsonl --speed 4
+    python -m benchmarks quality --engines nst cyclegan --nst-steps 100
+
+``run`` sweeps image size, torch thread count, precision and (for the
+CycleGAN forward pass) batch size and writes per-case latency percentiles,
+throughput, peak RSS and NST optimizer steps/sec with the environment. ``compare``
+exits with status 1 if any case regressed beyond the threshold. ``loadtest``
+runs the whole bot against a local Bot API stand-in (see benchmarks.loadtest)
+and reports end-to-end latency, throughput and the error rate. ``quality``
+compares the output of each speed mode with the fp32 reference (see
+benchmarks.quality) and exits with status 1 if a mode breaks a threshold.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+import torch
+
+from app.job_store import JOB_KIND_CYCLEGAN, JOB_KIND_NST
+from benchmarks.engines import build_cyclegan_engine, build_nst_engine
+from benchmarks.runner import PRECISIONS, compare, environment, make_cases, run_case
+
+logger = logging.getLogger("benchmarks")
+
+
+def _run(args) -> int:
+    cases = make_cases(args.engines, args.sizes, args.threads, args.precisions, args.batches)
+    engines = {}
+    if "nst" in args.engines:
+        engines["nst"] = build_nst_engine(args.weights, args.device, args.nst_steps)
+    if "cyclegan" in args.engines:
+        engines["cyclegan"] = build_cyclegan_engine(args.weights, args.device)
+
+    results = []
+    for case in cases:
+        logger.info(f"Running {case.key}")
+        try:
+            result = run_case(engines[case.engine], case, args.repeat, args.warmup)
+        except Exception as e:
+            # e.g. fp16 autocast is not supported on every CPU build
+            logger.warning(f"{case.key} skipped: {e}")
+            continue
+        latency = result["latency_ms"]
+        logger.info(
+            f"{case.key}: p50 {latency['p50']:.1f} ms, p99 {latency['p99']:.1f} ms, "
+            f"{result['throughput_images_per_s']:.2f} img/s, "
+            f"peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+        results.append(result)
+
+    report = {
+        "environment": environment(),
+        "settings": {
+            "weights": args.weights,
+            "device": args.device,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "nst_steps": args.nst_steps,
+        },
+        "results": results,
+    }
+    _write_report(report, args.output)
+    return 0
+
+
+def _write_report(report: dict, output) -> None:
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        logger.info(f"Results written to {output}")
+    else:
+        print(text)
+
+
+def _parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        flow, _, weight = part.partition("=")
+        if flow not in (JOB_KIND_NST, JOB_KIND_CYCLEGAN):
+            raise argparse.ArgumentTypeError(f"unknown flow {flow!r}")
+        mix[flow] = float(weight or 1)
+    return mix
+
+
+async def _loadtest(args) -> int:
+    # Imported here: the bot modules read their configs on import
+    from benchmarks.fake_bot_api import FakeBotAPI
+    from benchmarks.loadtest import BotUnderTest, load_images, replay, report, run_load
+
+    engines = None
+    if args.weights != "config":
+        engines = {}
+        if JOB_KIND_NST in args.mix or args.replay:
+            engines[JOB_KIND_NST] = build_nst_engine(args.weights, args.device, args.nst_steps)
+            if args.nst_size:
+                engines[JOB_KIND_NST].image_size = args.nst_size
+        if JOB_KIND_CYCLEGAN in args.mix or args.replay:
+            engines[JOB_KIND_CYCLEGAN] = build_cyclegan_engine(args.weights, args.device)
+            if args.cyclegan_size:
+                engines[JOB_KIND_CYCLEGAN].config.IMAGE_SIZE = args.cyclegan_size
+
+    images = load_images(args.images)
+    api = FakeBotAPI(latency=args.api_latency, default_image=images[0])
+    async with BotUnderTest(api, engines=engines) as bot:
+        if args.replay:
+            summary = await replay(bot, args.replay, args.speed, args.timeout)
+        else:
+            summary = await run_load(
+                bot, args.users, args.rate, args.mix, images, args.think_time,
+                args.timeout, not args.shared_photos, args.seed, args.record,
+            )
+    settings = {
+        key: value for key, value in vars(args).items() if key not in ("command", "output")
+    }
+    _write_report(report(summary, settings), args.output)
+    if not args.replay:
+        logger.info(
+            f"{summary['completed']}/{summary['users']} flows completed, "
+            f"error rate {summary['error_rate']:.1%}, "
+            f"{summary['throughput_results_per_s']:.2f} results/s"
+        )
+    return 0
+
+
+def _compare(args) -> int:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold, args.rss_threshold)
+    for r in regressions:
+        print(
+            f"REGRESSION {r['key']} {r['metric']}: "
+            f"{r['baseline']:.2f} -> {r['current']:.2f} ({r['change']:+.1%})"
+        )
+    if not regressions:
+        print("No regressions.")
+    return 1 if regressions else 0
+
+
+def _parse_thresholds(text: str) -> dict[str, float]:
+    from benchmarks.quality import DEFAULT_THRESHOLDS
+
+    thresholds = {}
+    for part in text.split(","):
+        key, _, value = part.partition("=")
+        if key not in DEFAULT_THRESHOLDS:
+            raise argparse.ArgumentTypeError(
+                f"unknown threshold {key!r}; use one of {', '.join(DEFAULT_THRESHOLDS)}"
+            )
+        thresholds[key] = float(value)
+    return thresholds
+
+
+def _quality(args) -> int:
+    from benchmarks.quality import (
+        MODES,
+        QualityMeter,
+        evaluate,
+        load_image_set,
+        scaled_nst_steps,
+    )
+
+    nst_engine = build_nst_engine(args.weights, args.device)
+    if args.nst_size:
+        nst_engine.image_size = args.nst_size
+    if args.nst_steps:
+        for name, value in scaled_nst_steps(nst_engine.config, args.nst_steps).items():
+            setattr(nst_engine.config, name, value)
+    engines = {}
+    if "nst" in args.engines:
+        engines["nst"] = nst_engine
+    if "cyclegan" in args.engines:
+        engines["cyclegan"] = build_cyclegan_engine(args.weights, args.device)
+        if args.cyclegan_size:
+            engines["cyclegan"].config.IMAGE_SIZE = args.cyclegan_size
+
+    contents, styles = load_image_set(args.contents, args.styles, args.limit)
+    modes = [m for m in MODES if not args.modes or m.name in args.modes]
+    # The perceptual metric always uses the NST engine's VGG
+    result = evaluate(
+        engines, QualityMeter(nst_engine), contents, styles, modes,
+        args.threshold, args.save_dir,
+    )
+    report = {
+        "environment": environment(),
+        "settings": {
+            key: value for key, value in vars(args).items() if key not in ("command", "output")
+        },
+        **result,
+    }
+    _write_report(report, args.output)
+    for failure in result["failures"]:
+        print(
+            f"QUALITY {failure['engine']}/{failure['mode']} {failure['metric']}: "
+            f"{failure['value']:.4f} (threshold {failure['threshold']})"
+        )
+    if not result["failures"]:
+        print("All modes within quality thresholds.")
+    return 1 if result["failures"] else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmark sweep")
+    run.add_argument("--engines", nargs="+", choices=["nst", "cyclegan"],
+                     default=["nst", "cyclegan"])
+    run.add_argument("--sizes", nargs="+", type=int, default=[128, 256])
+    run.add_argument("--threads", nargs="+", type=int, default=[torch.get_num_threads()])
+    run.add_argument("--precisions", nargs="+", choices=list(PRECISIONS), default=["fp32"])
+    run.add_argument("--batches", nargs="+", type=int, default=[1, 4])
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--warmup", type=int, default=1)
+    run.add_argument("--nst-steps", type=int, default=None,
+                     help="Override NST optimizer steps (default: config)")
+    run.add_argument("--weights", choices=["auto", "local", "standin"], default="auto",
+                     help="Local model files or seeded stand-ins of the same architecture")
+    run.add_argument("--device", default="cpu")
+    run.add_argument("--output", "-o", default=None, help="JSON file (default: stdout)")
+
+    cmp = commands.add_parser("compare", help="Compare a run against a baseline")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.10,
+                     help="Tolerated relative slowdown of p50 latency / throughput")
+    cmp.add_argument("--rss-threshold", type=float, default=0.20,
+                     help="Tolerated relative growth of peak RSS")
+
+    load = commands.add_parser("loadtest", help="Load-test the bot end to end")
+    load.add_argument("--users", type=int, default=20, help="Synthetic users in total")
+    load.add_argument("--rate", type=float, default=1.0, help="Mean user arrivals per second")
+    load.add_argument("--mix", type=_parse_mix, default={JOB_KIND_NST: 1, JOB_KIND_CYCLEGAN: 1},
+                      help="Flow weights, e.g. nst=1,cyclegan=3")
+    load.add_argument("--think-time", type=float, default=0.0,
+                      help="Mean pause between a user's steps, seconds")
+    load.add_argument("--timeout", type=float, default=300.0,
+                      help="Max wait for a reply, seconds")
+    load.add_argument("--images", default=None,
+                      help="Directory of photos to send (default: synthetic photos)")
+    load.add_argument("--shared-photos", action="store_true",
+                      help="Same image means same file_unique_id, so the result cache hits")
+    load.add_argument("--api-latency", type=float, default=0.0,
+                      help="Delay added to every Bot API call, seconds")
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--record", default=None, help="Write the pushed updates for --replay")
+    load.add_argument("--replay", default=None, help="Replay an update log instead")
+    load.add_argument("--speed", type=float, default=1.0, help="Replay speed-up")
+    load.add_argument("--weights", choices=["auto", "local", "standin", "config"],
+                      default="auto",
+                      help="Engines as in 'run'; 'config' loads them like the bot does "
+                           "(or uses INFERENCE_SERVER_URLS)")
+    load.add_argument("--nst-steps", type=int, default=None)
+    load.add_argument("--nst-size", type=int, default=None)
+    load.add_argument("--cyclegan-size", type=int, default=None)
+    load.add_argument("--device", default="cpu")
+    load.add_argument("--output", "-o", default=None, help="JSON file (default: stdout)")
+
+    quality = commands.add_parser("quality", help="Compare speed modes with fp32 references")
+    quality.add_argument("--engines", nargs="+", choices=["nst", "cyclegan"],
+                         default=["nst", "cyclegan"])
+    quality.add_argument("--modes", nargs="+", default=None,
+                         help="Mode names to check (default: all)")
+    quality.add_argument("--contents", default=None,
+                         help="Directory of content photos (default: synthetic photos)")
+    quality.add_argument("--styles", default=None,
+                         help="Directory of style images (default: static/style_images)")
+    quality.add_argument("--limit", type=int, default=2,
+                         help="Images taken from each directory")
+    quality.add_argument("--threshold", type=_parse_thresholds, default={},
+                         help="Overrides for all modes, e.g. min_psnr=28,max_perceptual=0.1")
+    quality.add_argument("--nst-steps", type=int, default=None,
+                         help="Reference NST steps; other initializations keep their ratio")
+    quality.add_argument("--nst-size", type=int, default=None)
+    quality.add_argument("--cyclegan-size", type=int, default=None)
+    quality.add_argument("--weights", choices=["auto", "local", "standin"], default="auto")
+    quality.add_argument("--device", default="cpu")
+    quality.add_argument("--save-dir", default=None,
+                         help="Also write every reference and mode output here")
+    quality.add_argument("--output", "-o", default=None, help="JSON file (default: stdout)")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        stream=sys.stderr,
+    )
+    if args.command == "loadtest":
+        return asyncio.run(_loadtest(args))
+    if args.command == "quality":
+        return _quality(args)
+    return _run(args) if args.command == "run" else _compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Engines for offline benchmarks: local weights when present, stand-ins otherwise.
+
+Stand-ins have the production architectures (the first VGG19 feature layers
+for NST, the 9-block ResnetGenerator for CycleGAN) with seeded random
+weights, so timings match the real models without downloading anything.
+"""
+
+import copy
+import functools
+import logging
+from pathlib import Path
+from typing import Optional
+
+import torch
+import torch.nn as nn
+from torchvision.models import vgg19
+
+from app.architectures.cyclegan_networks import ResnetGenerator
+from app.cyclegan_config import load_cyclegan_config
+from app.cyclegan_engine import CycleGANEngine
+from app.nst_config import load_nst_config
+from app.nst_engine import NSTEngine
+
+logger = logging.getLogger(__name__)
+
+STANDIN_STYLE = "standin"
+# Layers kept by utils/shrinker_vgg19.py for the production model
+VGG_FEATURE_LAYERS = 11
+
+
+class StandInNSTEngine(NSTEngine):
+    def _load_model(self):
+        torch.manual_seed(0)
+        self.cnn_model = vgg19(weights=None).features[:VGG_FEATURE_LAYERS]
+        self.cnn_model = self.cnn_model.to(self.device).eval()
+        self.cnn_normalization_mean = torch.tensor(self.config.NORMALIZATION_MEAN).to(
+            self.device, dtype=torch.float
+        )
+        self.cnn_normalization_std = torch.tensor(self.config.NORMALIZATION_STD).to(
+            self.device, dtype=torch.float
+        )
+
+    def _load_default_styles(self):
+        self.default_styles = {}
+
+
+class StandInCycleGANEngine(CycleGANEngine):
+    def _load_all_models(self):
+        torch.manual_seed(0)
+        generator = ResnetGenerator(
+            input_nc=self.config.INPUT_CHANNELS,
+            output_nc=self.config.OUTPUT_CHANNELS,
+            ngf=64,
+            norm_layer=functools.partial(
+                nn.InstanceNorm2d, affine=False, track_running_stats=False
+            ),
+            use_dropout=False,
+            n_blocks=self.config.NUM_RESIDUAL_BLOCKS,
+        )
+        self.models = {STANDIN_STYLE: generator.to(self.device).eval()}
+        self.config.styles = {STANDIN_STYLE: {"display_name": "Stand-in"}}
+        self._initialized = True
+
+
+def _local_nst_weights(config) -> bool:
+    return (Path(__file__).resolve().parent.parent / "app" / config.MODEL_PATH).exists()
+
+
+def build_nst_engine(
+    weights: str = "auto", device: str = "cpu", num_steps: Optional[int] = None
+) -> NSTEngine:
+    """``weights``: "local", "standin" or "auto" (local if the file exists)."""
+    config = copy.copy(load_nst_config())
+    config.DEVICE_PREFERENCE = device
+    config.TENSOR_CACHE_MAX_BYTES = 0  # every run must do the full work
+    if num_steps is not None:
+        config.NUM_STEPS = num_steps
+        config.INIT_NUM_STEPS = {name: num_steps for name in config.INIT_NUM_STEPS}
+    use_local = weights == "local" or (weights == "auto" and _local_nst_weights(config))
+    engine = (NSTEngine if use_local else StandInNSTEngine)(config)
+    if not engine._initialized:
+        raise RuntimeError("NST engine failed to initialize; see the log above.")
+    logger.info(f"NST benchmark engine: {'local weights' if use_local else 'stand-in'}")
+    return engine
+
+
+def build_cyclegan_engine(weights: str = "auto", device: str = "cpu") -> CycleGANEngine:
+    config = copy.copy(load_cyclegan_config())
+    config.DEVICE_PREFERENCE = device
+    config.TENSOR_CACHE_MAX_BYTES = 0
+    engine = None
+    if weights in ("auto", "local"):
+        engine = CycleGANEngine(config)
+        if not engine._initialized:
+            if weights == "local":
+                raise RuntimeError("No local CycleGAN models could be loaded.")
+            engine = None
+    if engine is None:
+        engine = StandInCycleGANEngine(copy.copy(config))
+    logger.info(
+        f"CycleGAN benchmark engine: {', '.join(engine.models)}"
+        f"{' (stand-in)' if isinstance(engine, StandInCycleGANEngine) else ''}"
+    )
+    return engine
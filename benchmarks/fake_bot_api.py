@@ -0,0 +1,239 @@
+"""Local stand-in for the Telegram Bot API, for load tests.
+
+Speaks enough of the HTTP API for the bot's flows: ``getUpdates`` long
+polling fed by ``push_update``, ``getFile`` and file downloads served from
+registered images, and replies (``sendMessage``, ``sendPhoto``,
+``editMessageText``...) recorded and handed to whoever subscribed to the
+chat. ``latency`` adds a fixed delay to every call to model the round trip
+to Telegram.
+"""
+
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from aiohttp import web
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    "id": 100000,
+    "is_bot": True,
+    "first_name": "LoadTestBot",
+    "username": "loadtest_bot",
+}
+# Calls that answer a chat; deleteMessage and the like are bookkeeping
+REPLY_METHODS = {"sendmessage", "sendphoto", "editmessagetext", "senddocument"}
+
+
+@dataclass
+class BotCall:
+    method: str  # lower-cased Bot API method name
+    params: dict
+    time: float = field(default_factory=time.monotonic)
+
+    @property
+    def chat_id(self) -> Optional[int]:
+        chat_id = self.params.get("chat_id")
+        return int(chat_id) if chat_id is not None else None
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        token: str = "123456:LOADTEST",
+        latency: float = 0.0,
+        default_image: Optional[bytes] = None,
+    ):
+        self.token = token
+        self.latency = latency
+        self.default_image = default_image
+        self.calls: Counter[str] = Counter()
+        self.observers: list[Callable[[BotCall], None]] = []
+        self.polling_started = asyncio.Event()
+        self._files: dict[str, bytes] = {}
+        self._updates: list[dict] = []
+        self._updates_changed = asyncio.Condition()
+        self._chat_queues: dict[int, asyncio.Queue] = {}
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    # --- test side ---
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        logger.info(f"Fake Bot API listening on {self.url}")
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_photo(self, data: bytes, unique_id: Optional[str] = None) -> list[dict]:
+        """Registers an image and returns the ``photo`` field of a message with it.
+
+        ``unique_id`` defaults to a hash of the bytes, so the same picture
+        sent twice is recognisable, as in Telegram.
+        """
+        file_id = f"file-{next(self._file_ids)}"
+        self._files[file_id] = data
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+        return [
+            {
+                "file_id": file_id,
+                "file_unique_id": unique_id or hashlib.sha1(data).hexdigest()[:16],
+                "width": width,
+                "height": height,
+                "file_size": len(data),
+            }
+        ]
+
+    async def push_update(self, update: dict) -> int:
+        """Queues an update for getUpdates; the update_id is assigned here."""
+        update = {**update, "update_id": next(self._update_ids)}
+        async with self._updates_changed:
+            self._updates.append(update)
+            self._updates_changed.notify_all()
+        return update["update_id"]
+
+    def subscribe(self, chat_id: int) -> asyncio.Queue:
+        """Replies to ``chat_id`` are put into the returned queue."""
+        return self._chat_queues.setdefault(chat_id, asyncio.Queue())
+
+    def unsubscribe(self, chat_id: int) -> None:
+        self._chat_queues.pop(chat_id, None)
+
+    # --- bot side ---
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        if request.match_info["token"] != self.token:
+            return self._error(401, "Unauthorized")
+        method = request.match_info["method"].lower()
+        params = await self._read_params(request)
+        self.calls[method] += 1
+        if self.latency and method != "getupdates":
+            await asyncio.sleep(self.latency)
+
+        if method == "getupdates":
+            return self._ok(await self._get_updates(params))
+
+        call = BotCall(method, params)
+        result = self._result(call)
+        if result is None:
+            return self._error(400, "Bad Request: file not found")
+        for observer in self.observers:
+            observer(call)
+        if method in REPLY_METHODS and call.chat_id in self._chat_queues:
+            self._chat_queues[call.chat_id].put_nowait(call)
+        return self._ok(result)
+
+    async def _handle_file(self, request: web.Request) -> web.StreamResponse:
+        if request.match_info["token"] != self.token:
+            return web.Response(status=401)
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].split(".", 1)[0]
+        data = self._files.get(file_id, self.default_image)
+        if data is None:
+            return web.Response(status=404)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=data, content_type="image/jpeg")
+
+    async def _read_params(self, request: web.Request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            params[key] = value.file.read() if isinstance(value, web.FileField) else value
+        # Uploads arrive as "attach://<field>" plus a file field of that name
+        for key, value in list(params.items()):
+            if isinstance(value, str) and value.startswith("attach://"):
+                params[key] = params.pop(value[len("attach://"):], b"")
+        return params
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        self.polling_started.set()
+        offset = int(params.get("offset", 0))
+        timeout = float(params.get("timeout", 0))
+        limit = int(params.get("limit", 100))
+        async with self._updates_changed:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(self._updates_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:limit]
+
+    def _message(self, call: BotCall, **fields) -> dict:
+        return {
+            "message_id": int(call.params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": call.chat_id, "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    def _result(self, call: BotCall):
+        params = call.params
+        if call.method == "getme":
+            return BOT_USER
+        if call.method == "getwebhookinfo":
+            return {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        if call.method == "getfile":
+            file_id = params["file_id"]
+            data = self._files.get(file_id, self.default_image)
+            if data is None:
+                return None
+            return {
+                "file_id": file_id,
+                "file_unique_id": hashlib.sha1(data).hexdigest()[:16],
+                "file_size": len(data),
+                "file_path": f"photos/{file_id}.jpg",
+            }
+        if call.method in ("sendmessage", "editmessagetext"):
+            fields = {"text": params.get("text", "")}
+            if params.get("reply_markup"):
+                fields["reply_markup"] = json.loads(params["reply_markup"])
+            return self._message(call, **fields)
+        if call.method == "sendphoto":
+            photo = params.get("photo")
+            if isinstance(photo, (bytes, bytearray)):
+                sizes = self.add_photo(bytes(photo))
+            else:
+                # Re-sending an earlier result by file_id
+                sizes = [{"file_id": photo, "file_unique_id": photo, "width": 1, "height": 1}]
+            return self._message(call, photo=sizes, caption=params.get("caption"))
+        # answerCallbackQuery, deleteMessage, deleteWebhook, setMyCommands...
+        return True
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str) -> web.Response:
+        return web.json_response(
+            {"ok": False, "error_code": code, "description": description}, status=code
+        )
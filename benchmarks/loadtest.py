@@ -0,0 +1,484 @@
+"""End-to-end load test: the real dispatcher against a local Bot API stand-in.
+
+``create_bot_and_dispatcher`` builds the bot exactly as in production, with
+``TELEGRAM_API_URL`` pointing at ``FakeBotAPI``, and polls it. Synthetic
+users arrive as a Poisson process and walk through ``/nst`` (own style
+upload) or ``/cyclegan`` the way a person does: command, keyboard button,
+photos, waiting for each reply. ``replay`` feeds a recorded update log
+instead, at its original pace.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.bot import create_bot_and_dispatcher
+from app.env_settings import Settings
+from app.fsm_storage import create_storage
+from app.job_store import JOB_KIND_NST
+from benchmarks.fake_bot_api import FakeBotAPI, BotCall
+from benchmarks.runner import environment, synthetic_jpeg
+
+logger = logging.getLogger(__name__)
+
+FIRST_USER_ID = 1_000_000
+
+
+class FlowError(Exception):
+    pass
+
+
+@dataclass
+class FlowResult:
+    flow: str
+    user_id: int
+    ok: bool
+    # From the first command to the result, including think time
+    total_seconds: float
+    # From sending the photo to be stylized to receiving the result
+    result_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+def load_images(image_dir: Optional[str], count: int = 8, size: int = 512) -> list[bytes]:
+    """JPEG/PNG files from ``image_dir``, or synthetic photos without one."""
+    if image_dir:
+        paths = sorted(
+            p for p in Path(image_dir).iterdir()
+            if p.suffix.lower() in (".jpg", ".jpeg", ".png")
+        )
+        if not paths:
+            raise FileNotFoundError(f"No .jpg/.png images in {image_dir}")
+        return [p.read_bytes() for p in paths]
+    return [synthetic_jpeg(size, seed) for seed in range(count)]
+
+
+class SyntheticUser:
+    _message_ids = itertools.count(1)
+
+    def __init__(
+        self,
+        api: FakeBotAPI,
+        user_id: int,
+        images: list[bytes],
+        rng: random.Random,
+        think_time: float = 0.0,
+        timeout: float = 300.0,
+        unique_photos: bool = True,
+        recorder: Optional["UpdateRecorder"] = None,
+    ):
+        self.api = api
+        self.user_id = user_id
+        self.images = images
+        self.rng = rng
+        self.think_time = think_time
+        self.timeout = timeout
+        self.unique_photos = unique_photos
+        self.recorder = recorder
+        self._photo_count = 0
+        self.replies = api.subscribe(user_id)
+
+    def _message(self, **fields) -> dict:
+        user = {"id": self.user_id, "is_bot": False, "first_name": f"User{self.user_id}"}
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": user,
+            **fields,
+        }
+
+    async def _push(self, update: dict) -> None:
+        if self.recorder is not None:
+            self.recorder.record(update)
+        await self.api.push_update(update)
+
+    async def _think(self) -> None:
+        if self.think_time:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think_time))
+
+    async def command(self, text: str) -> None:
+        entity = {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        await self._push({"message": self._message(text=text, entities=[entity])})
+
+    async def press(self, bot_message: dict, callback_data: str) -> None:
+        user = {"id": self.user_id, "is_bot": False, "first_name": f"User{self.user_id}"}
+        await self._push(
+            {
+                "callback_query": {
+                    "id": f"{self.user_id}-{next(self._message_ids)}",
+                    "from": user,
+                    "chat_instance": str(self.user_id),
+                    "message": bot_message,
+                    "data": callback_data,
+                }
+            }
+        )
+
+    async def send_photo(self) -> None:
+        data = self.rng.choice(self.images)
+        self._photo_count += 1
+        unique_id = f"u{self.user_id}-{self._photo_count}" if self.unique_photos else None
+        await self._push({"message": self._message(photo=self.api.add_photo(data, unique_id))})
+
+    async def reply(self) -> BotCall:
+        try:
+            return await asyncio.wait_for(self.replies.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise FlowError(f"no reply within {self.timeout:.0f} s") from None
+
+    async def reply_with_keyboard(self) -> tuple[BotCall, list[str]]:
+        call = await self.reply()
+        markup = json.loads(call.params.get("reply_markup") or "{}")
+        buttons = [
+            button.get("callback_data", "")
+            for row in markup.get("inline_keyboard", [])
+            for button in row
+        ]
+        return call, buttons
+
+    async def result(self) -> None:
+        """Waits out the progress message; the next reply must be the picture."""
+        call = await self.reply()
+        if call.method == "sendphoto":
+            return
+        call = await self.reply()
+        if call.method != "sendphoto":
+            raise FlowError(f"{call.method}: {call.params.get('text', '')[:200]}")
+
+    def _bot_message(self, call: BotCall) -> dict:
+        return {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": {"id": 0, "is_bot": True, "first_name": "Bot"},
+            "text": call.params.get("text", ""),
+        }
+
+    async def nst(self) -> float:
+        await self.command("/nst")
+        call, buttons = await self.reply_with_keyboard()
+        if "nst_upload_style" not in buttons:
+            raise FlowError(f"/nst keyboard has no upload button: {buttons}")
+        await self._think()
+        await self.press(self._bot_message(call), "nst_upload_style")
+        await self.reply()
+        await self._think()
+        await self.send_photo()  # style
+        await self.reply()
+        await self._think()
+        started = time.monotonic()
+        await self.send_photo()  # content
+        await self.result()
+        return time.monotonic() - started
+
+    async def cyclegan(self) -> float:
+        await self.command("/cyclegan")
+        call, buttons = await self.reply_with_keyboard()
+        styles = [b for b in buttons if b.startswith("cyclegan_style_")]
+        if not styles:
+            raise FlowError(f"/cyclegan offered no styles: {call.params.get('text', '')}")
+        await self._think()
+        await self.press(self._bot_message(call), self.rng.choice(styles))
+        await self.reply()
+        await self._think()
+        started = time.monotonic()
+        await self.send_photo()
+        await self.result()
+        return time.monotonic() - started
+
+    async def run(self, flow: str) -> FlowResult:
+        started = time.monotonic()
+        try:
+            result_seconds = await (self.nst() if flow == JOB_KIND_NST else self.cyclegan())
+            return FlowResult(flow, self.user_id, True, time.monotonic() - started,
+                              result_seconds)
+        except FlowError as e:
+            return FlowResult(flow, self.user_id, False, time.monotonic() - started,
+                              error=str(e))
+        finally:
+            self.api.unsubscribe(self.user_id)
+
+
+class UpdateRecorder:
+    """Writes pushed updates as ``{"t": seconds, "update": {...}}`` lines for replay."""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w", encoding="utf-8")
+        self._start = time.monotonic()
+
+    def record(self, update: dict) -> None:
+        line = {"t": round(time.monotonic() - self._start, 3), "update": update}
+        self._file.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BotUnderTest:
+    """Fake Bot API plus the production bot polling it."""
+
+    def __init__(self, api: FakeBotAPI, settings_overrides: Optional[dict] = None,
+                 engines: Optional[dict] = None):
+        self.api = api
+        self.settings_overrides = settings_overrides or {}
+        self.engines = engines
+        self._polling: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "BotUnderTest":
+        await self.api.start()
+        settings = Settings(
+            **{
+                "TELEGRAM_BOT_TOKEN": self.api.token,
+                "BOT_RUN_MODE": "polling",
+                # Resuming jobs of a real store would answer real users' jobs here
+                "JOB_STORE_PATH": None,
+                **self.settings_overrides,
+                "TELEGRAM_API_URL": self.api.url,
+            }
+        )
+        storage = create_storage(settings.FSM_STORAGE, settings.FSM_STORAGE_PATH)
+        self.bot, self.dp = create_bot_and_dispatcher(settings, storage, engines=self.engines)
+        self._polling = asyncio.create_task(
+            self.dp.start_polling(self.bot, handle_signals=False, polling_timeout=1)
+        )
+        polling = asyncio.ensure_future(self.api.polling_started.wait())
+        await asyncio.wait({polling, self._polling}, return_when=asyncio.FIRST_COMPLETED)
+        if self._polling.done():
+            polling.cancel()
+            self._polling.result()  # re-raises the startup error
+            raise RuntimeError("Polling stopped during startup.")
+        # Engines load in the background: measure the bot, not its warm-up
+        engine_loader = self.dp.workflow_data.get("engine_loader")
+        if engine_loader is not None:
+            await engine_loader.wait()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        try:
+            if self._polling is not None and not self._polling.done():
+                await self.dp.stop_polling()
+                await self._polling
+        finally:
+            # The handler routers are module-level and attach to one dispatcher
+            # only; release them so another run can happen in this process
+            for router in self.dp.sub_routers:
+                router._parent_router = None
+            self.dp.sub_routers.clear()
+            await self.api.stop()
+
+
+def _distribution(seconds: list[float]) -> Optional[dict]:
+    if not seconds:
+        return None
+    ms = np.array(seconds) * 1000
+    return {
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p90": float(np.percentile(ms, 90)),
+        "p99": float(np.percentile(ms, 99)),
+        "max": float(ms.max()),
+    }
+
+
+def summarize(results: list[FlowResult], wall_seconds: float, api: FakeBotAPI) -> dict:
+    by_flow = defaultdict(list)
+    for r in results:
+        by_flow[r.flow].append(r)
+    errors = [r for r in results if not r.ok]
+    return {
+        "users": len(results),
+        "completed": len(results) - len(errors),
+        "errors": len(errors),
+        "error_rate": len(errors) / len(results) if results else 0.0,
+        "wall_seconds": wall_seconds,
+        "throughput_results_per_s": (len(results) - len(errors)) / wall_seconds,
+        "flows": {
+            flow: {
+                "users": len(flow_results),
+                "errors": sum(not r.ok for r in flow_results),
+                "total_latency_ms": _distribution(
+                    [r.total_seconds for r in flow_results if r.ok]
+                ),
+                "result_latency_ms": _distribution(
+                    [r.result_seconds for r in flow_results if r.ok]
+                ),
+            }
+            for flow, flow_results in by_flow.items()
+        },
+        "error_samples": [f"{r.flow} user {r.user_id}: {r.error}" for r in errors[:10]],
+        "bot_api_calls": dict(api.calls),
+    }
+
+
+async def run_load(
+    bot: BotUnderTest,
+    users: int,
+    rate: float,
+    mix: dict[str, float],
+    images: list[bytes],
+    think_time: float = 0.0,
+    timeout: float = 300.0,
+    unique_photos: bool = True,
+    seed: int = 0,
+    record_path: Optional[str] = None,
+) -> dict:
+    """``users`` synthetic users arriving at ``rate`` per second on average;
+    ``mix`` weighs the flows (e.g. {"nst": 1, "cyclegan": 3})."""
+    rng = random.Random(seed)
+    flows, weights = zip(*mix.items())
+    recorder = UpdateRecorder(record_path) if record_path else None
+    tasks = []
+    started = time.monotonic()
+    try:
+        for index in range(users):
+            user = SyntheticUser(
+                bot.api, FIRST_USER_ID + index, images, random.Random(rng.random()),
+                think_time, timeout, unique_photos, recorder,
+            )
+            flow = rng.choices(flows, weights)[0]
+            tasks.append(asyncio.create_task(user.run(flow)))
+            if index < users - 1:
+                await asyncio.sleep(rng.expovariate(rate))
+        results = await asyncio.gather(*tasks)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    return summarize(results, time.monotonic() - started, bot.api)
+
+
+class _ReplayObserver:
+    """Latency from each replayed update to the bot's first reply in that chat,
+    and from each photo to the picture sent back."""
+
+    def __init__(self):
+        self.pending_reply: dict[int, float] = {}
+        self.pending_photo: dict[int, float] = {}
+        self.replied: dict[int, asyncio.Event] = defaultdict(asyncio.Event)
+        self.resulted: dict[int, asyncio.Event] = defaultdict(asyncio.Event)
+        self.reply_seconds: list[float] = []
+        self.result_seconds: list[float] = []
+        self.unanswered = 0
+
+    def sent(self, chat_id: int, is_photo: bool) -> None:
+        now = time.monotonic()
+        self.pending_reply[chat_id] = now
+        self.replied[chat_id].clear()
+        if is_photo:
+            self.pending_photo[chat_id] = now
+            self.resulted[chat_id].clear()
+
+    def __call__(self, call: BotCall) -> None:
+        if call.method not in ("sendmessage", "sendphoto", "editmessagetext"):
+            return
+        sent_at = self.pending_reply.pop(call.chat_id, None)
+        if sent_at is not None:
+            self.reply_seconds.append(call.time - sent_at)
+            self.replied[call.chat_id].set()
+        if call.method == "sendphoto":
+            sent_at = self.pending_photo.pop(call.chat_id, None)
+            if sent_at is not None:
+                self.result_seconds.append(call.time - sent_at)
+                self.resulted[call.chat_id].set()
+
+    async def wait_reply(self, chat_id: int, timeout: float) -> None:
+        if chat_id not in self.pending_reply:
+            return
+        try:
+            await asyncio.wait_for(self.replied[chat_id].wait(), timeout)
+        except asyncio.TimeoutError:
+            self.unanswered += 1
+            self.pending_reply.pop(chat_id, None)
+
+    async def wait_result(self, chat_id: int, timeout: float) -> None:
+        if chat_id not in self.pending_photo:
+            return
+        try:
+            await asyncio.wait_for(self.resulted[chat_id].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _update_chat_id(update: dict) -> Optional[int]:
+    message = update.get("message") or (update.get("callback_query") or {}).get("message")
+    return (message or {}).get("chat", {}).get("id")
+
+
+async def replay(
+    bot: BotUnderTest, path: str, speed: float = 1.0, timeout: float = 60.0
+) -> dict:
+    """Replays an update log: one JSON object per line, either a bare Update
+    or ``{"t": seconds since start, "update": {...}}`` (as written by
+    ``--record``). Files the log refers to are served as the API's default
+    image.
+
+    Updates keep their recorded pace, but within a chat the next update
+    waits (up to ``timeout``) for the bot to answer the previous one: a
+    person cannot press a button they have not been shown yet, and a
+    slower bot must not turn the log into out-of-order input.
+    """
+    by_chat: dict[Optional[int], list[dict]] = defaultdict(list)
+    count = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if "update" not in entry:
+                    entry = {"t": None, "update": entry}
+                entry["update"] = {
+                    k: v for k, v in entry["update"].items() if k != "update_id"
+                }
+                by_chat[_update_chat_id(entry["update"])].append(entry)
+                count += 1
+
+    observer = _ReplayObserver()
+    bot.api.observers.append(observer)
+    started = time.monotonic()
+
+    async def replay_chat(chat_id: Optional[int], entries: list[dict]) -> None:
+        for entry in entries:
+            if entry["t"] is not None:
+                delay = started + entry["t"] / speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = entry["update"]
+            if chat_id is not None:
+                await observer.wait_reply(chat_id, timeout)
+                observer.sent(chat_id, bool((update.get("message") or {}).get("photo")))
+            await bot.api.push_update(update)
+        if chat_id is not None:
+            await observer.wait_reply(chat_id, timeout)
+            await observer.wait_result(chat_id, timeout)
+
+    try:
+        await asyncio.gather(
+            *(replay_chat(chat_id, entries) for chat_id, entries in by_chat.items())
+        )
+    finally:
+        bot.api.observers.remove(observer)
+    wall_seconds = time.monotonic() - started
+    return {
+        "updates": count,
+        "chats": len([chat_id for chat_id in by_chat if chat_id is not None]),
+        "wall_seconds": wall_seconds,
+        "unanswered_updates": observer.unanswered,
+        "missing_results": len(observer.pending_photo),
+        "results": len(observer.result_seconds),
+        "throughput_results_per_s": len(observer.result_seconds) / wall_seconds,
+        "first_reply_latency_ms": _distribution(observer.reply_seconds),
+        "result_latency_ms": _distribution(observer.result_seconds),
+        "bot_api_calls": dict(bot.api.calls),
+    }
+
+
+def report(summary: dict, settings: dict) -> dict:
+    return {"environment": environment(), "settings": settings, "summary": summary}
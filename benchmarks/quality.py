@@ -0,0 +1,322 @@
+"""Output quality of the engines' speed modes against fp32 references.
+
+Every mode (lower precision, a cheaper NST initialization...) runs the same
+fixed image set as the reference run (fp32, the configured defaults) and is
+compared to it on what the user receives, the encoded result:
+
+* ``psnr`` / ``ssim`` against the reference output;
+* ``perceptual``: relative distance of VGG features (the NST feature layers)
+  between the two outputs;
+* NST only: ``style_loss_ratio`` / ``content_loss_ratio``, the final style
+  and content losses of the result over those of the reference.
+
+Modes whose worst image breaks a threshold fail the run. New modes are
+added to ``MODES``.
+"""
+
+import contextlib
+import io
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from app.nst_engine import NSTEngine
+from benchmarks.runner import PRECISIONS, synthetic_jpeg
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STYLE_DIR = Path(__file__).resolve().parent.parent / "static" / "style_images"
+
+# Images whose worst value is below a "min_" or above a "max_" bound fail
+DEFAULT_THRESHOLDS = {
+    "min_psnr": 30.0,
+    "min_ssim": 0.95,
+    "max_perceptual": 0.05,
+    "max_style_loss_ratio": 1.1,
+    "max_content_loss_ratio": 1.1,
+}
+# NST is an optimization: a different starting image, or bf16 rounding in
+# the first steps, leads L-BFGS to a different but equally valid picture.
+# Such modes are judged by the losses they reach, pixels only loosely.
+_NST_THRESHOLDS = {
+    "min_psnr": 15.0,
+    "min_ssim": 0.25,
+    "max_perceptual": 0.5,
+    "max_style_loss_ratio": 1.25,
+    "max_content_loss_ratio": 1.25,
+}
+
+
+@dataclass(frozen=True)
+class Mode:
+    name: str
+    engine: str  # "nst" or "cyclegan"
+    precision: str = "fp32"
+    # Engine config attributes set for the run
+    config: dict = field(default_factory=dict)
+    thresholds: dict = field(default_factory=dict)
+
+    def threshold(self, key: str) -> float:
+        return self.thresholds.get(key, DEFAULT_THRESHOLDS[key])
+
+
+MODES = (
+    Mode("bf16", "nst", precision="bf16", thresholds=_NST_THRESHOLDS),
+    Mode("init_color_transfer", "nst", config={"INIT_STRATEGY": "color_transfer"},
+         thresholds=_NST_THRESHOLDS),
+    Mode("init_low_res", "nst", config={"INIT_STRATEGY": "low_res"},
+         thresholds=_NST_THRESHOLDS),
+    Mode("bf16", "cyclegan", precision="bf16"),
+    Mode("fp16", "cyclegan", precision="fp16"),
+)
+REFERENCE_CONFIG = {"nst": {"INIT_STRATEGY": "content"}, "cyclegan": {}}
+
+
+def load_image_set(
+    content_dir: Optional[str] = None,
+    style_dir: Optional[str] = None,
+    limit: int = 2,
+    size: int = 512,
+) -> tuple[list[tuple[str, bytes]], list[tuple[str, bytes]]]:
+    """(name, bytes) of content photos and style images, sorted by name.
+
+    Contents default to deterministic synthetic photos, styles to the bot's
+    default styles.
+    """
+
+    def read_dir(path) -> list[tuple[str, bytes]]:
+        files = sorted(
+            p for p in Path(path).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png")
+        )
+        if not files:
+            raise FileNotFoundError(f"No .jpg/.png images in {path}")
+        return [(p.stem, p.read_bytes()) for p in files[:limit]]
+
+    if content_dir:
+        contents = read_dir(content_dir)
+    else:
+        contents = [(f"synthetic-{seed}", synthetic_jpeg(size, seed)) for seed in range(limit)]
+    styles = read_dir(style_dir or DEFAULT_STYLE_DIR)
+    return contents, styles
+
+
+def _to_array(image_bytes: bytes) -> np.ndarray:
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return np.asarray(image.convert("RGB"), dtype=np.float32) / 255.0
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = float(np.mean((a - b) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(1.0 / mse)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, window: int = 11, sigma: float = 1.5) -> float:
+    """Mean SSIM over RGB channels with a Gaussian window (Wang et al., 2004)."""
+    x = torch.from_numpy(a).permute(2, 0, 1).unsqueeze(0).double()
+    y = torch.from_numpy(b).permute(2, 0, 1).unsqueeze(0).double()
+    coords = torch.arange(window, dtype=torch.double) - window // 2
+    g = torch.exp(-(coords**2) / (2 * sigma**2))
+    g = g / g.sum()
+    kernel = (g[:, None] * g[None, :]).expand(3, 1, window, window)
+
+    def blur(t):
+        return F.conv2d(t, kernel, groups=3)
+
+    mu_x, mu_y = blur(x), blur(y)
+    var_x = blur(x * x) - mu_x**2
+    var_y = blur(y * y) - mu_y**2
+    cov = blur(x * y) - mu_x * mu_y
+    c1, c2 = 0.01**2, 0.03**2
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / (
+        (mu_x**2 + mu_y**2 + c1) * (var_x + var_y + c2)
+    )
+    return float(ssim_map.mean())
+
+
+class QualityMeter:
+    """Perceptual distance and NST losses, computed in fp32 with the NST engine's VGG."""
+
+    def __init__(self, nst_engine: NSTEngine):
+        self.engine = nst_engine
+        self.layers = list(
+            dict.fromkeys(nst_engine.config.STYLE_LAYERS + nst_engine.config.CONTENT_LAYERS)
+        )
+
+    def _tensor(self, image: np.ndarray) -> torch.Tensor:
+        return torch.from_numpy(image).permute(2, 0, 1).unsqueeze(0).to(self.engine.device)
+
+    def perceptual(self, a: np.ndarray, b: np.ndarray) -> float:
+        """Mean over layers of ||f(a) - f(b)||² / ||f(b)||²."""
+        fa = self.engine._extract_features(self._tensor(a), self.layers)
+        fb = self.engine._extract_features(self._tensor(b), self.layers)
+        distances = [
+            float(((fa[name] - fb[name]) ** 2).sum() / (fb[name] ** 2).sum().clamp_min(1e-12))
+            for name in fb
+        ]
+        return float(np.mean(distances))
+
+    def nst_losses(
+        self, result: np.ndarray, content_bytes: bytes, style_bytes: bytes
+    ) -> tuple[float, float]:
+        """Weighted (style, content) losses of a result, as the optimizer sees them."""
+        engine = self.engine
+        content_targets = engine._content_targets(engine._image_loader(content_bytes))
+        style_targets = engine._style_targets(engine._image_loader(style_bytes))
+        features = engine._extract_features(self._tensor(result), self.layers)
+        style_loss = sum(
+            F.mse_loss(NSTEngine.gram_matrix(features[name]), target).item()
+            for name, target in style_targets.items()
+        )
+        content_loss = sum(
+            F.mse_loss(features[name], target).item()
+            for name, target in content_targets.items()
+        )
+        return (
+            style_loss * engine.config.STYLE_WEIGHT,
+            content_loss * engine.config.CONTENT_WEIGHT,
+        )
+
+
+@contextlib.contextmanager
+def _mode_settings(engine, config: dict, precision: str):
+    saved = {name: getattr(engine.config, name) for name in config}
+    for name, value in config.items():
+        setattr(engine.config, name, value)
+    dtype = PRECISIONS[precision]
+    try:
+        if dtype is None:
+            yield
+        else:
+            with torch.autocast(device_type=engine.device.type, dtype=dtype):
+                yield
+    finally:
+        for name, value in saved.items():
+            setattr(engine.config, name, value)
+
+
+def _cases(engine_name: str, engine, contents, styles) -> list[tuple[str, dict]]:
+    """(case name, inputs) of the image set for an engine."""
+    if engine_name == "nst":
+        return [
+            (f"{c_name}+{s_name}", {"content": c_bytes, "style": s_bytes})
+            for c_name, c_bytes in contents
+            for s_name, s_bytes in styles
+        ]
+    return [
+        (f"{c_name}+{style}", {"content": c_bytes, "style": style})
+        for c_name, c_bytes in contents
+        for style in engine.models
+    ]
+
+
+def _run(engine_name: str, engine, inputs: dict) -> bytes:
+    if engine_name == "nst":
+        return engine.process_images(inputs["style"], inputs["content"])
+    return engine.stylize_bytes(inputs["content"], inputs["style"])
+
+
+def evaluate(
+    engines: dict,
+    meter: QualityMeter,
+    contents,
+    styles,
+    modes=MODES,
+    threshold_overrides: Optional[dict] = None,
+    save_dir: Optional[str] = None,
+) -> dict:
+    """Runs references and modes; returns per-mode metrics and failures."""
+    threshold_overrides = threshold_overrides or {}
+    report = {"modes": [], "failures": []}
+    for engine_name, engine in engines.items():
+        cases = _cases(engine_name, engine, contents, styles)
+        references, reference_losses = {}, {}
+        for case, inputs in cases:
+            with _mode_settings(engine, REFERENCE_CONFIG[engine_name], "fp32"):
+                output = _run(engine_name, engine, inputs)
+            references[case] = _to_array(output)
+            if engine_name == "nst":
+                reference_losses[case] = meter.nst_losses(
+                    references[case], inputs["content"], inputs["style"]
+                )
+            _save(save_dir, engine_name, "reference", case, output)
+
+        for mode in (m for m in modes if m.engine == engine_name):
+            logger.info(f"Quality check: {engine_name}/{mode.name}")
+            config = {**REFERENCE_CONFIG[engine_name], **mode.config}
+            images = []
+            try:
+                for case, inputs in cases:
+                    with _mode_settings(engine, config, mode.precision):
+                        output = _run(engine_name, engine, inputs)
+                    _save(save_dir, engine_name, mode.name, case, output)
+                    result, reference = _to_array(output), references[case]
+                    metrics = {
+                        "case": case,
+                        "psnr": psnr(result, reference),
+                        "ssim": ssim(result, reference),
+                        "perceptual": meter.perceptual(result, reference),
+                    }
+                    if engine_name == "nst":
+                        style_loss, content_loss = meter.nst_losses(
+                            result, inputs["content"], inputs["style"]
+                        )
+                        ref_style, ref_content = reference_losses[case]
+                        metrics["style_loss"] = style_loss
+                        metrics["content_loss"] = content_loss
+                        metrics["style_loss_ratio"] = style_loss / max(ref_style, 1e-12)
+                        metrics["content_loss_ratio"] = content_loss / max(ref_content, 1e-12)
+                    images.append(metrics)
+            except Exception as e:
+                # e.g. fp16 autocast is not implemented for some CPU kernels
+                logger.warning(f"{engine_name}/{mode.name} skipped: {e}")
+                report["modes"].append(
+                    {"engine": engine_name, "mode": mode.name, "skipped": str(e)}
+                )
+                continue
+
+            entry = {"engine": engine_name, "mode": mode.name, "images": images, "worst": {}}
+            for key in DEFAULT_THRESHOLDS:
+                bound, metric = key.split("_", 1)
+                values = [m[metric] for m in images if metric in m]
+                if not values:
+                    continue
+                worst = min(values) if bound == "min" else max(values)
+                limit = threshold_overrides.get(key, mode.threshold(key))
+                entry["worst"][metric] = worst
+                if (worst < limit) if bound == "min" else (worst > limit):
+                    report["failures"].append(
+                        {"engine": engine_name, "mode": mode.name, "metric": metric,
+                         "value": worst, "threshold": limit}
+                    )
+            report["modes"].append(entry)
+    return report
+
+
+def _save(save_dir: Optional[str], engine: str, mode: str, case: str, data: bytes) -> None:
+    if not save_dir:
+        return
+    path = Path(save_dir) / engine / mode
+    path.mkdir(parents=True, exist_ok=True)
+    with Image.open(io.BytesIO(data)) as image:
+        extension = (image.format or "img").lower()
+    (path / f"{case}.{extension}").write_bytes(data)
+
+
+def scaled_nst_steps(config, steps: int) -> dict:
+    """Config overrides running the reference for ``steps`` steps, other
+    initializations keeping their configured proportion of it."""
+    reference = config.INIT_NUM_STEPS["content"]
+    scale = steps / reference
+    return {
+        "NUM_STEPS": steps,
+        "INIT_NUM_STEPS": {
+            name: max(1, round(count * scale)) for name, count in config.INIT_NUM_STEPS.items()
+        },
+        "INIT_LOW_RES_NUM_STEPS": max(1, round(config.INIT_LOW_RES_NUM_STEPS * scale)),
+    }
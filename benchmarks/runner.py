@@ -0,0 +1,203 @@
+"""Benchmark cases, measurement and baseline comparison."""
+
+import contextlib
+import io
+import itertools
+import os
+import platform
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.metrics import NST_STEPS, process_rss_bytes
+
+PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+@dataclass(frozen=True)
+class Case:
+    engine: str  # "nst" or "cyclegan"
+    op: str  # "process_images", "stylize" or "forward"
+    size: int
+    threads: int
+    precision: str
+    batch: int
+
+    @property
+    def key(self) -> str:
+        return (
+            f"{self.engine}/{self.op}/size={self.size}/threads={self.threads}"
+            f"/{self.precision}/batch={self.batch}"
+        )
+
+
+def make_cases(
+    engines: Iterable[str],
+    sizes: Iterable[int],
+    threads: Iterable[int],
+    precisions: Iterable[str],
+    batches: Iterable[int],
+) -> list[Case]:
+    """Full sweep. NST and the CycleGAN pipeline handle one image per call, so
+    batch sizes above 1 only apply to the raw CycleGAN forward pass."""
+    cases = []
+    for engine, size, n_threads, precision in itertools.product(
+        engines, sizes, threads, precisions
+    ):
+        if engine == "nst":
+            cases.append(Case(engine, "process_images", size, n_threads, precision, 1))
+        else:
+            cases.append(Case(engine, "stylize", size, n_threads, precision, 1))
+            cases.extend(
+                Case(engine, "forward", size, n_threads, precision, batch)
+                for batch in batches
+            )
+    return cases
+
+
+def synthetic_jpeg(size: int, seed: int) -> bytes:
+    """Smooth gradients plus noise: compresses and decodes like a photo."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / max(size - 1, 1)
+    base = np.stack([x, y, (x + y) / 2], axis=-1) * 255
+    noise = rng.normal(0, 20, base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    bio = io.BytesIO()
+    Image.fromarray(pixels).save(bio, format="JPEG", quality=90)
+    return bio.getvalue()
+
+
+class _PeakRSS:
+    """Samples RSS in the background; the process-wide ru_maxrss never goes down."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.peak = process_rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, process_rss_bytes())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, process_rss_bytes())
+
+
+def _autocast(device: torch.device, precision: str):
+    dtype = PRECISIONS[precision]
+    if dtype is None:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device.type, dtype=dtype)
+
+
+def _operation(engine, case: Case) -> Callable[[], None]:
+    if case.engine == "nst":
+        engine.image_size = case.size
+        style, content = synthetic_jpeg(case.size * 2, 1), synthetic_jpeg(case.size * 2, 2)
+        return lambda: engine.process_images(style, content)
+
+    engine.config.IMAGE_SIZE = case.size
+    style_name = next(iter(engine.models))
+    if case.op == "stylize":
+        image = synthetic_jpeg(case.size * 2, 3)
+        return lambda: engine.stylize_bytes(image, style_name)
+    batch = torch.rand(case.batch, 3, case.size, case.size, device=engine.device) * 2 - 1
+    return lambda: engine._run_model(batch, style_name)
+
+
+def run_case(engine, case: Case, repeat: int = 5, warmup: int = 1) -> dict:
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(case.threads)
+    try:
+        operation = _operation(engine, case)
+        with _autocast(engine.device, case.precision):
+            for _ in range(warmup):
+                operation()
+            steps_before = NST_STEPS.total()
+            latencies = []
+            with _PeakRSS() as rss:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    operation()
+                    latencies.append(time.perf_counter() - start)
+            steps = NST_STEPS.total() - steps_before
+    finally:
+        torch.set_num_threads(previous_threads)
+
+    latencies_ms = np.array(latencies) * 1000
+    total_time = float(np.sum(latencies))
+    result = {
+        **asdict(case),
+        "key": case.key,
+        "repeat": repeat,
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p90": float(np.percentile(latencies_ms, 90)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+        },
+        "throughput_images_per_s": case.batch * repeat / total_time,
+        "peak_rss_mb": rss.peak / (1024 * 1024),
+    }
+    if case.engine == "nst":
+        result["steps_per_s"] = steps / total_time
+    return result
+
+
+def environment() -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+    }
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float = 0.10, rss_threshold: float = 0.20
+) -> list[dict]:
+    """Cases whose p50 latency, throughput or peak RSS got worse than the baseline.
+
+    ``threshold`` is the tolerated relative slowdown (0.10 = 10 %);
+    ``rss_threshold`` the tolerated relative growth of peak RSS.
+    """
+    base_by_key = {r["key"]: r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        base: Optional[dict] = base_by_key.get(result["key"])
+        if base is None:
+            continue
+        checks = (
+            ("p50_latency_ms", base["latency_ms"]["p50"], result["latency_ms"]["p50"], True,
+             threshold),
+            ("throughput_images_per_s", base["throughput_images_per_s"],
+             result["throughput_images_per_s"], False, threshold),
+            ("peak_rss_mb", base["peak_rss_mb"], result["peak_rss_mb"], True, rss_threshold),
+        )
+        for metric, old, new, lower_is_better, limit in checks:
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = change > limit if lower_is_better else -change > limit
+            if worse:
+                regressions.append(
+                    {"key": result["key"], "metric": metric, "baseline": old,
+                     "current": new, "change": change}
+                )
+    return regressions
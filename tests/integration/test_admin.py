@@ -0,0 +1,70 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.filters import CommandObject
+
+from app.handlers import admin
+from app.profiling import PROFILER
+
+
+@pytest.fixture
+def settings():
+    s = MagicMock()
+    s.admin_ids = {1}
+    s.PROFILE_MAX_JOBS = 10
+    return s
+
+
+@pytest.fixture
+def make_message():
+    def make(user_id):
+        message = MagicMock()
+        message.from_user = MagicMock(id=user_id)
+        message.answer = AsyncMock()
+        return message
+
+    return make
+
+
+@pytest.fixture(autouse=True)
+def disarm_profiler():
+    PROFILER.disarm()
+    yield
+    PROFILER.disarm()
+
+
+@pytest.mark.asyncio
+async def test_profile_refused_for_non_admin(make_message, settings):
+    """Обычный пользователь не может включить профилирование."""
+    message = make_message(2)
+    await admin.cmd_profile(message, CommandObject(command="profile", args="nst 3"), settings)
+
+    assert PROFILER.remaining("nst") == 0
+    assert "только администраторам" in message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_profile_arms_local_engine(make_message, settings):
+    """Администратор включает профилирование следующих N задач."""
+    message = make_message(1)
+    await admin.cmd_profile(message, CommandObject(command="profile", args="nst 3"), settings)
+
+    assert PROFILER.remaining("nst") == 3
+    assert PROFILER.remaining("cyclegan") == 0
+
+    await admin.cmd_profile(message, CommandObject(command="profile", args="off"), settings)
+    assert PROFILER.remaining("nst") == 0
+
+
+@pytest.mark.asyncio
+async def test_profile_arms_remote_backends(make_message, settings):
+    client = MagicMock()
+    client.arm_profiler = AsyncMock(return_value={})
+    message = make_message(1)
+
+    await admin.cmd_profile(
+        message, CommandObject(command="profile", args="cyclegan 50"), settings, client
+    )
+
+    client.arm_profiler.assert_awaited_once_with("cyclegan", 10)
+    assert PROFILER.remaining("cyclegan") == 0
@@ -67,11 +67,14 @@ def fake_bot():
 def fake_cyclegan_engine():
     """Фикстура для мока движка CycleGAN."""
     engine = MagicMock()
+    engine.working_size = 256
     engine.get_available_styles.return_value = {
         "monet": "Monet Style",
         "vangogh": "Van Gogh Style",
     }
     engine.stylize.return_value = Image.new("RGB", (256, 256))
+    engine.stylize_bytes.return_value = b"result-jpeg"
+    engine.predict_duration.return_value = None  # истории времени ещё нет
     return engine
 
 
@@ -151,9 +154,9 @@ async def test_handle_photo_for_cyclegan_success(
     fake_bot.download.side_effect = mock_download
     # ---------------------------------------------
 
-    with patch("app.handlers.cyclegan.asyncio.get_running_loop") as mock_get_loop:
+    with patch("app.handlers.utils.asyncio.get_running_loop") as mock_get_loop:
         mock_loop = MagicMock()
-        mock_run_in_executor = AsyncMock(return_value=Image.new("RGB", (256, 256)))
+        mock_run_in_executor = AsyncMock(return_value=b"result-jpeg")
         mock_loop.run_in_executor = mock_run_in_executor
         mock_get_loop.return_value = mock_loop
 
@@ -168,8 +171,9 @@ async def test_handle_photo_for_cyclegan_success(
     mock_run_in_executor.assert_awaited_once()
 
     func_to_run = mock_run_in_executor.call_args[0][1]
-    assert func_to_run.func == fake_cyclegan_engine.stylize
+    assert func_to_run.func == fake_cyclegan_engine.stylize_bytes
     assert func_to_run.keywords["style_name"] == "monet"
+    assert func_to_run.keywords["image_bytes"] == fake_image_bytes.getvalue()
 
     fake_message.answer_photo.assert_awaited_once()
     processing_message_mock.delete.assert_awaited_once()
@@ -0,0 +1,241 @@
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.inference_client import (
+    InferenceClient,
+    InferenceServiceError,
+    RemoteCycleGANEngine,
+    RemoteNSTEngine,
+)
+from app.inference_server import create_inference_app
+
+
+class FakeNSTEngine:
+    def __init__(self, tag=b"nst"):
+        self.tag = tag
+        self.calls = []
+
+    def get_available_styles(self):
+        return {"starry.jpg": "Starry"}
+
+    def process_images(self, style, content, **keys):
+        self.calls.append((bytes(style), bytes(content)))
+        self.keys = keys
+        return self.tag + b":" + bytes(style) + b"+" + bytes(content)
+
+    def prepare_style(self, style, style_key):
+        self.prepared = (bytes(style), style_key)
+
+
+class FakeCycleGANEngine:
+    def get_available_styles(self):
+        return {"monet": "Monet Style"}
+
+    def stylize_bytes(self, image_bytes, style_name):
+        return style_name.encode() + b":" + bytes(image_bytes)
+
+
+@pytest_asyncio.fixture
+async def server():
+    srv = TestServer(create_inference_app(FakeNSTEngine(), FakeCycleGANEngine()))
+    await srv.start_server()
+    yield srv
+    await srv.close()
+
+
+@pytest_asyncio.fixture
+async def unix_server(tmp_path):
+    socket_path = str(tmp_path / "inference.sock")
+    app = create_inference_app(FakeNSTEngine(), FakeCycleGANEngine())
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.UnixSite(runner, socket_path)
+    await site.start()
+    yield socket_path
+    await runner.cleanup()
+
+
+def _url(srv):
+    return str(srv.make_url("")).rstrip("/")
+
+
+@pytest.mark.asyncio
+async def test_remote_engines_roundtrip(server):
+    client = InferenceClient([_url(server)], health_interval=0)
+    await client.start()
+    try:
+        nst_engine = RemoteNSTEngine(client)
+        cyclegan_engine = RemoteCycleGANEngine(client)
+
+        assert nst_engine.get_available_styles() == {"starry.jpg": "Starry"}
+        assert cyclegan_engine.get_available_styles() == {"monet": "Monet Style"}
+        assert await nst_engine.process_images(b"style", b"content") == (
+            b"nst:style+content"
+        )
+        assert await cyclegan_engine.stylize_bytes(b"photo", "monet") == b"monet:photo"
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_remote_nst_reads_paths(server, tmp_path):
+    style_path = tmp_path / "style.jpg"
+    style_path.write_bytes(b"S")
+    client = InferenceClient([_url(server)], health_interval=0)
+    await client.start()
+    try:
+        result = await RemoteNSTEngine(client).process_images(str(style_path), b"C")
+        assert result == b"nst:S+C"
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_load_is_balanced_between_servers():
+    """Запросы распределяются между несколькими экземплярами сервера."""
+    engines = [FakeNSTEngine(b"a"), FakeNSTEngine(b"b")]
+    servers = [TestServer(create_inference_app(e, None)) for e in engines]
+    for srv in servers:
+        await srv.start_server()
+    client = InferenceClient([_url(s) for s in servers], health_interval=0)
+    await client.start()
+    try:
+        for _ in range(4):
+            await client.process_images(b"s", b"c")
+        assert len(engines[0].calls) == 2
+        assert len(engines[1].calls) == 2
+    finally:
+        await client.close()
+        for srv in servers:
+            await srv.close()
+
+
+@pytest.mark.asyncio
+async def test_failover_to_healthy_server(server):
+    client = InferenceClient(
+        ["http://127.0.0.1:1", _url(server)], health_interval=0
+    )
+    await client.start()
+    try:
+        assert client.backends[0].healthy is False
+        for _ in range(3):
+            assert await client.process_images(b"s", b"c") == b"nst:s+c"
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_all_servers_down_raises():
+    client = InferenceClient(["http://127.0.0.1:1"], health_interval=0)
+    await client.start()
+    try:
+        with pytest.raises(InferenceServiceError):
+            await client.process_images(b"s", b"c")
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_engine_unavailable_returns_error():
+    srv = TestServer(create_inference_app(None, FakeCycleGANEngine()))
+    await srv.start_server()
+    client = InferenceClient([_url(srv)], health_interval=0)
+    await client.start()
+    try:
+        with pytest.raises(InferenceServiceError) as excinfo:
+            await client.process_images(b"s", b"c")
+        assert "not available" in str(excinfo.value)
+    finally:
+        await client.close()
+        await srv.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_memory_transport_over_unix_socket(unix_server):
+    client = InferenceClient(
+        [f"unix:{unix_server}"], health_interval=0, use_shared_memory=True
+    )
+    await client.start()
+    try:
+        payload = b"x" * 100_000
+        assert await client.stylize_bytes(payload, "monet") == b"monet:" + payload
+        # Segments are released as soon as the server has answered.
+        assert len(client.buffer_pool) == 0
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_style_keys_forwarded_and_prepared_remotely():
+    """Ключи кэша и подготовка стиля передаются на сервер инференса."""
+    engine = FakeNSTEngine()
+    srv = TestServer(create_inference_app(engine, None))
+    await srv.start_server()
+    client = InferenceClient([_url(srv)], health_interval=0)
+    await client.start()
+    try:
+        remote = RemoteNSTEngine(client)
+        await remote.prepare_style(b"style", "style_uid")
+        await remote.process_images(
+            b"style", b"content", content_key="content_uid", style_key="style_uid"
+        )
+    finally:
+        await client.close()
+        await srv.close()
+
+    assert engine.prepared == (b"style", "style_uid")
+    assert engine.keys == {"content_key": "content_uid", "style_key": "style_uid"}
+
+
+@pytest.mark.asyncio
+async def test_profiler_armed_on_backends(server, monkeypatch):
+    """Профилирование включается на серверах инференса через клиент."""
+    from app.profiling import ProfilerControl
+
+    control = ProfilerControl()
+    monkeypatch.setattr("app.inference_server.PROFILER", control)
+    client = InferenceClient([_url(server)], health_interval=0)
+    await client.start()
+    try:
+        statuses = await client.arm_profiler("nst", 2)
+        assert statuses[_url(server)]["armed"] == {"nst": 2, "cyclegan": 0}
+        assert control.remaining("nst") == 2
+
+        bad = await client.arm_profiler("unknown", 1)
+        assert "error" in bad[_url(server)]
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_memory_descriptors_rejected_over_tcp(server):
+    """По TCP сервер не подключает сегменты разделяемой памяти."""
+    async with aiohttp.ClientSession() as session:
+        resp = await session.post(
+            f"{_url(server)}/cyclegan",
+            json={"image": {"name": "dlsbot_x", "size": 1}, "style": "monet"},
+        )
+        assert resp.status == 400
+        assert "Unix socket" in await resp.text()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"style": "monet"},
+        {"image": {"name": "dlsbot_x"}, "style": "monet"},
+        {"image": {"name": "psm_foreign", "size": 1}, "style": "monet"},
+        {"image": {"name": "dlsbot_missing_segment", "size": 1}, "style": "monet"},
+        ["not", "an", "object"],
+    ],
+)
+async def test_invalid_descriptors_return_400(unix_server, payload):
+    """Отсутствующие, чужие и несуществующие сегменты дают 400, а не 500."""
+    connector = aiohttp.UnixConnector(path=unix_server)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        resp = await session.post("http://localhost/cyclegan", json=payload)
+        assert resp.status == 400
@@ -0,0 +1,252 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from aiogram import Bot
+
+from app.job_store import JOB_KIND_CYCLEGAN, JOB_KIND_NST, JobStatus, JobStore
+from app.jobs import resume_unfinished_jobs
+
+
+@pytest.fixture
+def previous(tmp_path):
+    """Хранилище процесса бота, который остановился, не завершив задачи."""
+    s = JobStore(tmp_path / "jobs.sqlite3", owner="previous-run")
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def store(tmp_path, previous):
+    s = JobStore(tmp_path / "jobs.sqlite3", owner="current-run")
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def fake_bot():
+    bot = AsyncMock(spec=Bot)
+
+    async def mock_download(file_id, destination):
+        destination.write(f"bytes:{file_id}".encode())
+
+    bot.download = AsyncMock(side_effect=mock_download)
+    bot.send_photo = AsyncMock()
+    bot.send_message = AsyncMock()
+    return bot
+
+
+@pytest.fixture
+def engines():
+    nst_engine = MagicMock()
+    nst_engine.process_images.return_value = b"nst-result"
+    cyclegan_engine = MagicMock()
+    cyclegan_engine.stylize_bytes.return_value = b"cyclegan-result"
+    return {JOB_KIND_NST: nst_engine, JOB_KIND_CYCLEGAN: cyclegan_engine}
+
+
+@pytest.mark.asyncio
+async def test_resume_nst_job_redownloads_inputs(store, previous, fake_bot, engines):
+    """Прерванная NST-задача дообрабатывается и результат уходит в чат."""
+    job_id = previous.add(
+        JOB_KIND_NST,
+        chat_id=42,
+        user_id=7,
+        inputs={
+            "style_path": "/nonexistent/style.jpg",
+            "style_file_id": "style_id",
+            "content_file_id": "content_id",
+        },
+    )
+    previous.mark_running(job_id)
+
+    await resume_unfinished_jobs(
+        fake_bot, store, engines, max_attempts=3, take_over=True
+    )
+
+    engines[JOB_KIND_NST].process_images.assert_called_once_with(
+        b"bytes:style_id", b"bytes:content_id"
+    )
+    fake_bot.send_photo.assert_awaited_once()
+    assert fake_bot.send_photo.call_args.kwargs["chat_id"] == 42
+    assert store.get(job_id) is None
+
+
+@pytest.mark.asyncio
+async def test_resume_nst_job_uses_existing_style_file(
+    store, previous, fake_bot, engines, tmp_path
+):
+    style_path = tmp_path / "style.jpg"
+    style_path.write_bytes(b"style")
+    previous.add(
+        JOB_KIND_NST,
+        chat_id=42,
+        user_id=7,
+        inputs={"style_path": str(style_path), "content_file_id": "content_id"},
+    )
+
+    await resume_unfinished_jobs(
+        fake_bot, store, engines, max_attempts=3, take_over=True
+    )
+
+    engines[JOB_KIND_NST].process_images.assert_called_once_with(
+        str(style_path), b"bytes:content_id"
+    )
+
+
+@pytest.mark.asyncio
+async def test_resume_cyclegan_job(store, previous, fake_bot, engines):
+    previous.add(
+        JOB_KIND_CYCLEGAN,
+        chat_id=42,
+        user_id=7,
+        inputs={"content_file_id": "content_id"},
+        params={"style": "monet"},
+    )
+
+    await resume_unfinished_jobs(
+        fake_bot, store, engines, max_attempts=3, take_over=True
+    )
+
+    engines[JOB_KIND_CYCLEGAN].stylize_bytes.assert_called_once_with(
+        image_bytes=b"bytes:content_id", style_name="monet"
+    )
+    photo = fake_bot.send_photo.call_args.kwargs["photo"]
+    assert photo.data == b"cyclegan-result"
+
+
+@pytest.mark.asyncio
+async def test_job_over_attempt_limit_is_failed(store, previous, fake_bot, engines):
+    job_id = previous.add(JOB_KIND_CYCLEGAN, chat_id=42, user_id=7, inputs={})
+    for _ in range(3):
+        previous.mark_running(job_id)
+
+    await resume_unfinished_jobs(
+        fake_bot, store, engines, max_attempts=3, take_over=True
+    )
+
+    assert store.get(job_id).status == JobStatus.FAILED
+    fake_bot.send_photo.assert_not_awaited()
+    fake_bot.send_message.assert_awaited_once()
+    assert fake_bot.send_message.call_args.args[0] == 42
+
+
+@pytest.mark.asyncio
+async def test_failed_resume_notifies_user(store, previous, fake_bot, engines):
+    engines[JOB_KIND_CYCLEGAN].stylize_bytes.side_effect = RuntimeError("boom")
+    job_id = previous.add(
+        JOB_KIND_CYCLEGAN,
+        chat_id=42,
+        user_id=7,
+        inputs={"content_file_id": "content_id"},
+        params={"style": "monet"},
+    )
+
+    await resume_unfinished_jobs(
+        fake_bot, store, engines, max_attempts=3, take_over=True
+    )
+
+    assert store.get(job_id).status == JobStatus.FAILED
+    fake_bot.send_message.assert_awaited_once()
+    assert fake_bot.send_message.call_args.args[0] == 42
+
+
+@pytest.mark.asyncio
+async def test_jobs_of_live_sibling_are_not_resumed(tmp_path, fake_bot, engines):
+    """Перезапущенный процесс не дублирует задачи, которые выполняет соседний."""
+    path = tmp_path / "jobs.sqlite3"
+    sibling = JobStore(path, owner="worker-1")
+    dead = JobStore(path, owner="worker-0-old", lease_seconds=0.0)
+    restarted = JobStore(path, owner="worker-0")
+    try:
+        live_id = sibling.add(
+            JOB_KIND_CYCLEGAN,
+            chat_id=1,
+            user_id=1,
+            inputs={"content_file_id": "live"},
+            params={"style": "monet"},
+        )
+        sibling.mark_running(live_id)
+        orphan_id = dead.add(
+            JOB_KIND_CYCLEGAN,
+            chat_id=2,
+            user_id=2,
+            inputs={"content_file_id": "orphan"},
+            params={"style": "monet"},
+        )
+
+        await resume_unfinished_jobs(fake_bot, restarted, engines, max_attempts=3)
+
+        engines[JOB_KIND_CYCLEGAN].stylize_bytes.assert_called_once_with(
+            image_bytes=b"bytes:orphan", style_name="monet"
+        )
+        assert restarted.get(orphan_id) is None
+        assert restarted.get(live_id).owner == "worker-1"
+    finally:
+        sibling.close()
+        dead.close()
+        restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_resumed_concurrently(store, previous, fake_bot, engines):
+    """Задачи возобновляются одновременно, а не по очереди."""
+    started = []
+    release = asyncio.Event()
+
+    async def slow_download(file_id, destination):
+        started.append(file_id)
+        await release.wait()
+        destination.write(b"bytes")
+
+    fake_bot.download = AsyncMock(side_effect=slow_download)
+    for i in range(3):
+        previous.add(
+            JOB_KIND_CYCLEGAN,
+            chat_id=i,
+            user_id=i,
+            inputs={"content_file_id": f"photo-{i}"},
+            params={"style": "monet"},
+        )
+
+    resuming = asyncio.create_task(
+        resume_unfinished_jobs(fake_bot, store, engines, max_attempts=3, take_over=True)
+    )
+    for _ in range(100):
+        if len(started) == 3:
+            break
+        await asyncio.sleep(0.01)
+    waiting_together = sorted(started)
+    release.set()
+    await resuming
+
+    assert waiting_together == ["photo-0", "photo-1", "photo-2"]
+    assert fake_bot.send_photo.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_restart_with_same_host_and_pid_resumes_jobs(tmp_path, fake_bot, engines):
+    """После перезапуска контейнера (тот же hostname и PID 1) задачи возобновляются."""
+    path = tmp_path / "jobs.sqlite3"
+    crashed = JobStore(path)
+    job_id = crashed.add(
+        JOB_KIND_CYCLEGAN,
+        chat_id=42,
+        user_id=7,
+        inputs={"content_file_id": "content_id"},
+        params={"style": "monet"},
+    )
+    crashed.mark_running(job_id)
+    crashed.close()
+
+    restarted = JobStore(path)
+    try:
+        assert restarted.owner.rsplit(":", 1)[0] == crashed.owner.rsplit(":", 1)[0]
+        await resume_unfinished_jobs(
+            fake_bot, restarted, engines, max_attempts=3, take_over=True
+        )
+
+        engines[JOB_KIND_CYCLEGAN].stylize_bytes.assert_called_once()
+        assert restarted.get(job_id) is None
+    finally:
+        restarted.close()
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from app.job_store import JOB_KIND_CYCLEGAN
+from benchmarks.engines import build_cyclegan_engine
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.loadtest import BotUnderTest, replay, run_load
+from benchmarks.runner import synthetic_jpeg
+
+
+@pytest.fixture
+def engines():
+    engine = build_cyclegan_engine(weights="standin")
+    engine.config.IMAGE_SIZE = 32
+    return {JOB_KIND_CYCLEGAN: engine}
+
+
+@pytest.mark.asyncio
+async def test_synthetic_users_get_results_through_real_dispatcher(engines, tmp_path):
+    """Синтетические пользователи проходят /cyclegan целиком через настоящий диспетчер,
+    а записанный лог обновлений воспроизводится с тем же результатом."""
+    images = [synthetic_jpeg(64, 0)]
+    record_path = tmp_path / "updates.jsonl"
+
+    api = FakeBotAPI(default_image=images[0])
+    async with BotUnderTest(api, settings_overrides={"TRACING_ENABLED": False},
+                            engines=engines) as bot:
+        summary = await run_load(
+            bot, users=3, rate=50, mix={JOB_KIND_CYCLEGAN: 1}, images=images,
+            timeout=60, record_path=str(record_path),
+        )
+
+    assert summary["completed"] == 3
+    assert summary["error_rate"] == 0
+    assert summary["flows"][JOB_KIND_CYCLEGAN]["result_latency_ms"]["p50"] > 0
+    assert summary["bot_api_calls"]["sendphoto"] == 3
+    assert len(record_path.read_text().splitlines()) == 9  # command, button, photo
+
+    api = FakeBotAPI(default_image=images[0])
+    async with BotUnderTest(api, settings_overrides={"TRACING_ENABLED": False},
+                            engines=engines) as bot:
+        replayed = await replay(bot, str(record_path), speed=10, timeout=60)
+
+    assert replayed["updates"] == 9
+    assert replayed["results"] == 3
+    assert replayed["unanswered_updates"] == 0
+
+
+@pytest.mark.asyncio
+async def test_bot_error_reply_counts_as_failed_flow(engines, monkeypatch):
+    """Текстовый ответ вместо картинки засчитывается как ошибка с текстом ответа."""
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(engines[JOB_KIND_CYCLEGAN], "stylize_bytes", broken)
+    images = [synthetic_jpeg(64, 0)]
+    api = FakeBotAPI()
+    async with BotUnderTest(api, settings_overrides={"TRACING_ENABLED": False},
+                            engines=engines) as bot:
+        summary = await run_load(
+            bot, users=1, rate=1, mix={JOB_KIND_CYCLEGAN: 1}, images=images, timeout=30
+        )
+
+    assert summary["errors"] == 1
+    assert "sendmessage" in summary["error_samples"][0]
+    json.dumps(summary)  # the report must be serializable
@@ -1,3 +1,6 @@
+import asyncio
+import sqlite3
+
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from aiogram.types import Message, CallbackQuery, User, PhotoSize
@@ -6,6 +9,9 @@ from aiogram.fsm.context import FSMContext
 from aiogram import Bot
 
 import app.handlers.nst as nst
+from app.job_store import JobStore
+from app.image_store import InputImageStore
+from app.result_cache import ResultCache
 
 
 @pytest.fixture
@@ -17,6 +23,7 @@ def fake_user():
 def fake_message(fake_user):
     msg = MagicMock(spec=Message)
     msg.from_user = fake_user
+    msg.chat = MagicMock(id=456)
     msg.photo = [
         PhotoSize(
             file_id="photo_id",
@@ -64,8 +71,10 @@ def fake_bot():
 @pytest.fixture
 def fake_nst_engine():
     engine = MagicMock()
+    engine.working_size = 256
     engine.get_available_styles.return_value = {"starry.jpg": "Starry Night"}
     engine.process_images.return_value = b"imagebytes"
+    engine.predict_duration.return_value = None  # истории времени ещё нет
     return engine
 
 
@@ -123,19 +132,25 @@ async def test_cb_default_style_not_found(fake_callback, fake_state, patch_nst_p
 
 @pytest.mark.asyncio
 async def test_nst_style_image_uploaded_success(
-    fake_message, fake_state, fake_bot, patch_nst_params, tmp_path
+    fake_message, fake_state, fake_bot, fake_nst_engine, patch_nst_params, tmp_path
 ):
-    await nst.nst_style_image_uploaded(fake_message, fake_state, fake_bot)
-    fake_bot.download_file.assert_called()
+    await nst.nst_style_image_uploaded(
+        fake_message, fake_state, fake_bot, fake_nst_engine
+    )
+    fake_bot.download.assert_called()
     fake_state.update_data.assert_called()
     fake_state.set_state.assert_called_with(nst.NSTStates.waiting_for_content_image)
     fake_message.answer.assert_called()
 
 
 @pytest.mark.asyncio
-async def test_nst_style_image_uploaded_no_photo(fake_message, fake_state, fake_bot):
+async def test_nst_style_image_uploaded_no_photo(
+    fake_message, fake_state, fake_bot, fake_nst_engine
+):
     fake_message.photo = []
-    await nst.nst_style_image_uploaded(fake_message, fake_state, fake_bot)
+    await nst.nst_style_image_uploaded(
+        fake_message, fake_state, fake_bot, fake_nst_engine
+    )
     fake_message.answer.assert_called()
 
 
@@ -215,3 +230,119 @@ async def test_cancel_nst_operation_callback(fake_callback, fake_state):
         await nst.cancel_nst_operation(fake_callback, fake_state, is_callback=True)
     fake_callback.message.edit_text.assert_called()
     fake_callback.answer.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_nst_content_image_received_records_job(
+    fake_message, fake_state, fake_bot, fake_nst_engine, patch_nst_params, tmp_path
+):
+    job_store = JobStore(tmp_path / "jobs.sqlite3")
+    fake_message.chat = MagicMock(id=456)
+    style_file = tmp_path / "starry.jpg"
+    style_file.write_bytes(b"123")
+    fake_state.get_data = AsyncMock(
+        return_value={"style_image_path": str(style_file), "style_is_default": True}
+    )
+    with patch.object(job_store, "add", wraps=job_store.add) as mock_add, patch(
+        "app.handlers.nst.format_duration", return_value="1 сек"
+    ):
+        await nst.nst_content_image_received(
+            fake_message, fake_state, fake_bot, fake_nst_engine, job_store=job_store
+        )
+
+    added = mock_add.call_args.kwargs
+    assert added["chat_id"] == 456
+    assert added["inputs"]["content_file_id"] == "photo_id"
+    # Delivered jobs are removed from the store
+    assert job_store.unfinished() == []
+    job_store.close()
+
+
+@pytest.mark.asyncio
+async def test_nst_content_image_uses_stored_style(
+    fake_message, fake_state, fake_bot, fake_nst_engine, tmp_path, monkeypatch
+):
+    """Загруженный стиль берется из памяти, без повторного скачивания."""
+    store = InputImageStore(max_bytes=1024, spill_threshold=512, spill_dir=tmp_path)
+    await store.put(fake_message.from_user.id, b"style-bytes")
+    monkeypatch.setattr(nst, "style_image_store", store)
+    fake_state.get_data = AsyncMock(
+        return_value={"style_file_id": "style_id", "style_is_default": False}
+    )
+    with patch("app.handlers.nst.format_duration", return_value="1 сек"):
+        await nst.nst_content_image_received(
+            fake_message, fake_state, fake_bot, fake_nst_engine
+        )
+
+    style_arg, _ = fake_nst_engine.process_images.call_args.args
+    assert style_arg == b"style-bytes"
+    # Скачан только контент
+    assert fake_bot.download.await_count == 1
+    assert len(store) == 0
+    fake_message.answer_photo.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_nst_repeated_request_served_from_result_cache(
+    fake_message, fake_state, fake_bot, fake_nst_engine, patch_nst_params, tmp_path
+):
+    """Повторный запрос с тем же фото и стилем отправляет готовый file_id."""
+    result_cache = ResultCache()
+    style_file = tmp_path / "starry.jpg"
+    style_file.write_bytes(b"123")
+    fake_state.get_data = AsyncMock(
+        return_value={"style_image_path": str(style_file), "style_is_default": True}
+    )
+    sent = MagicMock()
+    sent.photo = [MagicMock(file_id="sent_file_id")]
+    fake_message.answer_photo = AsyncMock(return_value=sent)
+
+    with patch("app.handlers.nst.format_duration", return_value="1 сек"):
+        for _ in range(2):
+            await nst.nst_content_image_received(
+                fake_message,
+                fake_state,
+                fake_bot,
+                fake_nst_engine,
+                result_cache=result_cache,
+            )
+
+    fake_nst_engine.process_images.assert_called_once()
+    assert fake_message.answer_photo.await_count == 2
+    assert fake_message.answer_photo.call_args.args[0] == "sent_file_id"
+
+
+@pytest.mark.asyncio
+async def test_nst_style_upload_starts_style_preparation(
+    fake_message, fake_state, fake_bot, fake_nst_engine, patch_nst_params
+):
+    """После загрузки стиля его подготовка запускается в фоне."""
+    await nst.nst_style_image_uploaded(
+        fake_message, fake_state, fake_bot, fake_nst_engine
+    )
+    await asyncio.gather(*nst._style_preparations)
+
+    fake_nst_engine.prepare_style.assert_called_once()
+    assert fake_nst_engine.prepare_style.call_args.args[1] == "unique"
+
+
+@pytest.mark.asyncio
+async def test_locked_job_store_is_reported_to_user(
+    fake_message, fake_state, fake_bot, fake_nst_engine, patch_nst_params, tmp_path
+):
+    """Если хранилище задач заблокировано, пользователь получает сообщение об ошибке."""
+    job_store = MagicMock(spec=JobStore)
+    job_store.add.side_effect = sqlite3.OperationalError("database is locked")
+    style_file = tmp_path / "starry.jpg"
+    style_file.write_bytes(b"123")
+    fake_state.get_data = AsyncMock(
+        return_value={"style_image_path": str(style_file), "style_is_default": True}
+    )
+
+    await nst.nst_content_image_received(
+        fake_message, fake_state, fake_bot, fake_nst_engine, job_store=job_store
+    )
+
+    fake_nst_engine.process_images.assert_not_called()
+    assert "непредвиденная ошибка" in fake_message.answer.call_args.args[0]
+    fake_state.clear.assert_awaited()
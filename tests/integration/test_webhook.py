@@ -0,0 +1,180 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.webhook import BackgroundRequestHandler, UpdateDeduplicator
+
+SECRET = "secret"
+
+
+@pytest.fixture
+def bot():
+    return Bot(token="42:TEST")
+
+
+@pytest.fixture
+def release():
+    return asyncio.Event()
+
+
+@pytest.fixture
+def dispatcher(release):
+    dp = MagicMock(spec=Dispatcher)
+    dp.processed = []
+
+    async def feed_raw_update(bot, update, **kwargs):
+        await release.wait()
+        dp.processed.append(update["update_id"])
+
+    dp.feed_raw_update = AsyncMock(side_effect=feed_raw_update)
+    return dp
+
+
+@pytest_asyncio.fixture
+async def make_client():
+    clients = []
+
+    async def factory(handler):
+        app = web.Application()
+        handler.register(app, path="/webhook")
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        clients.append(client)
+        return client
+
+    yield factory
+    for client in clients:
+        await client.close()
+
+
+def _post(client, update_id):
+    return client.post(
+        "/webhook",
+        json={"update_id": update_id},
+        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+    )
+
+
+def test_deduplicator_is_bounded():
+    dedup = UpdateDeduplicator(size=2)
+    assert dedup.check_and_add(1) is False
+    assert dedup.check_and_add(1) is True
+    dedup.check_and_add(2)
+    dedup.check_and_add(3)
+    # 1 was evicted
+    assert dedup.check_and_add(1) is False
+
+
+@pytest.mark.asyncio
+async def test_update_is_acknowledged_before_processing(
+    bot, dispatcher, release, make_client
+):
+    """Telegram получает 200 до того, как обработчик завершился."""
+    handler = BackgroundRequestHandler(dispatcher, bot, secret_token=SECRET)
+    client = await make_client(handler)
+
+    resp = await _post(client, 1)
+    assert resp.status == 200
+    assert dispatcher.processed == []
+    assert handler.pending_count == 1
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert dispatcher.processed == [1]
+    assert handler.pending_count == 0
+
+
+@pytest.mark.asyncio
+async def test_duplicate_updates_are_dropped(bot, dispatcher, release, make_client):
+    handler = BackgroundRequestHandler(dispatcher, bot, secret_token=SECRET)
+    client = await make_client(handler)
+    release.set()
+
+    for _ in range(3):
+        assert (await _post(client, 7)).status == 200
+    await asyncio.sleep(0.05)
+
+    assert dispatcher.processed == [7]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit(bot, dispatcher, release, make_client):
+    handler = BackgroundRequestHandler(
+        dispatcher, bot, max_concurrency=2, secret_token=SECRET
+    )
+    client = await make_client(handler)
+
+    for update_id in range(5):
+        await _post(client, update_id)
+    await asyncio.sleep(0.05)
+
+    assert dispatcher.feed_raw_update.await_count == 2
+    release.set()
+    await asyncio.sleep(0.05)
+    assert sorted(dispatcher.processed) == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_full_backlog_returns_503_and_allows_redelivery(
+    bot, dispatcher, release, make_client
+):
+    handler = BackgroundRequestHandler(
+        dispatcher, bot, max_concurrency=1, max_pending=1, secret_token=SECRET
+    )
+    client = await make_client(handler)
+
+    assert (await _post(client, 1)).status == 200
+    assert (await _post(client, 2)).status == 200
+    assert (await _post(client, 3)).status == 503
+
+    release.set()
+    await asyncio.sleep(0.05)
+    # The rejected update is not remembered as seen and is processed on retry
+    assert (await _post(client, 3)).status == 200
+    await asyncio.sleep(0.05)
+    assert dispatcher.processed == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_backlog_limit_counts_only_waiting_updates(
+    bot, dispatcher, release, make_client
+):
+    """max_pending ограничивает только ожидающие обновления, без выполняющихся."""
+    handler = BackgroundRequestHandler(
+        dispatcher, bot, max_concurrency=2, max_pending=3, secret_token=SECRET
+    )
+    client = await make_client(handler)
+
+    # 2 обрабатываются и ровно 3 ждут: все приняты
+    for update_id in range(5):
+        assert (await _post(client, update_id)).status == 200
+    await asyncio.sleep(0.05)
+    assert dispatcher.feed_raw_update.await_count == 2
+    assert handler.waiting_count == 3
+    assert handler.pending_count == 5
+
+    # Шестое уже не помещается в очередь ожидания
+    assert (await _post(client, 5)).status == 503
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert handler.waiting_count == 0
+    assert handler.pending_count == 0
+
+
+@pytest.mark.asyncio
+async def test_wrong_secret_is_rejected(bot, dispatcher, make_client):
+    handler = BackgroundRequestHandler(dispatcher, bot, secret_token=SECRET)
+    client = await make_client(handler)
+
+    resp = await client.post(
+        "/webhook",
+        json={"update_id": 1},
+        headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"},
+    )
+    assert resp.status == 401
@@ -0,0 +1,64 @@
+import copy
+
+from benchmarks.runner import Case, compare, make_cases, run_case
+
+
+def _result(key, p50, throughput, rss):
+    return {
+        "key": key,
+        "latency_ms": {"p50": p50},
+        "throughput_images_per_s": throughput,
+        "peak_rss_mb": rss,
+    }
+
+
+def test_make_cases_batches_only_for_cyclegan_forward():
+    """Размер батча перебирается только для прямого прохода CycleGAN."""
+    cases = make_cases(["nst", "cyclegan"], [64], [1], ["fp32"], [1, 4])
+    keys = [c.key for c in cases]
+    assert keys == [
+        "nst/process_images/size=64/threads=1/fp32/batch=1",
+        "cyclegan/stylize/size=64/threads=1/fp32/batch=1",
+        "cyclegan/forward/size=64/threads=1/fp32/batch=1",
+        "cyclegan/forward/size=64/threads=1/fp32/batch=4",
+    ]
+
+
+def test_compare_flags_only_regressions_beyond_threshold():
+    """Регрессии выше порога находятся, улучшения и шум в пределах порога - нет."""
+    baseline = {
+        "results": [
+            _result("a", 100.0, 10.0, 500.0),
+            _result("b", 100.0, 10.0, 500.0),
+            _result("gone", 100.0, 10.0, 500.0),
+        ]
+    }
+    current = {
+        "results": [
+            _result("a", 105.0, 9.5, 550.0),  # within thresholds
+            _result("b", 130.0, 7.0, 700.0),
+            _result("new", 1.0, 1.0, 1.0),  # no baseline to compare with
+        ]
+    }
+    regressions = compare(baseline, current, threshold=0.1, rss_threshold=0.2)
+    assert {(r["key"], r["metric"]) for r in regressions} == {
+        ("b", "p50_latency_ms"),
+        ("b", "throughput_images_per_s"),
+        ("b", "peak_rss_mb"),
+    }
+    assert compare(baseline, copy.deepcopy(baseline)) == []
+
+
+def test_run_case_reports_percentiles_and_throughput():
+    """Прогон одного случая на маленьком генераторе возвращает все метрики."""
+    from benchmarks.engines import build_cyclegan_engine
+
+    engine = build_cyclegan_engine(weights="standin")
+    case = Case("cyclegan", "forward", 32, 1, "fp32", 2)
+    result = run_case(engine, case, repeat=2, warmup=0)
+
+    assert result["key"] == case.key
+    latency = result["latency_ms"]
+    assert 0 < latency["p50"] <= latency["p90"] <= latency["p99"]
+    assert result["throughput_images_per_s"] > 0
+    assert result["peak_rss_mb"] > 0
@@ -0,0 +1,69 @@
+import pytest
+
+from app.calibration import (
+    CalibrationCache,
+    Calibrator,
+    _thread_candidates,
+    _worker_candidates,
+    calibrate_engines,
+    calibration_key,
+)
+from benchmarks.engines import build_cyclegan_engine, build_nst_engine
+
+
+@pytest.fixture(scope="module")
+def engines():
+    nst_engine = build_nst_engine(weights="standin")
+    nst_engine.image_size = 32  # probe size of the concurrency search
+    cyclegan_engine = build_cyclegan_engine(weights="standin")
+    cyclegan_engine.config.IMAGE_SIZE = 32
+    return nst_engine, cyclegan_engine
+
+
+def test_candidates_cover_cores_and_respect_worker_limit():
+    """Кандидаты потоков - степени двойки и все ядра; обработчиков не больше лимита."""
+    assert _thread_candidates(1) == [1]
+    assert _thread_candidates(6) == [1, 2, 4, 6]
+    assert _worker_candidates(32, 1, 4) == [1, 2, 4]
+    assert _worker_candidates(8, 8, 4) == [1]
+
+
+@pytest.mark.parametrize("target, expected", [(1e-9, 16), (1e9, 32)])
+def test_nst_size_is_the_largest_within_target(engines, target, expected):
+    """Выбирается наибольший размер NST, укладывающийся в целевое время."""
+    nst_engine, _ = engines
+    calibrator = Calibrator(nst_engine, None, target, image_sizes=(32, 16),
+                            max_workers=1, repeats=1)
+    result = calibrator.calibrate("key", {})
+
+    assert result.nst_image_size == expected
+    assert result.nst_workers == 1
+    assert result.cyclegan_workers is None
+    assert [s["size"] for s in result.measurements["nst_sizes"]] == (
+        [16] if expected == 16 else [16, 32]
+    )
+
+
+def test_result_is_cached_per_host_and_inputs(engines, tmp_path, monkeypatch):
+    """Повторный запуск берёт результат из кэша; другие параметры - новый ключ."""
+    nst_engine, cyclegan_engine = engines
+    cache_path = str(tmp_path / "calibration.json")
+    calls = []
+    original = Calibrator.calibrate
+
+    def counting(self, key, host):
+        calls.append(key)
+        return original(self, key, host)
+
+    monkeypatch.setattr(Calibrator, "calibrate", counting)
+
+    first = calibrate_engines(nst_engine, cyclegan_engine, cache_path,
+                              image_sizes=(16,), max_workers=1)
+    second = calibrate_engines(nst_engine, cyclegan_engine, cache_path,
+                               image_sizes=(16,), max_workers=1)
+
+    assert len(calls) == 1
+    assert second == first
+    assert first.cyclegan_workers == 1
+    assert CalibrationCache(cache_path).get(first.key) == first
+    assert calibration_key(first.host, {"a": 1}) != calibration_key(first.host, {"a": 2})
@@ -1,3 +1,5 @@
+import io
+
 import pytest
 import torch
 from unittest import mock
@@ -5,6 +7,8 @@ from PIL import Image
 
 
 from app.cyclegan_engine import CycleGANEngine
+from app.image_decode import decode_image
+from app.image_encode import OutputEncoderConfig
 from app.architectures.cyclegan_networks import ResnetGenerator
 
 
@@ -18,6 +22,10 @@ def cyclegan_config(tmp_path):
         OUTPUT_CHANNELS = 3
         NUM_RESIDUAL_BLOCKS = 9
         IMAGE_SIZE = 256
+        MAX_INPUT_PIXELS = 40_000_000
+        OUTPUT_ENCODER = OutputEncoderConfig()
+        TENSOR_CACHE_MAX_BYTES = 16 * 1024 * 1024
+        TENSOR_CACHE_TTL = 1800
         styles = {
             "monet": {"display_name": "Monet Style", "model_file": "monet.pth"},
             "vangogh": {"display_name": "Van Gogh Style", "model_file": "vangogh.pth"},
@@ -156,3 +164,68 @@ def test_stylize_raises_error_for_invalid_style(cyclegan_config):
     with pytest.raises(ValueError) as excinfo:
         engine.stylize(dummy_image, "vangogh")
     assert "is not a valid or loaded style" in str(excinfo.value)
+
+
+def test_stylize_bytes_returns_jpeg(cyclegan_config):
+    """stylize_bytes декодирует входные байты и возвращает JPEG."""
+    engine = CycleGANEngine.__new__(CycleGANEngine)
+    engine.config = cyclegan_config
+    engine.device = torch.device("cpu")
+    mock_model = mock.MagicMock(spec=ResnetGenerator)
+    mock_model.return_value = torch.zeros(1, 3, 256, 256)
+    engine.models = {"monet": mock_model}
+
+    input_bio = io.BytesIO()
+    Image.new("RGB", (300, 200)).save(input_bio, format="PNG")
+
+    result_bytes = engine.stylize_bytes(input_bio.getvalue(), "monet")
+
+    result_image = Image.open(io.BytesIO(result_bytes))
+    assert result_image.format == "JPEG"
+    assert result_image.size == (256, 256)
+
+
+def test_stylize_bytes_reuses_input_tensor_for_same_photo(cyclegan_config):
+    """Повторный запрос с тем же фото и другим стилем не декодирует его заново."""
+    engine = CycleGANEngine.__new__(CycleGANEngine)
+    engine.config = cyclegan_config
+    engine.device = torch.device("cpu")
+    monet = mock.MagicMock(return_value=torch.zeros(1, 3, 256, 256))
+    vangogh = mock.MagicMock(return_value=torch.zeros(1, 3, 256, 256))
+    engine.models = {"monet": monet, "vangogh": vangogh}
+
+    input_bio = io.BytesIO()
+    Image.new("RGB", (300, 200)).save(input_bio, format="PNG")
+
+    with mock.patch(
+        "app.cyclegan_engine.decode_image", wraps=decode_image
+    ) as decode:
+        engine.stylize_bytes(input_bio.getvalue(), "monet", cache_key="uniq")
+        engine.stylize_bytes(input_bio.getvalue(), "vangogh", cache_key="uniq")
+
+    decode.assert_called_once()
+    assert torch.equal(monet.call_args.args[0], vangogh.call_args.args[0])
+
+
+def test_stylize_bytes_records_timing(cyclegan_config):
+    """Длительность каждой задачи попадает в историю и дает предсказание."""
+    engine = CycleGANEngine.__new__(CycleGANEngine)
+    engine.config = cyclegan_config
+    engine.device = torch.device("cpu")
+    engine.models = {"monet": mock.MagicMock(return_value=torch.zeros(1, 3, 256, 256))}
+    engine.timing_model = mock.MagicMock()
+    engine.timing_model.predict.return_value = 1.5
+
+    input_bio = io.BytesIO()
+    Image.new("RGB", (300, 200)).save(input_bio, format="PNG")
+    engine.stylize_bytes(input_bio.getvalue(), "monet")
+
+    engine_name, style, size, precision, steps, seconds = (
+        engine.timing_model.record.call_args.args
+    )
+    assert (engine_name, style, size, precision, steps) == ("cyclegan", "monet", 256, "fp32", 1)
+    assert seconds > 0
+    assert engine.predict_duration("monet") == 1.5
+    engine.timing_model.predict.assert_called_once_with(
+        "cyclegan", 256, style="monet", precision="fp32"
+    )
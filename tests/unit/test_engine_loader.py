@@ -0,0 +1,189 @@
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from aiogram.types import CallbackQuery, Message
+
+from app.engine_loader import (
+    ENGINE_FAILED,
+    ENGINE_LOADING,
+    ENGINE_READY,
+    EngineLoader,
+    EngineWarmupMiddleware,
+)
+from app.job_store import JOB_KIND_CYCLEGAN, JOB_KIND_NST
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _slow_loader(engine, seconds=0.3, threads=None):
+    def load():
+        if threads is not None:
+            threads.add(threading.current_thread().name)
+        time.sleep(seconds)
+        return engine
+
+    return load
+
+
+@pytest.mark.asyncio
+async def test_engines_load_in_parallel_threads():
+    """Движки загружаются одновременно в отдельных потоках, не блокируя event loop."""
+    threads = set()
+    nst, cyclegan = object(), object()
+    loader = EngineLoader(
+        {
+            JOB_KIND_NST: _slow_loader(nst, threads=threads),
+            JOB_KIND_CYCLEGAN: _slow_loader(cyclegan, threads=threads),
+        }
+    )
+    published = []
+    loader.on_ready(lambda kind, engine: published.append((kind, engine)))
+
+    start = time.perf_counter()
+    loader.start()
+    await asyncio.sleep(0.05)
+    assert loader.state(JOB_KIND_NST) == ENGINE_LOADING
+    await loader.wait()
+
+    assert time.perf_counter() - start < 0.55
+    assert len(threads) == 2
+    assert sorted(published, key=lambda p: p[0]) == [
+        (JOB_KIND_CYCLEGAN, cyclegan),
+        (JOB_KIND_NST, nst),
+    ]
+    assert loader.engines == {JOB_KIND_NST: nst, JOB_KIND_CYCLEGAN: cyclegan}
+    assert loader.state(JOB_KIND_NST) == ENGINE_READY
+
+
+@pytest.mark.asyncio
+async def test_prepare_sees_all_engines_before_publishing():
+    """С калибровкой движки публикуются вместе, после prepare."""
+    nst = object()
+    events = []
+
+    def prepare(loaded):
+        events.append(("prepare", set(loaded)))
+
+    loader = EngineLoader(
+        {
+            JOB_KIND_NST: _slow_loader(nst, seconds=0.05),
+            JOB_KIND_CYCLEGAN: _slow_loader(None, seconds=0.01),
+        },
+        prepare=prepare,
+    )
+    loader.on_ready(lambda kind, engine: events.append(("publish", kind)))
+    loader.start()
+    await loader.wait()
+
+    assert events[0] == ("prepare", {JOB_KIND_NST})
+    assert {event for event in events[1:]} == {
+        ("publish", JOB_KIND_NST),
+        ("publish", JOB_KIND_CYCLEGAN),
+    }
+    assert loader.state(JOB_KIND_CYCLEGAN) == ENGINE_FAILED
+
+
+@pytest.mark.asyncio
+async def test_failed_load_or_publish_marks_engine_failed():
+    def broken():
+        raise RuntimeError("no weights")
+
+    loader = EngineLoader({JOB_KIND_NST: broken, JOB_KIND_CYCLEGAN: lambda: object()})
+
+    def publish(kind, engine):
+        if kind == JOB_KIND_CYCLEGAN:
+            raise RuntimeError("pool failed")
+
+    loader.on_ready(publish)
+    loader.start()
+    await loader.wait()
+
+    assert loader.state(JOB_KIND_NST) == ENGINE_FAILED
+    assert loader.state(JOB_KIND_CYCLEGAN) == ENGINE_FAILED
+    assert loader.engines == {}
+
+
+def test_retry_after_counts_down_from_estimate(monkeypatch):
+    loader = EngineLoader({}, expected_seconds=30)
+    loader._started = 100.0
+    monkeypatch.setattr(time, "monotonic", lambda: 108.0)
+    assert loader.retry_after(JOB_KIND_NST) == 25
+    monkeypatch.setattr(time, "monotonic", lambda: 200.0)
+    assert loader.retry_after(JOB_KIND_NST) == 5
+
+
+def _handler_data(*params):
+    return {"handler": MagicMock(params={"message", "state", *params})}
+
+
+@pytest.mark.asyncio
+async def test_middleware_answers_while_engine_loads():
+    """Пока модель загружается, обработчик не вызывается, а пользователь узнает, когда повторить."""
+    loader = EngineLoader({JOB_KIND_NST: lambda: None}, expected_seconds=20)
+    middleware = EngineWarmupMiddleware(loader)
+    handler = AsyncMock()
+    message = MagicMock(spec=Message)
+    message.answer = AsyncMock()
+
+    await middleware(handler, message, _handler_data("nst_engine"))
+
+    handler.assert_not_awaited()
+    text = message.answer.await_args.args[0]
+    assert "загружается" in text and "20 сек." in text
+
+
+@pytest.mark.asyncio
+async def test_middleware_alerts_callback_when_engine_failed():
+    loader = EngineLoader({JOB_KIND_CYCLEGAN: lambda: None})
+    loader.states[JOB_KIND_CYCLEGAN] = ENGINE_FAILED
+    middleware = EngineWarmupMiddleware(loader)
+    handler = AsyncMock()
+    callback = MagicMock(spec=CallbackQuery)
+    callback.answer = AsyncMock()
+
+    await middleware(handler, callback, _handler_data("cyclegan_engine"))
+
+    handler.assert_not_awaited()
+    assert "недоступен" in callback.answer.await_args.args[0]
+    assert callback.answer.await_args.kwargs["show_alert"] is True
+
+
+@pytest.mark.asyncio
+async def test_middleware_injects_ready_engine_and_skips_other_handlers():
+    engine = object()
+    loader = EngineLoader({JOB_KIND_NST: lambda: engine})
+    loader.engines[JOB_KIND_NST] = engine
+    middleware = EngineWarmupMiddleware(loader)
+    handler = AsyncMock(return_value="handled")
+
+    data = _handler_data("nst_engine")
+    data["nst_engine"] = None  # снимок workflow_data, сделанный до загрузки
+    assert await middleware(handler, MagicMock(spec=Message), data) == "handled"
+    assert handler.await_args.args[1]["nst_engine"] is engine
+
+    # Обработчики без движка (например, /start) работают и во время загрузки
+    loading = EngineWarmupMiddleware(EngineLoader({JOB_KIND_CYCLEGAN: lambda: None}))
+    assert await loading(handler, MagicMock(spec=Message), _handler_data()) == "handled"
+
+
+def test_bot_import_does_not_load_torch():
+    """Импорт бота не тянет torch и torchvision: они загружаются вместе с движками."""
+    code = (
+        "import sys, app.bot; "
+        "print(sorted(m for m in ('torch', 'torchvision', 'numpy') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,85 @@
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.fsm_storage import SQLiteStorage, create_storage
+
+
+class DemoStates(StatesGroup):
+    waiting = State()
+
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=20)
+
+
+@pytest.mark.asyncio
+async def test_state_roundtrip(tmp_path):
+    storage = SQLiteStorage(tmp_path / "fsm.sqlite3")
+    try:
+        assert await storage.get_state(KEY) is None
+
+        await storage.set_state(KEY, DemoStates.waiting)
+        assert await storage.get_state(KEY) == DemoStates.waiting.state
+
+        await storage.set_state(KEY, None)
+        assert await storage.get_state(KEY) is None
+    finally:
+        await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_data_roundtrip_and_update(tmp_path):
+    storage = SQLiteStorage(tmp_path / "fsm.sqlite3")
+    try:
+        assert await storage.get_data(KEY) == {}
+
+        await storage.set_data(KEY, {"style_image_path": "/tmp/a.jpg"})
+        await storage.update_data(KEY, {"style_is_default": True})
+
+        assert await storage.get_data(KEY) == {
+            "style_image_path": "/tmp/a.jpg",
+            "style_is_default": True,
+        }
+        # State and data are independent columns of one record
+        await storage.set_state(KEY, DemoStates.waiting)
+        assert (await storage.get_data(KEY))["style_is_default"] is True
+    finally:
+        await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_state_is_shared_between_instances(tmp_path):
+    """Два воркера с общим файлом видят одно и то же состояние диалога."""
+    path = tmp_path / "fsm.sqlite3"
+    worker_a = SQLiteStorage(path)
+    worker_b = SQLiteStorage(path)
+    try:
+        await worker_a.set_state(KEY, DemoStates.waiting)
+        await worker_a.set_data(KEY, {"chosen_style": "monet"})
+
+        assert await worker_b.get_state(KEY) == DemoStates.waiting.state
+        assert await worker_b.get_data(KEY) == {"chosen_style": "monet"}
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_keys_are_isolated(tmp_path):
+    storage = SQLiteStorage(tmp_path / "fsm.sqlite3")
+    other_key = StorageKey(bot_id=1, chat_id=11, user_id=21)
+    try:
+        await storage.set_state(KEY, DemoStates.waiting)
+        assert await storage.get_state(other_key) is None
+    finally:
+        await storage.close()
+
+
+def test_create_storage(tmp_path):
+    assert isinstance(create_storage("memory"), MemoryStorage)
+    assert isinstance(
+        create_storage("sqlite", str(tmp_path / "fsm.sqlite3")), SQLiteStorage
+    )
+    with pytest.raises(ValueError):
+        create_storage("redis")
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+from PIL import Image
+
+from app.image_decode import ImageTooLargeError, decode_image
+
+
+def _encode(size, fmt):
+    bio = io.BytesIO()
+    Image.new("RGB", size, color=(200, 10, 10)).save(bio, format=fmt)
+    return bio.getvalue()
+
+
+def test_jpeg_decoded_with_dct_scaling():
+    """JPEG декодируется сразу в уменьшенном масштабе, но не меньше целевого."""
+    image = decode_image(_encode((2048, 1536), "JPEG"), target_size=256)
+    assert image.mode == "RGB"
+    # 1/4 масштаба: 1/8 дал бы 192 px по короткой стороне
+    assert image.size == (512, 384)
+
+
+def test_png_reduced_toward_target():
+    image = decode_image(_encode((1200, 900), "PNG"), target_size=256)
+    assert image.size == (400, 300)
+
+
+@pytest.mark.parametrize("mode", ["P", "1", "I;16"])
+def test_palette_and_16_bit_images_reduced(mode):
+    """Палитровые, 1-битные и 16-битные изображения тоже уменьшаются и переводятся в RGB."""
+    bio = io.BytesIO()
+    Image.new("RGB", (1200, 900), color=(200, 10, 10)).convert(mode).save(bio, format="PNG")
+    image = decode_image(bio.getvalue(), target_size=256)
+    assert image.mode == "RGB"
+    assert image.size == (400, 300)
+
+
+def test_palette_gif_reduced():
+    bio = io.BytesIO()
+    Image.new("RGB", (1200, 900), color=(200, 10, 10)).convert("P").save(bio, format="GIF")
+    image = decode_image(bio.getvalue(), target_size=256)
+    assert image.mode == "RGB"
+    assert image.size == (400, 300)
+    assert image.getpixel((0, 0))[0] > 150
+
+
+def test_small_image_left_as_is(tmp_path):
+    path = tmp_path / "small.jpg"
+    path.write_bytes(_encode((200, 100), "JPEG"))
+    image = decode_image(path, target_size=256)
+    assert image.size == (200, 100)
+
+
+def test_oversized_image_rejected():
+    with pytest.raises(ImageTooLargeError):
+        decode_image(_encode((400, 300), "PNG"), target_size=256, max_pixels=100_000)
+
+
+def test_invalid_source_type():
+    with pytest.raises(ValueError):
+        decode_image(12345, target_size=256)
@@ -0,0 +1,72 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.image_encode import (
+    OutputEncoderConfig,
+    content_type_for,
+    encode_image,
+    result_filename,
+)
+
+
+@pytest.fixture
+def noisy_image():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8))
+
+
+def test_from_dict_defaults_and_overrides():
+    config = OutputEncoderConfig.from_dict(
+        {"FORMAT": "webp", "QUALITY": 80, "MAX_BYTES": 0}
+    )
+    assert config.format == "WEBP"
+    assert config.quality == 80
+    assert config.max_bytes is None
+    assert OutputEncoderConfig.from_dict(None) == OutputEncoderConfig()
+
+
+def test_defaults_match_plain_pil_save(noisy_image):
+    """Настройки по умолчанию не меняют результат по сравнению с image.save(format="JPEG")."""
+    plain = io.BytesIO()
+    noisy_image.save(plain, format="JPEG")
+    assert encode_image(noisy_image, OutputEncoderConfig()) == plain.getvalue()
+
+
+def test_invalid_format_rejected():
+    with pytest.raises(ValueError):
+        OutputEncoderConfig(format="GIF")
+
+
+def test_progressive_jpeg(noisy_image):
+    data = encode_image(noisy_image, OutputEncoderConfig(progressive=True))
+    image = Image.open(io.BytesIO(data))
+    assert image.format == "JPEG"
+    assert image.info.get("progressive") == 1
+
+
+def test_webp_output(noisy_image):
+    data = encode_image(noisy_image, OutputEncoderConfig(format="WEBP", quality=70))
+    assert content_type_for(data) == "image/webp"
+    assert result_filename(data) == "result.webp"
+
+
+def test_max_bytes_lowers_quality_to_fit(noisy_image):
+    """Качество снижается бинарным поиском, пока файл не уложится в лимит."""
+    full = encode_image(noisy_image, OutputEncoderConfig(quality=95))
+    limit = len(full) // 2
+    data = encode_image(
+        noisy_image, OutputEncoderConfig(quality=95, max_bytes=limit, min_quality=5)
+    )
+    assert len(data) <= limit
+    assert result_filename(data) == "result.jpg"
+
+
+def test_max_bytes_unreachable_returns_min_quality(noisy_image):
+    config = OutputEncoderConfig(quality=90, max_bytes=100, min_quality=30)
+    data = encode_image(noisy_image, config)
+    assert data == encode_image(
+        noisy_image, OutputEncoderConfig(quality=30, min_quality=30)
+    )
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.image_store import InputImageStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return InputImageStore(max_bytes=100, spill_threshold=50, spill_dir=tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_put_and_get_in_memory(store):
+    await store.put(1, b"abc")
+    assert store.get(1) == b"abc"
+    assert store.memory_bytes == 3
+
+
+@pytest.mark.asyncio
+async def test_put_replaces_previous_image(store):
+    await store.put(1, b"abc")
+    await store.put(1, b"defgh")
+    assert store.get(1) == b"defgh"
+    assert store.memory_bytes == 5
+    assert len(store) == 1
+
+
+@pytest.mark.asyncio
+async def test_large_image_is_spilled_to_disk(store, tmp_path):
+    """Большие изображения пишутся во временный файл и удаляются при discard."""
+    await store.put(1, b"x" * 60)
+    path = store.get(1)
+    assert isinstance(path, Path)
+    assert path.read_bytes() == b"x" * 60
+    assert store.memory_bytes == 0
+
+    store.discard(1)
+    assert not path.exists()
+    assert store.get(1) is None
+
+
+@pytest.mark.asyncio
+async def test_oldest_entries_evicted_over_budget(store):
+    await store.put(1, b"a" * 40)
+    await store.put(2, b"b" * 40)
+    await store.put(3, b"c" * 40)
+    assert store.get(1) is None
+    assert store.get(2) == b"b" * 40
+    assert store.memory_bytes == 80
+
+
+@pytest.mark.asyncio
+async def test_expired_entry_is_dropped(tmp_path):
+    store = InputImageStore(max_bytes=100, spill_threshold=50, spill_dir=tmp_path, ttl=0)
+    await store.put(1, b"abc")
+    assert store.get(1) is None
+    assert store.memory_bytes == 0
+
+
+@pytest.mark.asyncio
+async def test_spill_write_runs_off_event_loop(store):
+    """Запись большого изображения на диск выполняется не в потоке event loop."""
+    loop_thread = threading.current_thread()
+    writers = []
+    spill = store._spill
+
+    def recording_spill(path, data):
+        writers.append(threading.current_thread())
+        spill(path, data)
+
+    store._spill = recording_spill
+    await store.put(1, b"x" * 60)
+
+    assert len(writers) == 1 and writers[0] is not loop_thread
+    assert store.get(1).read_bytes() == b"x" * 60
+
+
+@pytest.mark.asyncio
+async def test_concurrent_puts_keep_one_spill_file(store, tmp_path):
+    await asyncio.gather(store.put(1, b"x" * 60), store.put(1, b"y" * 60))
+
+    assert len(store) == 1
+    assert list(tmp_path.iterdir()) == [store.get(1)]
@@ -0,0 +1,59 @@
+import io
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+from app.image_encode import OutputEncoderConfig
+from app.image_tensor import ImageTensorCodec
+
+
+def _gradient_image(width=400, height=300):
+    y, x = np.mgrid[0:height, 0:width]
+    array = np.stack(
+        [x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], -1
+    )
+    return Image.fromarray(array.astype(np.uint8))
+
+
+def test_to_tensor_matches_torchvision_pipeline():
+    """Слитое масштабирование и нормализация совпадают с Compose из torchvision."""
+    image = _gradient_image()
+    codec = ImageTensorCodec(torch.device("cpu"), mean=(0.5,) * 3, std=(0.5,) * 3)
+
+    tensor = codec.to_tensor(codec.resize(image, 256, center_crop=True))
+
+    reference = transforms.Compose(
+        [
+            transforms.Resize(256),
+            transforms.CenterCrop(256),
+            transforms.ToTensor(),
+            transforms.Normalize((0.5,) * 3, (0.5,) * 3),
+        ]
+    )(image).unsqueeze(0)
+    assert tensor.shape == (1, 3, 256, 256)
+    assert tensor.dtype == torch.float32
+    # Differences come only from resampling rounding (about one uint8 step)
+    assert (tensor - reference).abs().max() < 0.02
+
+
+def test_round_trip_is_lossless():
+    image = _gradient_image(64, 48)
+    codec = ImageTensorCodec(
+        torch.device("cpu"), mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)
+    )
+    restored = codec.to_image(codec.to_tensor(image))
+    assert np.array_equal(np.asarray(restored), np.asarray(image))
+
+
+def test_resize_squashes_without_crop():
+    codec = ImageTensorCodec(torch.device("cpu"))
+    assert codec.resize(_gradient_image(), 128).size == (128, 128)
+
+
+def test_encode_clamps_out_of_range_values():
+    codec = ImageTensorCodec(torch.device("cpu"))
+    tensor = torch.full((1, 3, 8, 8), 1.7)
+    image = Image.open(io.BytesIO(codec.encode(tensor, OutputEncoderConfig(format="PNG"))))
+    assert image.getpixel((0, 0)) == (255, 255, 255)
@@ -0,0 +1,178 @@
+import sqlite3
+import time
+
+import pytest
+
+from app.job_store import JOB_KIND_NST, JobStatus, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = JobStore(tmp_path / "jobs.sqlite3")
+    yield s
+    s.close()
+
+
+def test_add_and_get(store):
+    job_id = store.add(
+        JOB_KIND_NST,
+        chat_id=1,
+        user_id=2,
+        inputs={"content_file_id": "abc"},
+        params={"steps": 10},
+    )
+
+    job = store.get(job_id)
+    assert job.kind == JOB_KIND_NST
+    assert job.chat_id == 1
+    assert job.inputs == {"content_file_id": "abc"}
+    assert job.params == {"steps": 10}
+    assert job.status == JobStatus.QUEUED
+    assert job.attempts == 0
+
+
+def test_lifecycle(store):
+    job_id = store.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={})
+
+    store.mark_running(job_id)
+    job = store.get(job_id)
+    assert job.status == JobStatus.RUNNING
+    assert job.attempts == 1
+
+    store.mark_done(job_id)
+    assert store.get(job_id) is None
+
+
+def test_failed_jobs_are_not_unfinished(store):
+    failed_id = store.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={})
+    store.mark_failed(failed_id, "boom")
+    running_id = store.add(JOB_KIND_NST, chat_id=3, user_id=4, inputs={})
+    store.mark_running(running_id)
+
+    assert [job.id for job in store.unfinished()] == [running_id]
+    assert store.get(failed_id).error == "boom"
+
+
+def test_jobs_survive_reopen(tmp_path):
+    """Задачи сохраняются на диске и видны после перезапуска."""
+    path = tmp_path / "jobs.sqlite3"
+    first = JobStore(path)
+    job_id = first.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={"a": 1})
+    first.mark_running(job_id)
+    first.close()
+
+    second = JobStore(path)
+    try:
+        unfinished = second.unfinished()
+        assert len(unfinished) == 1
+        assert unfinished[0].id == job_id
+        assert unfinished[0].status == JobStatus.RUNNING
+    finally:
+        second.close()
+
+
+def test_referenced_paths(store, tmp_path):
+    style_path = tmp_path / "style.jpg"
+    store.add(
+        JOB_KIND_NST,
+        chat_id=1,
+        user_id=2,
+        inputs={"style_path": str(style_path), "content_file_id": "abc"},
+    )
+
+    assert store.referenced_paths() == {style_path.resolve()}
+
+
+def _two_workers(tmp_path, lease_seconds=60.0):
+    path = tmp_path / "jobs.sqlite3"
+    return (
+        JobStore(path, owner="worker-0", lease_seconds=lease_seconds),
+        JobStore(path, owner="worker-1", lease_seconds=lease_seconds),
+    )
+
+
+def test_live_lease_is_not_claimed_by_sibling(tmp_path):
+    """Задачу, которую выполняет живой процесс, другой процесс не забирает."""
+    first, second = _two_workers(tmp_path)
+    try:
+        job_id = first.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={})
+        first.mark_running(job_id)
+
+        assert second.claim_unfinished() == []
+        assert second.claim(job_id) is False
+        assert first.get(job_id).owner == "worker-0"
+    finally:
+        first.close()
+        second.close()
+
+
+def test_expired_lease_is_claimed_once(tmp_path, monkeypatch):
+    """Задачу упавшего процесса забирает ровно один из оставшихся."""
+    first, second = _two_workers(tmp_path, lease_seconds=10.0)
+    third = JobStore(tmp_path / "jobs.sqlite3", owner="worker-2", lease_seconds=10.0)
+    try:
+        job_id = first.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={})
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 11)
+
+        assert [job.id for job in second.claim_unfinished()] == [job_id]
+        assert third.claim_unfinished() == []
+        job = third.get(job_id)
+        assert job.owner == "worker-1"
+        assert job.lease_until == pytest.approx(now + 21)
+    finally:
+        first.close()
+        second.close()
+        third.close()
+
+
+def test_renewed_lease_stays_with_owner(tmp_path, monkeypatch):
+    first, second = _two_workers(tmp_path, lease_seconds=10.0)
+    try:
+        job_id = first.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={})
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 8)
+        assert first.renew_leases() == 1
+        monkeypatch.setattr(time, "time", lambda: now + 15)
+
+        assert second.claim(job_id) is False
+    finally:
+        first.close()
+        second.close()
+
+
+def test_take_over_claims_live_leases_of_other_owners(tmp_path):
+    """Единственный процесс после перезапуска забирает все задачи прошлого запуска."""
+    first, second = _two_workers(tmp_path)
+    try:
+        job_id = first.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={})
+        failed_id = first.add(JOB_KIND_NST, chat_id=1, user_id=2, inputs={})
+        first.mark_failed(failed_id, "boom")
+
+        assert [job.id for job in second.claim_unfinished(take_over=True)] == [job_id]
+        # Свои задачи при этом не перезахватываются
+        assert second.claim_unfinished(take_over=True) == []
+    finally:
+        first.close()
+        second.close()
+
+
+def test_store_without_lease_columns_is_migrated(tmp_path):
+    """Хранилище, созданное до появления владельцев задач, дополняется колонками."""
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, "
+        "chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, inputs TEXT NOT NULL, "
+        "params TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+        "error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL);"
+        "INSERT INTO jobs VALUES ('old', 'nst', 1, 2, '{}', '{}', 'running', 1, NULL, 0, 0);"
+    )
+    conn.close()
+
+    store = JobStore(path, owner="worker-0")
+    try:
+        assert store.get("old").owner is None
+        assert [job.id for job in store.claim_unfinished()] == ["old"]
+    finally:
+        store.close()
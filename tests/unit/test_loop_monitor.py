@@ -0,0 +1,40 @@
+import asyncio
+import time
+from asyncio import events
+
+import pytest
+
+from app.loop_monitor import LoopLagMonitor
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_detects_blocking_call():
+    """Блокирующий вызов в event loop фиксируется как задержка."""
+    monitor = LoopLagMonitor(threshold=0.05, interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)  # blocks the loop
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    assert monitor.stall_count >= 1
+    assert monitor.max_lag >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_trace_callbacks_names_the_culprit():
+    original_run = events.Handle._run
+    monitor = LoopLagMonitor(threshold=0.05, interval=1.0, trace_callbacks=True)
+    monitor.start()
+
+    def blocking_callback():
+        time.sleep(0.08)
+
+    asyncio.get_running_loop().call_soon(blocking_callback)
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+
+    assert monitor.slow_callbacks >= 1
+    assert "blocking_callback" in monitor.last_slow_callback
+    # The hook is removed once the last tracing monitor stops
+    assert events.Handle._run is original_run
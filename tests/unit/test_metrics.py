@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.engines import WorkerPool
+from app.metrics import (
+    Registry,
+    register_cache_metrics,
+    register_executor_metrics,
+    setup_metrics,
+    track_request,
+    JOBS_TOTAL,
+)
+from app.photo_cache import BoundedCache
+
+
+def test_render_counter_gauge_and_histogram():
+    """Метрики выводятся в текстовом формате Prometheus."""
+    registry = Registry()
+    jobs = registry.counter("jobs_total", "Jobs.", ["engine"])
+    depth = registry.gauge("queue_depth", "Queue depth.")
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(1, 5))
+
+    jobs.inc(engine="nst")
+    jobs.inc(2, engine="nst")
+    depth.set(3)
+    latency.observe(0.5)
+    latency.observe(3)
+
+    text = registry.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{engine="nst"} 3.0' in text
+    assert "queue_depth 3.0" in text
+    assert 'latency_seconds_bucket{le="1.0"} 1' in text
+    assert 'latency_seconds_bucket{le="5.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_sum 3.5" in text
+    assert "latency_seconds_count 2" in text
+
+
+def test_labels_must_match():
+    registry = Registry()
+    jobs = registry.counter("jobs_total", "Jobs.", ["engine"])
+    with pytest.raises(ValueError):
+        jobs.inc(style="monet")
+
+
+def test_cache_hit_ratio_collected_at_scrape_time():
+    """Счётчики попаданий кэша читаются в момент запроса метрик."""
+    registry = Registry()
+    cache = BoundedCache(max_bytes=1024)
+    register_cache_metrics({"photo": cache, "disabled": None}, registry)
+
+    cache.put("a", b"x")
+    cache.get("a")
+    cache.get("b")
+
+    text = registry.render()
+    assert 'stylebot_cache_hits_total{cache="photo"} 1.0' in text
+    assert 'stylebot_cache_misses_total{cache="photo"} 1.0' in text
+    assert 'stylebot_cache_hit_ratio{cache="photo"} 0.5' in text
+    assert "disabled" not in text
+
+
+def test_worker_pool_utilization():
+    """Занятость пула потоков движка видна в метриках."""
+    registry = Registry()
+    pool = WorkerPool(max_workers=1)
+    engine = type("Engine", (), {"executor": pool})()
+    register_executor_metrics({"nst": engine}, registry)
+
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+
+    try:
+        first = pool.submit(blocking)
+        second = pool.submit(lambda: None)
+        assert started.wait(5)
+        text = registry.render()
+        assert 'stylebot_executor_busy_workers{engine="nst"} 1.0' in text
+        assert 'stylebot_executor_queue_depth{engine="nst"} 1.0' in text
+        assert 'stylebot_executor_utilization{engine="nst"} 1.0' in text
+    finally:
+        release.set()
+        first.result(5)
+        second.result(5)
+        pool.shutdown()
+    assert pool.busy_workers == 0 and pool.queued == 0
+
+
+def test_track_request_records_outcome():
+    before_ok = JOBS_TOTAL.value(engine="test", outcome="ok")
+    before_error = JOBS_TOTAL.value(engine="test", outcome="error")
+
+    with track_request("test"):
+        pass
+    with pytest.raises(RuntimeError):
+        with track_request("test"):
+            raise RuntimeError("boom")
+
+    assert JOBS_TOTAL.value(engine="test", outcome="ok") == before_ok + 1
+    assert JOBS_TOTAL.value(engine="test", outcome="error") == before_error + 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    """Эндпоинт /metrics отдаёт метрики реестра."""
+    registry = Registry()
+    registry.gauge("up", "Up.").set(1)
+    app = web.Application()
+    setup_metrics(app, "/metrics", registry)
+
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    try:
+        resp = await client.get("/metrics")
+        assert resp.status == 200
+        assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert "up 1.0" in await resp.text()
+    finally:
+        await client.close()
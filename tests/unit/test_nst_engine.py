@@ -1,7 +1,11 @@
+import io
+
 import pytest
 import torch
+from PIL import Image
 from unittest import mock
 
+from app.image_encode import OutputEncoderConfig
 from app.nst_engine import NSTEngine
 from torchvision.models import vgg19
 
@@ -12,6 +16,14 @@ class DummyConfig:
     IMAGE_SIZE = 64
     IMAGE_SIZE_CPU = 64
     IMAGE_SIZE_CUDA = 128
+    MAX_INPUT_PIXELS = 40_000_000
+    OUTPUT_ENCODER = OutputEncoderConfig()
+    TENSOR_CACHE_MAX_BYTES = 16 * 1024 * 1024
+    TENSOR_CACHE_TTL = 1800
+    INIT_STRATEGY = "content"
+    INIT_NUM_STEPS = {"content": 1, "color_transfer": 1, "low_res": 1}
+    INIT_LOW_RES_SCALE = 0.5
+    INIT_LOW_RES_NUM_STEPS = 1
     MODEL_PATH = "dummy_model.pth"
     MODEL_TYPE = "shrunk_object"
     NORMALIZATION_MEAN = [0.485, 0.456, 0.406]
@@ -195,3 +207,117 @@ def test_load_model_unknown_type(engine_for_loading):
     with pytest.raises(RuntimeError) as excinfo:
         engine_for_loading._load_model()
     assert "Could not load any VGG19 model" in str(excinfo.value)
+
+
+@pytest.fixture
+def tiny_engine(config):
+    """Движок с маленькой CNN вместо VGG19 для проверки оптимизации."""
+    config.CONTENT_LAYERS = ["conv_2"]
+    config.STYLE_LAYERS = ["conv_1", "conv_2"]
+    config.NUM_STEPS = 1
+    config.STYLE_WEIGHT = 1000
+    config.CONTENT_WEIGHT = 1
+    engine = NSTEngine.__new__(NSTEngine)
+    engine.config = config
+    engine.device = torch.device("cpu")
+    engine.image_size = 16
+    torch.manual_seed(0)
+    engine.cnn_model = torch.nn.Sequential(
+        torch.nn.Conv2d(3, 4, 3, padding=1),
+        torch.nn.ReLU(inplace=True),
+        torch.nn.MaxPool2d(2),
+        torch.nn.Conv2d(4, 4, 3, padding=1),
+        torch.nn.ReLU(inplace=True),
+    )
+    engine.cnn_normalization_mean = torch.tensor(config.NORMALIZATION_MEAN)
+    engine.cnn_normalization_std = torch.tensor(config.NORMALIZATION_STD)
+    engine._initialized = True
+    return engine
+
+
+def _jpeg_bytes(color):
+    bio = io.BytesIO()
+    Image.new("RGB", (32, 32), color=color).save(bio, format="JPEG")
+    return bio.getvalue()
+
+
+def test_targets_match_layer_activations(tiny_engine):
+    """Цели потерь совпадают с активациями соответствующих слоев."""
+    image = torch.rand(1, 3, 16, 16)
+    _, style_losses, content_losses = tiny_engine._get_style_model_and_losses(
+        image, image
+    )
+
+    normalized = (image - tiny_engine.cnn_normalization_mean.view(-1, 1, 1)) / (
+        tiny_engine.cnn_normalization_std.view(-1, 1, 1)
+    )
+    conv_1 = tiny_engine.cnn_model[0](normalized)
+    conv_2 = tiny_engine.cnn_model[3](tiny_engine.cnn_model[2](torch.relu(conv_1)))
+
+    assert len(content_losses) == 1
+    assert torch.allclose(content_losses[0].target, conv_2)
+    assert len(style_losses) == 2
+    assert torch.allclose(style_losses[0].target, NSTEngine.gram_matrix(conv_1))
+
+
+def test_content_features_reused_for_same_photo(tiny_engine):
+    style = _jpeg_bytes((200, 20, 20))
+    content = _jpeg_bytes((20, 20, 200))
+
+    with mock.patch.object(
+        tiny_engine, "_image_loader", wraps=tiny_engine._image_loader
+    ) as loader:
+        first = tiny_engine.process_images(style, content, content_key="uniq")
+        second = tiny_engine.process_images(style, content, content_key="uniq")
+
+    # style twice, content only once
+    assert loader.call_count == 3
+    assert Image.open(io.BytesIO(first)).format == "JPEG"
+    assert Image.open(io.BytesIO(second)).size == (16, 16)
+
+
+def test_prepared_style_is_reused(tiny_engine):
+    """Стиль, подготовленный заранее, не обрабатывается повторно."""
+    style = _jpeg_bytes((200, 20, 20))
+    content = _jpeg_bytes((20, 20, 200))
+
+    tiny_engine.prepare_style(style, "style_uid")
+    with mock.patch.object(
+        tiny_engine, "_style_targets", wraps=tiny_engine._style_targets
+    ) as style_targets:
+        tiny_engine.process_images(style, content, style_key="style_uid")
+
+    style_targets.assert_not_called()
+
+
+def test_color_transfer_matches_style_statistics():
+    """Перенос цвета даёт контент со средним и разбросом каналов стиля."""
+    torch.manual_seed(0)
+    content = torch.rand(1, 3, 16, 16) * 0.5
+    style = torch.rand(1, 3, 16, 16) * 0.2 + 0.6
+
+    matched = NSTEngine._match_color_statistics(content, style)
+
+    assert torch.allclose(matched.mean(dim=(2, 3)), style.mean(dim=(2, 3)), atol=1e-3)
+    assert torch.allclose(matched.std(dim=(2, 3)), style.std(dim=(2, 3)), atol=1e-3)
+
+
+@pytest.mark.parametrize("strategy", ["content", "color_transfer", "low_res"])
+def test_init_strategy_sets_start_and_steps(tiny_engine, strategy):
+    """Стратегия инициализации задаёт начальное изображение и число шагов."""
+    tiny_engine.config.INIT_STRATEGY = strategy
+    tiny_engine.config.INIT_NUM_STEPS = {"content": 7, "color_transfer": 5, "low_res": 3}
+    content = torch.rand(1, 3, 16, 16)
+    style = torch.rand(1, 3, 16, 16)
+
+    start, num_steps = tiny_engine._initial_input(content, style)
+
+    assert start.shape == content.shape
+    assert num_steps == tiny_engine.config.INIT_NUM_STEPS[strategy]
+    assert torch.equal(start, content) == (strategy == "content")
+
+    with mock.patch.object(
+        tiny_engine, "_run_style_transfer_core", wraps=tiny_engine._run_style_transfer_core
+    ) as core:
+        tiny_engine.process_images(_jpeg_bytes((200, 20, 20)), _jpeg_bytes((20, 20, 200)))
+    assert core.call_args.kwargs["num_steps"] == num_steps
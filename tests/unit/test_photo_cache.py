@@ -0,0 +1,34 @@
+import torch
+
+from app.photo_cache import BoundedCache, cost_of
+
+
+def test_cost_of_values():
+    assert cost_of(b"abcd") == 4
+    assert cost_of(torch.zeros(2, 3)) == 24
+    assert cost_of((torch.zeros(2), {"a": torch.zeros(1)})) == 12
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = BoundedCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.get("a")
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.total_bytes == 8
+
+
+def test_oversized_value_not_cached():
+    cache = BoundedCache(max_bytes=3)
+    cache.put("a", b"aaaa")
+    assert len(cache) == 0
+
+
+def test_expired_entry_is_a_miss():
+    cache = BoundedCache(max_bytes=10, ttl=0)
+    cache.put("a", b"a")
+    assert cache.get("a") is None
+    assert cache.misses == 1
+    assert cache.total_bytes == 0
@@ -0,0 +1,51 @@
+import torch
+
+from app.profiling import ProfilerControl
+
+
+def _gram(size=32):
+    features = torch.rand(size, size)
+    return torch.mm(features, features.t())
+
+
+def test_capture_writes_trace_and_summary(tmp_path):
+    """Включённый профайлер сохраняет трассу и сводку по операциям."""
+    control = ProfilerControl(output_dir=str(tmp_path))
+    control.arm(["nst"], 1)
+
+    with control.capture("nst"):
+        _gram()
+    with control.capture("nst"):  # not armed anymore
+        _gram()
+
+    assert control.remaining("nst") == 0
+    assert len(control.captures) == 1
+    capture = control.captures[0]
+    assert capture.trace_path.name.endswith(".pt.trace.json")
+    assert capture.trace_path.exists()
+    assert "aten::mm" in capture.summary_path.read_text()
+    assert any(op == "aten::mm" for op, *_ in capture.top_ops)
+
+
+def test_capture_only_for_armed_engine(tmp_path):
+    control = ProfilerControl(output_dir=str(tmp_path))
+    control.arm(["cyclegan"], 2)
+
+    with control.capture("nst"):
+        _gram()
+
+    assert not control.captures
+    assert control.remaining("cyclegan") == 2
+
+
+def test_concurrent_job_is_not_captured(tmp_path):
+    """Пока профилируется одна задача, другая выполняется без профайлера."""
+    control = ProfilerControl(output_dir=str(tmp_path))
+    control.arm(["nst"], 2)
+
+    with control.capture("nst"):
+        with control.capture("nst"):
+            _gram()
+
+    assert len(control.captures) == 1
+    assert control.remaining("nst") == 1
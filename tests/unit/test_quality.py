@@ -0,0 +1,40 @@
+import numpy as np
+
+from benchmarks.engines import build_cyclegan_engine, build_nst_engine
+from benchmarks.quality import Mode, QualityMeter, evaluate, psnr, ssim
+from benchmarks.runner import synthetic_jpeg
+
+
+def test_psnr_and_ssim_of_identical_and_noisy_images():
+    """Одинаковые изображения дают максимум метрик, шум их снижает."""
+    rng = np.random.default_rng(0)
+    image = rng.random((32, 32, 3)).astype(np.float32)
+    noisy = np.clip(image + rng.normal(0, 0.1, image.shape), 0, 1).astype(np.float32)
+
+    assert psnr(image, image) == float("inf")
+    assert ssim(image, image) == 1.0
+    assert 15 < psnr(noisy, image) < 25
+    assert ssim(noisy, image) < 0.95
+
+
+def test_evaluate_flags_mode_that_changes_output():
+    """Режим, меняющий результат, не проходит порог, а совпадающий с эталоном проходит."""
+    nst_engine = build_nst_engine(weights="standin")
+    nst_engine.image_size = 32
+    cyclegan_engine = build_cyclegan_engine(weights="standin")
+    cyclegan_engine.config.IMAGE_SIZE = 32
+    contents = [("photo", synthetic_jpeg(64, 0))]
+
+    modes = [
+        Mode("same", "cyclegan"),
+        # bf16 rounding always changes some pixels
+        Mode("bf16", "cyclegan", precision="bf16", thresholds={"min_psnr": 1000.0}),
+    ]
+    report = evaluate(
+        {"cyclegan": cyclegan_engine}, QualityMeter(nst_engine), contents, [], modes
+    )
+
+    by_mode = {entry["mode"]: entry for entry in report["modes"]}
+    assert by_mode["same"]["worst"]["psnr"] == float("inf")
+    assert by_mode["same"]["worst"]["perceptual"] == 0.0
+    assert [(f["mode"], f["metric"]) for f in report["failures"]] == [("bf16", "psnr")]
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app.result_cache import ResultCache
+
+
+def test_lru_bound():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", "file_a")
+    cache.put("b", "file_b")
+    cache.get("a")
+    cache.put("c", "file_c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "file_a"
+    assert len(cache) == 2
+
+
+def test_ttl_expiry():
+    cache = ResultCache(ttl=0)
+    cache.put("a", "file_a")
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_run_returns_cached_file_id():
+    cache = ResultCache()
+    calls = 0
+
+    async def produce():
+        nonlocal calls
+        calls += 1
+        return "file_a"
+
+    assert await cache.run("key", 1, produce) is None
+    assert await cache.run("key", 2, produce) == "file_a"
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_run_once():
+    """Одинаковые одновременные запросы выполняются один раз."""
+    cache = ResultCache()
+    started = asyncio.Event()
+    release = asyncio.Event()
+    calls = 0
+
+    async def produce():
+        nonlocal calls
+        calls += 1
+        started.set()
+        await release.wait()
+        return "file_a"
+
+    leader = asyncio.create_task(cache.run("key", 1, produce))
+    await started.wait()
+    other_chat = asyncio.create_task(cache.run("key", 2, produce))
+    same_chat = asyncio.create_task(cache.run("key", 1, produce))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await leader is None
+    assert await other_chat == "file_a"
+    # A double tap in the same chat must not get the photo twice
+    assert await same_chat is None
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_failure_propagates_to_waiters_and_is_not_cached():
+    cache = ResultCache()
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("boom")
+
+    leader = asyncio.create_task(cache.run("key", 1, failing))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.run("key", 2, failing))
+    await asyncio.sleep(0)
+    release.set()
+
+    with pytest.raises(RuntimeError):
+        await leader
+    with pytest.raises(RuntimeError):
+        await waiter
+    assert cache.get("key") is None
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from app.sampling_profiler import StackSampler
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_samples_busy_thread_and_skips_idle(tmp_path):
+    """Стеки занятого потока пула попадают в файл, ожидающий поток - нет."""
+    sampler = StackSampler(output_dir=str(tmp_path))
+    stop = threading.Event()
+    busy = threading.Thread(target=_busy_loop, args=(stop,), name="nst-worker_0")
+    idle = threading.Thread(target=stop.wait, name="idle-thread")
+    busy.start()
+    idle.start()
+    try:
+        for _ in range(20):
+            sampler.sample()
+            time.sleep(0.001)
+    finally:
+        stop.set()
+        busy.join()
+        idle.join()
+
+    path = sampler.flush()
+    lines = path.read_text().splitlines()
+    busy_lines = [line for line in lines if line.startswith("nst-worker;")]
+    assert busy_lines
+    assert any("_busy_loop_(test_sampling_profiler.py)" in line for line in busy_lines)
+    assert not any(line.startswith("idle-thread;") for line in lines)
+    stack, count = busy_lines[0].rsplit(" ", 1)
+    assert int(count) >= 1
+    assert sampler.flush() is None  # counts were reset
+
+
+def test_old_files_are_rotated(tmp_path):
+    sampler = StackSampler(output_dir=str(tmp_path), max_files=2)
+    for i in range(4):
+        (tmp_path / f"stacks-2020010{i}-000000.collapsed").write_text("a 1\n")
+    sampler._counts["MainThread;main_(x.py)"] = 1
+    newest = sampler.flush()
+
+    files = sorted(tmp_path.glob("stacks-*.collapsed"))
+    assert len(files) == 2
+    assert newest in files
+
+
+def test_start_and_stop_write_collected_stacks(tmp_path):
+    """Фоновый поток снимает стеки и сбрасывает их при остановке."""
+    sampler = StackSampler(output_dir=str(tmp_path), interval=0.005, skip_idle=False)
+    sampler.start()
+    time.sleep(0.1)
+    path = sampler.stop()
+
+    assert sampler.samples > 0
+    assert path is not None and "MainThread;" in path.read_text()
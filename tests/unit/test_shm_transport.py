@@ -0,0 +1,76 @@
+import multiprocessing
+
+import pytest
+
+from app.shm_transport import BufferDescriptor, SharedBufferPool, attach_buffer
+
+
+@pytest.fixture
+def pool():
+    p = SharedBufferPool()
+    yield p
+    p.close()
+
+
+def _read_in_child(descriptor_dict, queue):
+    with attach_buffer(BufferDescriptor.from_dict(descriptor_dict)) as view:
+        queue.put(bytes(view))
+
+
+def test_put_and_attach_roundtrip(pool):
+    descriptor = pool.put(b"image-bytes")
+
+    assert descriptor.size == len(b"image-bytes")
+    with attach_buffer(descriptor) as view:
+        assert bytes(view) == b"image-bytes"
+        assert view.readonly
+
+
+def test_descriptor_dict_roundtrip():
+    descriptor = BufferDescriptor(name="dlsbot_abc", size=10)
+    assert BufferDescriptor.from_dict(descriptor.to_dict()) == descriptor
+
+
+def test_allocate_allows_in_place_write(pool):
+    descriptor, view = pool.allocate(4)
+    view[:] = b"abcd"
+    view.release()
+
+    assert bytes(pool.get(descriptor)) == b"abcd"
+
+
+def test_release_unlinks_after_last_reference(pool):
+    descriptor = pool.put(b"x" * 128)
+    pool.acquire(descriptor)
+    assert pool.refcount(descriptor) == 2
+
+    pool.release(descriptor)
+    assert len(pool) == 1
+
+    pool.release(descriptor)
+    assert len(pool) == 0
+    with pytest.raises(FileNotFoundError):
+        with attach_buffer(descriptor):
+            pass
+
+
+def test_allocate_rejects_empty_buffer(pool):
+    with pytest.raises(ValueError):
+        pool.allocate(0)
+
+
+def test_child_process_reads_segment(pool):
+    """Дочерний процесс получает только дескриптор и читает данные напрямую."""
+    payload = bytes(range(256)) * 64
+    descriptor = pool.put(payload)
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_read_in_child, args=(descriptor.to_dict(), queue))
+    proc.start()
+    received = queue.get(timeout=30)
+    proc.join(timeout=30)
+
+    assert received == payload
+    # The child must not unlink the segment owned by the pool.
+    assert bytes(pool.get(descriptor)) == payload
@@ -0,0 +1,216 @@
+import threading
+
+import pytest
+import torch
+
+from app.engines import SCHEDULE_DEADLINE, SCHEDULE_SJF, WorkerPool
+from app.timing import DurationModel, TimingStore, current_precision
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = TimingStore(tmp_path / "timings.sqlite3")
+    yield s
+    s.close()
+
+
+def _record_nst(model, seconds_per_mp_step=2.0, overhead=1.0, style="custom"):
+    for size in (128, 256, 384):
+        for steps in (50, 100):
+            seconds = overhead + seconds_per_mp_step * size * size / 1e6 * steps
+            model.record("nst", style, size, "fp32", steps, seconds)
+
+
+def test_store_keeps_newest_rows_per_engine(tmp_path):
+    store = TimingStore(tmp_path / "timings.sqlite3", max_rows=3)
+    try:
+        for i in range(5):
+            store.add("nst", "custom", 256, "fp32", 100, float(i))
+        store.add("cyclegan", "monet", 256, "fp32", 1, 0.5)
+
+        assert [row["seconds"] for row in store.samples("nst", "fp32")] == [2.0, 3.0, 4.0]
+        assert len(store.samples("cyclegan", "fp32")) == 1
+        assert store.samples("nst", "bf16") == []
+    finally:
+        store.close()
+
+
+def test_model_needs_history_before_predicting(store):
+    model = DurationModel(store, min_samples=3)
+    assert model.predict("nst", 256, steps=100) is None
+
+    model.record("nst", "custom", 256, "fp32", 100, 12.0)
+    model.record("nst", "custom", 256, "fp32", 100, 14.0)
+    assert model.predict("nst", 256, steps=100) is None
+
+    model.record("nst", "custom", 256, "fp32", 100, 13.0)
+    # Одна и та же конфигурация: предсказание - медиана, масштабируемая по работе
+    assert model.predict("nst", 256, steps=100) == pytest.approx(13.0)
+    assert model.predict("nst", 256, steps=200) == pytest.approx(26.0)
+    assert model.predict("nst", None) is None
+
+
+def test_model_fits_size_and_steps(store):
+    model = DurationModel(store, min_samples=3)
+    _record_nst(model)
+
+    expected = 1.0 + 2.0 * 512 * 512 / 1e6 * 150
+    assert model.predict("nst", 512, steps=150) == pytest.approx(expected, rel=1e-6)
+    # Другие точность и движок - своя история
+    assert model.predict("nst", 512, steps=150, precision="bf16") is None
+    assert model.predict("cyclegan", 512) is None
+
+
+def test_model_prefers_style_history(store):
+    model = DurationModel(store, min_samples=3, refit_every=1)
+    _record_nst(model, seconds_per_mp_step=2.0, style="custom")
+    _record_nst(model, seconds_per_mp_step=4.0, style="default:starry.jpg")
+
+    slow = model.predict("nst", 256, steps=100, style="default:starry.jpg")
+    fast = model.predict("nst", 256, steps=100, style="custom")
+    unknown = model.predict("nst", 256, steps=100, style="default:other.jpg")
+    assert fast < unknown < slow
+    assert slow == pytest.approx(1.0 + 4.0 * 256 * 256 / 1e6 * 100, rel=1e-6)
+
+
+def test_model_refits_after_new_samples(store):
+    model = DurationModel(store, min_samples=3, refit_every=3)
+    for _ in range(3):
+        model.record("cyclegan", "monet", 256, "fp32", 1, 1.0)
+    assert model.predict("cyclegan", 256, style="monet") == pytest.approx(1.0)
+
+    for _ in range(2):
+        model.record("cyclegan", "monet", 256, "fp32", 1, 4.0)
+    assert model.predict("cyclegan", 256, style="monet") == pytest.approx(1.0)
+
+    model.record("cyclegan", "monet", 256, "fp32", 1, 4.0)
+    assert model.predict("cyclegan", 256, style="monet") == pytest.approx(2.5)
+
+
+def test_predict_reads_only_cached_fits(store, monkeypatch):
+    """Предсказание не обращается к SQLite: его вызывают прямо из event loop."""
+    model = DurationModel(store, min_samples=3)
+    _record_nst(model)
+
+    def no_queries(*args):
+        raise AssertionError("predict must not read the store")
+
+    monkeypatch.setattr(store, "samples", no_queries)
+    assert model.predict("nst", 256, steps=100) is not None
+    assert model.predict("cyclegan", 256) is None
+
+
+def test_load_fits_stored_history(store):
+    """После перезапуска история из хранилища подгружается заранее, в load()."""
+    _record_nst(DurationModel(store, min_samples=3))
+    store.add("cyclegan", "monet", 256, "fp32", 1, 2.0)
+
+    restarted = DurationModel(store, min_samples=1)
+    assert restarted.predict("nst", 256, steps=100) is None
+    restarted.load("nst")
+    expected = 1.0 + 2.0 * 256 * 256 / 1e6 * 100
+    assert restarted.predict("nst", 256, steps=100) == pytest.approx(expected)
+    assert restarted.predict("cyclegan", 256) is None
+    restarted.load()
+    assert restarted.predict("cyclegan", 256) == pytest.approx(2.0)
+
+
+def test_current_precision_follows_autocast():
+    assert current_precision("cpu") == "fp32"
+    with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+        assert current_precision("cpu") == "bf16"
+        assert current_precision(torch.device("cpu")) == "bf16"
+
+
+def _run_order(policy, jobs, **pool_kwargs):
+    """Порядок выполнения задач (имя, предсказание), поставленных за занятым потоком."""
+    pool = WorkerPool(max_workers=1, policy=policy, **pool_kwargs)
+    started, release = threading.Event(), threading.Event()
+    order = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    try:
+        first = pool.submit(blocker)
+        assert started.wait(5)
+        futures = [
+            pool.submit_job(lambda name=name: order.append(name), predicted)
+            for name, predicted in jobs
+        ]
+        release.set()
+        first.result(5)
+        for future in futures:
+            future.result(5)
+    finally:
+        release.set()
+        pool.shutdown()
+    assert pool.queued == 0 and pool.busy_workers == 0
+    return order
+
+
+def test_fifo_keeps_arrival_order():
+    jobs = [("long", 60.0), ("short", 5.0), ("unknown", None)]
+    assert _run_order("fifo", jobs) == ["long", "short", "unknown"]
+
+
+def test_sjf_runs_shortest_predicted_first():
+    jobs = [("long", 60.0), ("short", 5.0), ("medium", 20.0)]
+    assert _run_order(SCHEDULE_SJF, jobs) == ["short", "medium", "long"]
+
+
+def test_sjf_serves_jobs_past_max_wait_first():
+    jobs = [("long", 60.0), ("short", 5.0)]
+    # Обе задачи ждут дольше max_wait: дальше строго по очереди
+    assert _run_order(SCHEDULE_SJF, jobs, max_wait=0.0) == ["long", "short"]
+
+
+def test_deadline_orders_by_arrival_plus_predicted():
+    jobs = [("long", 60.0), ("short", 5.0), ("medium", 20.0)]
+    assert _run_order(SCHEDULE_DEADLINE, jobs) == ["short", "medium", "long"]
+
+
+def test_expected_wait_counts_jobs_ahead():
+    pool = WorkerPool(max_workers=1, policy=SCHEDULE_SJF)
+    started, release = threading.Event(), threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    try:
+        assert pool.expected_wait(10.0) == 0.0
+        running = pool.submit_job(blocker, 30.0)
+        assert started.wait(5)
+        queued = pool.submit_job(lambda: None, 20.0)
+
+        # Текущая задача (~30 с) плюс более короткие из очереди
+        assert pool.expected_wait(10.0) == pytest.approx(30.0, abs=1.0)
+        assert pool.expected_wait(40.0) == pytest.approx(50.0, abs=1.0)
+    finally:
+        release.set()
+        running.result(5)
+        queued.result(5)
+        pool.shutdown()
+
+
+def test_shutdown_cancels_queued_jobs():
+    pool = WorkerPool(max_workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    running = pool.submit(blocker)
+    assert started.wait(5)
+    queued = pool.submit(lambda: None)
+
+    pool.shutdown(wait=False, cancel_futures=True)
+    release.set()
+    running.result(5)
+    assert queued.cancelled()
+    assert pool.queued == 0
+    with pytest.raises(RuntimeError):
+        pool.submit(lambda: None)
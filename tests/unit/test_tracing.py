@@ -0,0 +1,130 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aiogram.types import Update
+
+from app.handlers.utils import run_engine_call
+from app.tracing import (
+    Tracer,
+    TracingMiddleware,
+    configure_tracing,
+    parse_traceparent,
+    span,
+    traceparent,
+)
+
+
+def test_span_without_trace_is_noop():
+    with span("decode") as current:
+        current.set_attribute("bytes", 1)
+    assert traceparent() is None
+
+
+def test_trace_logs_json_with_nested_spans(caplog):
+    """Завершённая трасса пишется в лог одной JSON-строкой с этапами."""
+    tracer = Tracer()
+    with caplog.at_level(logging.INFO, logger="app.tracing"):
+        with tracer.trace("update", update_id=7) as current:
+            with span("download") as download:
+                download.set_attribute("bytes", 10)
+            with pytest.raises(ValueError):
+                with span("inference"):
+                    raise ValueError("bad image")
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["request_id"] == current.request_id
+    assert [s["name"] for s in record["spans"]] == ["download", "inference"]
+    assert record["spans"][0]["bytes"] == 10
+    assert record["spans"][1]["error"] == "ValueError: bad image"
+
+    root, download, inference = current.spans
+    assert download.parent_id == root.span_id
+    assert inference.parent_id == root.span_id
+
+
+def test_slow_threshold_skips_fast_traces(caplog):
+    tracer = Tracer(slow_threshold=60)
+    with caplog.at_level(logging.INFO, logger="app.tracing"):
+        with tracer.trace("update"):
+            pass
+    assert not caplog.records
+
+
+def test_otlp_export(tmp_path):
+    """Трассы дописываются в файл в формате OTLP/JSON."""
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(service_name="test", export_path=str(path))
+    with tracer.trace("update") as current:
+        with span("encode", quality=90):
+            pass
+
+    record = json.loads(path.read_text().splitlines()[0])
+    resource_spans = record["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"][0]["value"] == {"stringValue": "test"}
+    spans = resource_spans["scopeSpans"][0]["spans"]
+    assert {s["traceId"] for s in spans} == {current.trace_id}
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert spans[1]["attributes"] == [{"key": "quality", "value": {"intValue": "90"}}]
+
+
+def test_traceparent_roundtrip():
+    tracer = Tracer()
+    with tracer.trace("update") as current:
+        with span("inference") as inner:
+            header = traceparent()
+    assert parse_traceparent(header) == (current.trace_id, inner.span_id)
+    assert parse_traceparent("garbage") == (None, None)
+
+
+@pytest.mark.asyncio
+async def test_engine_spans_recorded_from_worker_thread():
+    """Этапы, выполняемые в пуле потоков движка, попадают в трассу запроса."""
+
+    class Engine:
+        def __init__(self):
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+        def process(self):
+            with span("optimize"):
+                return "done"
+
+    engine = Engine()
+    tracer = Tracer()
+    try:
+        with tracer.trace("update") as current:
+            assert await run_engine_call(engine.process) == "done"
+    finally:
+        engine.executor.shutdown()
+
+    assert [s.name for s in current.spans] == ["update", "optimize"]
+    assert current.spans[1].parent_id == current.spans[0].span_id
+
+
+@pytest.mark.asyncio
+async def test_middleware_passes_request_id(monkeypatch):
+    """Middleware создаёт request_id и передаёт его обработчику."""
+    monkeypatch.setattr("app.tracing._tracer", None)
+    configure_tracing()
+    seen = {}
+
+    async def handler(event, data):
+        seen["request_id"] = data["request_id"]
+        with span("send"):
+            pass
+        return "ok"
+
+    update = Update.model_validate(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": 1, "type": "private"},
+                "text": "/start",
+            },
+        }
+    )
+    assert await TracingMiddleware()(handler, update, {}) == "ok"
+    assert len(seen["request_id"]) == 32
@@ -1,5 +1,20 @@
+import sqlite3
+import threading
 import time
-from app.handlers.utils import format_duration
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aiogram.types import PhotoSize
+
+from app.engines import SCHEDULE_SJF, WorkerPool
+from app.handlers.utils import (
+    estimate_job,
+    format_duration,
+    format_eta,
+    run_engine_call,
+    select_photo_size,
+    update_job,
+)
 
 
 def test_format_duration_seconds(monkeypatch):
@@ -28,3 +43,103 @@ def test_format_duration_zero_seconds(monkeypatch):
     # Simulate time.monotonic() returns 200.0 (0 seconds later)
     monkeypatch.setattr(time, "monotonic", lambda: 200.0)
     assert format_duration(fake_start) == "0 сек."
+
+
+def _photo(side_w, side_h):
+    return PhotoSize(
+        file_id=f"{side_w}x{side_h}",
+        file_unique_id=f"u{side_w}x{side_h}",
+        width=side_w,
+        height=side_h,
+    )
+
+
+PHOTO_SIZES = [_photo(90, 60), _photo(320, 213), _photo(800, 533), _photo(1280, 853)]
+
+
+def test_select_photo_size_smallest_covering():
+    # 320x213 is too small for 256 on the shorter side, 800x533 covers it
+    assert select_photo_size(PHOTO_SIZES, 256).file_id == "800x533"
+
+
+def test_select_photo_size_falls_back_to_largest():
+    assert select_photo_size(PHOTO_SIZES, 2000).file_id == "1280x853"
+
+
+def test_select_photo_size_unknown_working_size():
+    assert select_photo_size(PHOTO_SIZES, None).file_id == "1280x853"
+
+
+@pytest.mark.asyncio
+async def test_run_engine_call_uses_engine_worker_pool():
+    class Engine:
+        def __init__(self):
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="test-engine"
+            )
+
+        def work(self, value):
+            return value, threading.current_thread().name
+
+    engine = Engine()
+    result, thread_name = await run_engine_call(engine.work, 42)
+    engine.executor.shutdown()
+
+    assert result == 42
+    assert thread_name.startswith("test-engine")
+
+
+@pytest.mark.asyncio
+async def test_run_engine_call_passes_prediction_to_scheduler():
+    class Engine:
+        def __init__(self):
+            self.executor = WorkerPool(max_workers=1, policy=SCHEDULE_SJF)
+            self.submitted = []
+            submit_job = self.executor.submit_job
+
+            def recording_submit_job(fn, predicted_seconds=None):
+                self.submitted.append(predicted_seconds)
+                return submit_job(fn, predicted_seconds)
+
+            self.executor.submit_job = recording_submit_job
+
+        def work(self, value):
+            return value
+
+    engine = Engine()
+    assert await run_engine_call(engine.work, 7, predicted_seconds=12.5) == 7
+    engine.executor.shutdown()
+
+    assert engine.submitted == [12.5]
+
+
+def test_estimate_job_adds_queue_wait():
+    class Engine:
+        executor = type("Pool", (), {"expected_wait": lambda self, predicted: 30.0})()
+
+        def predict_duration(self, style=None):
+            return 12.0 if style == "monet" else None
+
+    assert estimate_job(Engine(), "monet") == (12.0, 42.0)
+    assert estimate_job(Engine(), "other") == (None, None)
+    # Удаленные движки не предсказывают время
+    assert estimate_job(object()) == (None, None)
+
+
+def test_format_eta_rounds_up():
+    assert format_eta(0.4) == "~5 сек."
+    assert format_eta(41) == "~45 сек."
+    assert format_eta(60) == "~1 мин."
+    assert format_eta(121) == "~3 мин."
+
+
+@pytest.mark.asyncio
+async def test_update_job_logs_store_errors(caplog):
+    """Ошибка записи статуса задачи не прерывает обработку запроса."""
+
+    def mark_done(job_id):
+        raise sqlite3.OperationalError("database is locked")
+
+    await update_job(mark_done, "job-1")
+
+    assert "Failed to update job job-1 (mark_done)" in caplog.text